@@ -0,0 +1,174 @@
+#batch_score.py //Non-interactive scoring of many wallets in one process.
+#One saved model and one fraud wallet set are shared by every wallet; wallets are synced
+#concurrently into transactions2.db and their transactions are predicted in large batches.
+#Usage: python batch_score.py wallets.txt --method a//
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import main
+import model_store
+import populate_single_wallet
+import profiling
+import transaction_data_pipeline
+import transaction_store
+import wallet_sync
+import wallet_features
+import concurrent_fetcher
+import fraud_wallet_list
+import fraud_proximity
+
+results_dir = 'Results'
+
+
+def read_addresses(path):
+    """Read one address per line, ignoring blank lines, '#' comments and repeats."""
+    addresses = []
+    seen = set()
+    with open(path) as file:
+        for line in file:
+            address = transaction_data_pipeline.normalize_address(line.split('#')[0])
+            if address and address not in seen:
+                seen.add(address)
+                addresses.append(address)
+    return addresses
+
+
+def sync_wallets(wallets, chunk_size=1000, max_workers=8):
+    """Bring every wallet in transactions2.db up to date, fetching them concurrently.
+
+    Returns the wallets that could not be synced completely.
+    """
+    database = populate_single_wallet.database
+    store = transaction_store.get_store(database)
+
+    end_block = populate_single_wallet.get_current_block()
+    if end_block is None:
+        raise RuntimeError("Could not determine the current block number")
+
+    # Known wallets only need the blocks after their last sync
+    start_blocks = {}
+    for wallet in wallets:
+        last_synced_block = wallet_sync.get_last_synced_block(database, wallet)
+        start_blocks[wallet] = 0 if last_synced_block is None else last_synced_block + 1
+
+    failed = []
+    for wallet, transactions, errors in concurrent_fetcher.fetch_wallets(wallets, 0, end_block, chunk_size,
+                                                                          max_workers, start_blocks):
+        store.save(transactions)
+        for error in errors:
+            populate_single_wallet.log_error(wallet, error)
+        if errors:
+            failed.append(wallet)
+        else:
+            wallet_sync.set_last_synced_block(database, wallet, wallet_sync.synced_block(end_block))
+        wallet_sync.refresh_confirmations(database, wallet, end_block)
+    return failed
+
+
+def load_wallet_transactions(wallets):
+    """Load the transactions of all wallets in one query, with a `wallet` column saying whose they are."""
+    conn = transaction_store.get_store(populate_single_wallet.database).conn
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS BatchWallets (address TEXT PRIMARY KEY)")
+    with conn:
+        conn.execute("DELETE FROM temp.BatchWallets")
+        conn.executemany("INSERT OR IGNORE INTO temp.BatchWallets (address) VALUES (?)", [(wallet,) for wallet in wallets])
+
+    query = """
+        SELECT w.address AS wallet, t.* FROM temp.BatchWallets w JOIN Transactions t ON t.fromAddress = w.address
+        UNION
+        SELECT w.address AS wallet, t.* FROM temp.BatchWallets w JOIN Transactions t ON t.toAddress = w.address
+    """
+    return pd.read_sql_query(query, conn)
+
+
+def predict(artifact, transactions_df, fraud_wallets, batch_size=100000):
+    """Predict labels for every row, batch_size rows at a time, then apply the fraud wallet override."""
+    with profiling.stage('fraud_cross_check') as stage:
+        fraud_wallet_list.flag_fraud_columns(transactions_df, fraud_wallets)
+        stage.rows = len(transactions_df)
+    if fraud_proximity.uses_graph_features(artifact['feature_columns']):
+        with profiling.stage('graph_features', memory=True):
+            main.add_graph_features(transactions_df, fraud_wallets, artifact.get('graph_databases'))
+    if wallet_features.uses_wallet_features(artifact['feature_columns']):
+        with profiling.stage('wallet_features'):
+            wallet_features.add_features(transactions_df, populate_single_wallet.database)
+    is_fraud = (transactions_df['is_from_fraud_wallet'] == 1).to_numpy() | (transactions_df['is_to_fraud_wallet'] == 1).to_numpy()
+
+    features = transactions_df[artifact['feature_columns']]
+    labels = np.empty(len(transactions_df), dtype=object)
+    for start in range(0, len(transactions_df), batch_size):
+        with profiling.stage('predict') as stage:
+            batch = features.iloc[start:start + batch_size]
+            labels[start:start + batch_size] = model_store.predict(artifact, batch)
+            stage.rows = len(batch)
+
+    # Transactions touching a known fraud wallet are always red, as in main.score
+    labels[is_fraud] = 'red'
+    return labels
+
+
+def batch_score(addresses_path, method, output=None, max_workers=8, batch_size=100000):
+    start_time = time.time()
+    wallets = read_addresses(addresses_path)
+    print(f"Scoring {len(wallets)} wallets with method '{method}'")
+
+    # Loaded once and shared by every wallet
+    with profiling.stage('load_model'):
+        artifact = main.load_or_train(method)
+    fraud_wallets = fraud_wallet_list.get_fraud_wallet_list('Database/fraud_wallets.db')
+
+    populate_single_wallet.ensure_transactions_table_exists()
+    fetch_start = time.time()
+    with profiling.stage('sync_wallets'):
+        failed = sync_wallets(wallets, max_workers=max_workers)
+    fetch_time = time.time() - fetch_start
+    if failed:
+        print(f"{len(failed)} wallets could not be synced completely and are scored on partial data: {', '.join(failed)}")
+
+    score_start = time.time()
+    with profiling.stage('load_transactions') as stage:
+        transactions_df = load_wallet_transactions(wallets)
+        stage.rows = len(transactions_df)
+    transactions_df['predicted_label'] = predict(artifact, transactions_df, fraud_wallets, batch_size)
+    score_time = time.time() - score_start
+
+    if output is None:
+        if not os.path.exists(results_dir):
+            os.makedirs(results_dir)
+        output = os.path.join(results_dir, f"batch_{time.strftime('%Y%m%d_%H%M%S')}.csv")
+    with profiling.stage('write_csv') as stage:
+        columnar.write_results(transactions_df[['wallet', 'hash', 'fromAddress', 'toAddress', 'predicted_label']], output)
+        stage.rows = len(transactions_df)
+
+    label_counts = transactions_df['predicted_label'].value_counts()
+    total_time = time.time() - start_time
+    print(f"Total transactions scored: {len(transactions_df)}")
+    print(f"Red transactions: {label_counts.get('red', 0)}")
+    print(f"Orange transactions: {label_counts.get('orange', 0)}")
+    print(f"Green transactions: {label_counts.get('green', 0)}")
+    print(f"Results saved to {output}")
+    print(f"Fetch: {fetch_time:.1f}s, scoring: {score_time:.1f}s, total: {total_time:.1f}s")
+    print(f"Throughput: {len(wallets) / total_time * 60:.1f} wallets per minute")
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score every wallet listed in a file with the saved model.")
+    parser.add_argument('addresses', help="File with one wallet address per line")
+    parser.add_argument('--method', choices=['a', 'b', 'c'], default='a', help="Training method of the model to use")
+    parser.add_argument('--output', help="CSV, or .parquet file, to write (default: Results/batch_<timestamp>.csv)")
+    parser.add_argument('--workers', type=int, default=8, help="Number of fetch threads")
+    parser.add_argument('--batch-size', type=int, default=100000, help="Rows per prediction batch")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    batch_score(args.addresses, args.method, args.output, args.workers, args.batch_size)
+    profiling.finish(args.profile)
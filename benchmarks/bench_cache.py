@@ -0,0 +1,56 @@
+#bench_cache.py //Runs the same wallet download three times against the local mock API: with an empty
+#response cache, with a warm cache, and offline after the server has been shut down.
+#Run from the repository root: python -m benchmarks.bench_cache//
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+os.environ.setdefault('POLYSCAN_API_KEY', 'mock')
+
+import concurrent_fetcher
+import polygonscan_client
+from benchmarks.mock_polygonscan import make_dense_wallet_chain, start_mock_server
+
+
+def run(label, wallet, end_block, chunk_size):
+    requests_before = polygonscan_client.request_count()
+    start_time = time.time()
+    transactions, error = concurrent_fetcher.fetch_block_range(wallet, 0, end_block, chunk_size)
+    elapsed = time.time() - start_time
+    summary = polygonscan_client.get_cache().summary()
+    print(f"{label:<8} {elapsed:8.2f}s  {len(transactions):7d} txs  "
+          f"{polygonscan_client.request_count() - requests_before:5d} requests  "
+          f"{summary['entries']:5d} cached ({summary['permanent']} permanent)  {error or ''}")
+    return {tx['hash'] for tx in transactions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=30000)
+    parser.add_argument('--latency', type=float, default=0.3, help="Simulated server latency in seconds")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    wallet, chain = make_dense_wallet_chain(transactions=args.transactions)
+    server = start_mock_server(chain, latency=args.latency)
+    polygonscan_client.api_url = server.url
+    polygonscan_client.set_rate_limit(1000)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        polygonscan_client.cache_path = os.path.join(tmp, 'cache.db')
+        cold = run('cold', wallet, 99999999, args.chunk_size)
+        warm = run('warm', wallet, 99999999, args.chunk_size)
+        server.shutdown()
+        server.server_close()
+        polygonscan_client.offline = True
+        replay = run('offline', wallet, 99999999, args.chunk_size)
+        polygonscan_client.get_cache().close()
+    print("Results identical" if cold == warm == replay else "Results differ")
+
+
+if __name__ == "__main__":
+    main()
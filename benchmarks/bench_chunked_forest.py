@@ -0,0 +1,96 @@
+#bench_chunked_forest.py //Peak memory, time and accuracy of training the method a RandomForest in
+#memory (train_test_split and fit, as main.train does) and out of core with chunked_forest, on
+#synthetic datasets built by dataset_builder. Each training runs in a fresh process so its peak
+#RSS is its own; both use the same stratified test rows.
+#Run from the repository root: python -m benchmarks.bench_chunked_forest --sizes 1M 10M//
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn import metrics
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+
+import chunked_forest
+import dataset_builder
+import memory_usage
+from benchmarks import synthetic
+
+# Same columns as main.train for method a
+feature_columns = ['gasUsed', 'value', 'confirmations', 'nonce', 'txreceipt_status', 'gasPrice', 'cumulativeGasUsed',
+                   'fromAddress', 'toAddress']
+
+
+def train_in_memory(output_dir, trees, jobs):
+    start = time.perf_counter()
+    with memory_usage.PeakRSSMonitor() as monitor:
+        dataset = dataset_builder.load_dataset(output_dir)
+        X_train, X_test, y_train, y_test = train_test_split(dataset.data, dataset.target, random_state=1,
+                                                            test_size=0.3, stratify=dataset.target)
+        clf = RandomForestClassifier(n_estimators=trees, random_state=42, n_jobs=jobs).fit(X_train, y_train)
+        y_pred = clf.predict(X_test)
+    return summary(clf, y_test, y_pred, monitor, start)
+
+
+def train_chunked(output_dir, trees, jobs, chunk_rows):
+    start = time.perf_counter()
+    with memory_usage.PeakRSSMonitor() as monitor:
+        dataset = dataset_builder.load_dataset(output_dir, decode_target=False)
+        train_rows, test_rows = chunked_forest.split(dataset.target)
+        clf = chunked_forest.fit(dataset.data, dataset.target, dataset.target_names, train_rows, trees, chunk_rows,
+                                 n_jobs=jobs)
+        y_pred = chunked_forest.predict(clf, dataset.data, test_rows, chunk_rows)
+    y_test = np.asarray(dataset.target_names)[dataset.target[test_rows]]
+    return summary(clf, y_test, y_pred, monitor, start)
+
+
+def summary(clf, y_test, y_pred, monitor, start):
+    return {'seconds': time.perf_counter() - start, 'accuracy': metrics.accuracy_score(y_test, y_pred),
+            'peak': monitor.peak, 'increase': monitor.peak - monitor.start,
+            'nodes': sum(tree.tree_.node_count for tree in clf.estimators_)}
+
+
+def in_fresh_process(function, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(function, *args).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', nargs='+', default=['1M', '10M'])
+    parser.add_argument('--trees', type=int, default=20)
+    parser.add_argument('--chunk-rows', type=int, default=250000)
+    parser.add_argument('--jobs', type=int, default=-1)
+    parser.add_argument('--skip-in-memory', action='store_true', help="Only train out of core, e.g. when the baseline won't fit")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'training':<10} {'seconds':>9} {'peak RSS':>10} {'increase':>10} {'accuracy':>9} {'nodes':>10}")
+    for size in args.sizes:
+        rows = synthetic.parse_size(size)
+        with tempfile.TemporaryDirectory() as tmp:
+            database = os.path.join(tmp, 'transactions.db')
+            fraud_database = os.path.join(tmp, 'fraud_wallets.db')
+            table = synthetic.SyntheticTable(rows, seed=args.seed)
+            synthetic.write_database(table, database)
+            synthetic.write_fraud_wallets(table.fraud_wallets(), fraud_database)
+            output_dir = os.path.join(tmp, 'dataset')
+            dataset_builder.build_dataset(database, feature_columns, 'a', output_dir, fraud_wallets_path=fraud_database)
+            os.remove(database)
+
+            runs = [('chunked', train_chunked, (output_dir, args.trees, args.jobs, args.chunk_rows))]
+            if not args.skip_in_memory:
+                runs.insert(0, ('in memory', train_in_memory, (output_dir, args.trees, args.jobs)))
+            for name, function, function_args in runs:
+                result = in_fresh_process(function, *function_args)
+                print(f"{rows:>10} {name:<10} {result['seconds']:>9.1f} {memory_usage.format_bytes(result['peak']):>10} "
+                      f"{memory_usage.format_bytes(result['increase']):>10} {result['accuracy']:>9.4f} {result['nodes']:>10}")
+
+
+if __name__ == "__main__":
+    main()
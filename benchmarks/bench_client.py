@@ -0,0 +1,56 @@
+#bench_client.py //Downloads a wallet through a mock API that throttles and drops requests, with the client
+#started at twice the server's quota, and checks that retries and the adaptive rate still return the
+#complete history. Run from the repository root: python -m benchmarks.bench_client//
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('POLYSCAN_API_KEY', 'mock')
+
+import concurrent_fetcher
+import polygonscan_client
+from benchmarks.mock_polygonscan import make_dense_wallet_chain, start_mock_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=40000)
+    parser.add_argument('--quota', type=float, default=10, help="Requests per second the mock server allows")
+    parser.add_argument('--client-rate', type=float, default=20, help="Rate the client starts at")
+    parser.add_argument('--failure-rate', type=float, default=0.05, help="Share of requests answered with HTTP 503")
+    parser.add_argument('--latency', type=float, default=0.1, help="Simulated server latency in seconds")
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    wallet, chain = make_dense_wallet_chain(transactions=args.transactions)
+    expected_hashes = {tx['hash'] for tx in chain.by_address[wallet]}
+    server = start_mock_server(chain, latency=args.latency, rate_limit=args.quota, failure_rate=args.failure_rate)
+    polygonscan_client.api_url = server.url
+    polygonscan_client.cache_path = ''
+    polygonscan_client.set_rate_limit(args.client_rate, capacity=1)
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        transactions, errors = concurrent_fetcher.fetch_wallet_partitioned(wallet, 0, chain.head_block, 1000, executor)
+    elapsed = time.time() - start_time
+    server.shutdown()
+
+    stats = polygonscan_client.stats()
+    hashes = {tx['hash'] for tx in transactions}
+    print(f"Server: quota {args.quota} req/s, {args.failure_rate:.0%} failures; client started at {args.client_rate} req/s")
+    print(f"{elapsed:.2f}s  {server.request_count} requests seen by the server: {server.throttled_count} throttled, "
+          f"{server.failed_count} failed")
+    print(f"Client: {stats['requests']} sent, {stats['retries']} retries, {stats['throttled']} throttle events, "
+          f"rate settled at {stats['rate']:.2f} req/s")
+    complete = hashes == expected_hashes and not errors
+    print(f"{len(hashes)} of {len(expected_hashes)} transactions, {len(errors)} errors: {'complete' if complete else 'INCOMPLETE'}")
+    if not complete:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
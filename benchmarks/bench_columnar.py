@@ -0,0 +1,103 @@
+#bench_columnar.py //Load times of the same synthetic Transactions table as CSV (what training.csv and
+#the Results files are) and as Parquet from columnar.export_transactions: the whole table, only the
+#method a feature columns, and the feature columns of a 1% block range, next to the SQLite query.
+#Also checks that the Parquet copies of training.csv and training1.csv load the same values as
+#pd.read_csv.
+#Run from the repository root: python -m benchmarks.bench_columnar --rows 1000000//
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import memory_usage
+from benchmarks import synthetic
+
+# Same columns as main.train for method a
+feature_columns = ['gasUsed', 'value', 'confirmations', 'nonce', 'txreceipt_status', 'gasPrice', 'cumulativeGasUsed',
+                   'fromAddress', 'toAddress']
+
+
+def timed(load, repeat):
+    """Median seconds of `repeat` loads and the rows of the last one."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = load()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)), len(df)
+
+
+def same_values(expected, actual):
+    """Column by column equality, with CSV empty fields (NaN) matching Parquet nulls."""
+    if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+        return False
+    for column in expected.columns:
+        a, b = expected[column], actual[column]
+        if not (a.isna().to_numpy() == b.isna().to_numpy()).all():
+            return False
+        if not (a[a.notna()].to_numpy() == b[b.notna()].to_numpy()).all():
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    columnar.require_pyarrow()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for csv_path in ['training.csv', 'training1.csv']:
+            parquet_path = columnar.import_csv(csv_path, os.path.join(tmp, os.path.basename(csv_path) + '.parquet'))
+            expected = pd.read_csv(csv_path)
+            same = same_values(expected, pd.read_parquet(parquet_path))
+            print(f"{csv_path}: Parquet copy loads the same values as read_csv: {same}")
+            if not same:
+                raise SystemExit(1)
+
+        database = synthetic.write_database(synthetic.SyntheticTable(args.rows, seed=args.seed),
+                                            os.path.join(tmp, 'transactions.db'))
+        parquet_path = os.path.join(tmp, 'transactions.parquet')
+        start = time.perf_counter()
+        columnar.export_transactions(database, parquet_path)
+        export_seconds = time.perf_counter() - start
+        csv_path = os.path.join(tmp, 'transactions.csv')
+        conn = sqlite3.connect(database)
+        pd.read_sql_query("SELECT * FROM Transactions ORDER BY blockNumber, transactionIndex", conn).drop(
+            columns='value_wei').to_csv(csv_path, index=False)
+        blocks = conn.execute("SELECT MIN(blockNumber), MAX(blockNumber) FROM Transactions").fetchone()
+        start_block = blocks[0] + (blocks[1] - blocks[0]) // 2
+        end_block = start_block + (blocks[1] - blocks[0]) // 100
+        print(f"{args.rows} rows: exported in {export_seconds:.1f}s; CSV "
+              f"{memory_usage.format_bytes(os.path.getsize(csv_path))}, Parquet "
+              f"{memory_usage.format_bytes(os.path.getsize(parquet_path))}")
+
+        select = f"SELECT {', '.join(feature_columns)} FROM Transactions"
+        loads = [
+            ('all columns', 'CSV', lambda: pd.read_csv(csv_path)),
+            ('all columns', 'Parquet', lambda: columnar.read_transactions(parquet_path)),
+            ('feature columns', 'CSV', lambda: pd.read_csv(csv_path, usecols=feature_columns)),
+            ('feature columns', 'SQLite', lambda: pd.read_sql_query(select, conn)),
+            ('feature columns', 'Parquet', lambda: columnar.read_transactions(parquet_path, feature_columns)),
+            ('1% of blocks', 'SQLite', lambda: pd.read_sql_query(f"{select} WHERE blockNumber BETWEEN ? AND ?", conn,
+                                                                  params=(start_block, end_block))),
+            ('1% of blocks', 'Parquet', lambda: columnar.read_transactions(parquet_path, feature_columns,
+                                                                           start_block, end_block)),
+        ]
+        print(f"{'load':<16} {'format':<8} {'seconds':>9} {'rows':>9}")
+        for name, source, load in loads:
+            seconds, rows = timed(load, args.repeat)
+            print(f"{name:<16} {source:<8} {seconds:>9.3f} {rows:>9}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
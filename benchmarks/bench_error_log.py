@@ -0,0 +1,92 @@
+#bench_error_log.py //Times logging errors the old way (load errors.json, append, rewrite it) against
+#error_log's one-line appends as the log grows, then has several processes with several threads
+#each log at the same time and checks that every record arrives whole. Last, checks that resolving a
+#wallet's range in one database leaves the same range failed in another.
+#Run from the repository root: python -m benchmarks.bench_error_log//
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import error_log
+
+
+def log_error_rewrite(path, wallet_address, error_message):
+    """The errors.json logging this replaces."""
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            errors = json.load(file)
+    else:
+        errors = []
+    errors.append({'wallet_address': wallet_address, 'error_message': error_message,
+                   'timestamp': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())})
+    with open(path, 'w') as file:
+        json.dump(errors, file, indent=4)
+
+
+def log_many(path, worker, count, threads):
+    def log(thread):
+        for i in range(count):
+            error_log.log_error(f"0x{worker:04x}{thread:04x}", f"Request error: 429 Too Many Requests ({i})",
+                                i * 1000, i * 1000 + 999, database='bench.db', path=path)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(log, range(threads)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--per-thread', type=int, default=2000)
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'errors':>8} {'rewrite ms/error':>17} {'append ms/error':>16}")
+        for size in args.sizes:
+            old_path, new_path = os.path.join(tmp, f'{size}.json'), os.path.join(tmp, f'{size}.jsonl')
+            start_time = time.perf_counter()
+            for i in range(size):
+                log_error_rewrite(old_path, '0xwallet', f"Request error: {i}")
+            rewrite = (time.perf_counter() - start_time) / size
+            start_time = time.perf_counter()
+            for i in range(size):
+                error_log.log_error('0xwallet', f"Request error: {i}", i, i, path=new_path)
+            append = (time.perf_counter() - start_time) / size
+            print(f"{size:>8} {rewrite * 1000:>17.3f} {append * 1000:>16.3f}")
+
+        path = os.path.join(tmp, 'concurrent.jsonl')
+        start_time = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.processes) as executor:
+            list(executor.map(log_many, [path] * args.processes, range(args.processes),
+                              [args.per_thread] * args.processes, [args.threads] * args.processes))
+        seconds = time.perf_counter() - start_time
+        expected = args.processes * args.threads * args.per_thread
+        with open(path) as file:
+            lines = file.read().splitlines()
+        whole = sum(1 for line in lines if json.loads(line)['database'] == 'bench.db')
+        print(f"{args.processes} processes x {args.threads} threads: {len(lines)} lines in {seconds:.2f}s, "
+              f"{whole} whole records of {expected}")
+        start_time = time.perf_counter()
+        pending = error_log.failed_ranges(error_log.read_records(path, include_legacy=False))
+        print(f"Grouped {len(pending)} wallets' failed ranges in {time.perf_counter() - start_time:.2f}s")
+
+        path = os.path.join(tmp, 'resolved.jsonl')
+        for database in ['Database/transactions.db', 'Database/transactions2.db']:
+            error_log.log_error('0xwallet', "Request error: timeout", 100, 200, database=database, path=path)
+        error_log.mark_resolved('0xwallet', 100, 200, 'Database/transactions2.db', path=path)
+        pending = error_log.failed_ranges(error_log.read_records(path, include_legacy=False))
+        separate = pending == {('Database/transactions.db', '0xwallet'): [(100, 200)]}
+        print(f"Resolving a range in one database keeps it failed in the other: {separate}")
+        if whole != expected or len(lines) != expected or not separate:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#bench_fetcher.py //Compares the sequential depth-1 crawl with the concurrent fetcher against the local mock API.
+#Run from the repository root: python -m benchmarks.bench_fetcher//
+
+import argparse
+import logging
+import os
+import tempfile
+import sqlite3
+import time
+
+os.environ.setdefault('POLYSCAN_API_KEY', 'mock')
+
+import polygonscan_client
+import populate_training_data
+from benchmarks.mock_polygonscan import make_crawl_chain, start_mock_server
+
+
+def run(label, crawl, server, database):
+    populate_training_data.database = database
+    populate_training_data.processed_wallets.clear()
+    requests_before = server.request_count
+    throttled_before = server.throttled_count
+    start_time = time.time()
+    crawl()
+    elapsed = time.time() - start_time
+    requests_made = server.request_count - requests_before
+    with sqlite3.connect(database) as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM Transactions").fetchone()[0]
+    print(f"{label:<12} {elapsed:8.2f}s  {rows:7d} rows  {requests_made:6d} requests  {requests_made / elapsed:7.2f} req/s  "
+          f"{server.throttled_count - throttled_before:4d} throttled")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rate', type=float, default=20, help="API quota in requests per second")
+    parser.add_argument('--latency', type=float, default=0.05, help="Simulated server latency in seconds")
+    parser.add_argument('--neighbours', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    root, chain = make_crawl_chain(neighbours=args.neighbours)
+    server = start_mock_server(chain, latency=args.latency, rate_limit=args.rate)
+    polygonscan_client.api_url = server.url
+    # Every request has to reach the mock server for the timings to mean anything
+    polygonscan_client.cache_path = ''
+    # Leave 10% headroom under the quota for network jitter, as you would with a real key
+    polygonscan_client.set_rate_limit(args.rate * 0.9, capacity=1)
+    chunk_size = 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        populate_training_data.error_directory = tmp
+        def sequential():
+            populate_training_data.fetch_tx_by_address(root, 0, chain.head_block, chunk_size)
+
+        def concurrent():
+            populate_training_data.fetch_tx_by_address_concurrent(root, 0, chain.head_block, chunk_size,
+                                                                  max_workers=args.workers)
+
+        print(f"Depth-1 crawl of {args.neighbours} neighbours, quota {args.rate} req/s, latency {args.latency * 1000:.0f} ms")
+        sequential_time = run('sequential', sequential, server, os.path.join(tmp, 'sequential.db'))
+        concurrent_time = run('concurrent', concurrent, server, os.path.join(tmp, 'concurrent.db'))
+        print(f"Speedup: {sequential_time / concurrent_time:.1f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
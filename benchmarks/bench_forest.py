@@ -0,0 +1,92 @@
+#bench_forest.py //Compares forest_engine's compiled forest with the scikit-learn estimator: both
+#must give the same labels; then latency per batch, peak memory while predicting and the size of
+#the saved model are measured for batch sizes from 1 to 1M rows.
+#Run from the repository root: python -m benchmarks.bench_forest//
+
+import argparse
+import io
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+import forest_engine
+import memory_usage
+import transaction_data_pipeline
+from benchmarks import synthetic
+
+feature_columns = ['gasUsed', 'value', 'confirmations', 'nonce', 'txreceipt_status', 'gasPrice', 'cumulativeGasUsed',
+                   'is_from_fraud_wallet', 'is_to_fraud_wallet']
+
+
+def make_features(rows, seed):
+    """Labelled method a features of a synthetic table."""
+    table = synthetic.SyntheticTable(rows, seed=seed)
+    fraud_wallets = set(table.fraud_wallets())
+    df = next(table.chunks(rows))
+    df['is_from_fraud_wallet'] = df['fromAddress'].isin(fraud_wallets).astype(np.int64)
+    df['is_to_fraud_wallet'] = df['toAddress'].isin(fraud_wallets).astype(np.int64)
+    labels = transaction_data_pipeline.label_transactions(df, 'a')
+    return df[feature_columns], labels
+
+
+def saved_size(obj):
+    buffer = io.BytesIO()
+    joblib.dump(obj, buffer)
+    return buffer.tell()
+
+
+def timed_predict(predict, X, repeat):
+    times = []
+    with memory_usage.PeakRSSMonitor(interval=0.002) as monitor:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            labels = predict(X)
+            times.append(time.perf_counter() - start)
+    return labels, float(np.median(times)), monitor.peak - monitor.start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--train-rows', type=int, default=200000)
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--max-batch', type=int, default=1000000)
+    parser.add_argument('--jobs', type=int, default=1, help="n_jobs of the scikit-learn estimator")
+    args = parser.parse_args()
+
+    X, y = make_features(args.train_rows, seed=0)
+    start_time = time.time()
+    clf = RandomForestClassifier(n_estimators=args.trees, random_state=42, n_jobs=args.jobs).fit(X.to_numpy(), y)
+    print(f"Trained {args.trees} trees on {args.train_rows} rows in {time.time() - start_time:.1f}s")
+    start_time = time.time()
+    engine = forest_engine.compile_forest(clf)
+    print(f"Compiled in {time.time() - start_time:.2f}s: {len(engine.feature)} split nodes, depth {engine.max_depth}")
+    print(f"Saved size: estimator {memory_usage.format_bytes(saved_size(clf))}, "
+          f"compiled {memory_usage.format_bytes(saved_size(engine))}")
+
+    # Fresh rows the forest hasn't seen, in the scoring layout: a DataFrame of the feature columns
+    scoring, _ = make_features(args.max_batch, seed=1)
+    sklearn_input = scoring.to_numpy(dtype=np.float64)
+    print(f"{'batch':>8} {'sklearn':>12} {'compiled':>12} {'speedup':>8} {'sklearn mem':>12} {'compiled mem':>13}  labels")
+    mismatches = 0
+    batch = 1
+    while batch <= args.max_batch:
+        repeat = max(1, min(50, 100000 // batch))
+        # scikit-learn gets the float64 array main.score used to build; the engine reads the DataFrame
+        expected, sklearn_seconds, sklearn_memory = timed_predict(
+            lambda rows: clf.predict(sklearn_input[:rows]), batch, repeat)
+        labels, engine_seconds, engine_memory = timed_predict(
+            lambda rows: engine.predict(scoring.iloc[:rows]), batch, repeat)
+        same = np.array_equal(expected, labels)
+        mismatches += not same
+        print(f"{batch:>8} {sklearn_seconds * 1000:10.2f}ms {engine_seconds * 1000:10.2f}ms "
+              f"{sklearn_seconds / engine_seconds:7.1f}x {memory_usage.format_bytes(sklearn_memory):>12} "
+              f"{memory_usage.format_bytes(engine_memory):>13}  {'same' if same else 'DIFFERENT'}")
+        batch *= 10
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
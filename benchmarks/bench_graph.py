@@ -0,0 +1,121 @@
+#bench_graph.py //Builds a synthetic transactions database through TransactionStore, so the Edges table is
+#maintained as pages arrive, then times neighbour expansion and distance-to-fraud-wallet searches
+#on Edges against the same searches on the Transactions table.
+#Run from the repository root: python -m benchmarks.bench_graph//
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import fraud_wallet_list
+import graph_index
+import transaction_store
+from benchmarks.mock_polygonscan import make_address
+
+
+def make_graph_transactions(rng, addresses, transactions, head_block=50000000):
+    """Transactions between a fixed population, with a few hubs taking part in most of them."""
+    hubs = addresses[:max(1, len(addresses) // 1000)]
+    for _ in range(transactions):
+        sender = rng.choice(hubs) if rng.random() < 0.3 else rng.choice(addresses)
+        receiver = rng.choice(hubs) if rng.random() < 0.3 else rng.choice(addresses)
+        yield {
+            'hash': '0x%064x' % rng.getrandbits(256),
+            'blockNumber': str(rng.randint(20000000, head_block)),
+            'from': sender,
+            'to': receiver,
+            'value': str(rng.getrandbits(64)),
+            'nonce': '0', 'transactionIndex': '0', 'gas': '21000', 'gasPrice': '1000000000', 'isError': '0',
+            'txreceipt_status': '1', 'cumulativeGasUsed': '21000', 'gasUsed': '21000', 'confirmations': '1000',
+            'timeStamp': '1600000000',
+        }
+
+
+def transactions_neighbours(conn, addresses):
+    """neighbours() answered from Transactions through its address indexes."""
+    found = set()
+    addresses = list(addresses)
+    for i in range(0, len(addresses), transaction_store.max_query_parameters):
+        chunk = addresses[i:i + transaction_store.max_query_parameters]
+        placeholders = ', '.join('?' * len(chunk))
+        found.update(row[0] for row in conn.execute(
+            f"SELECT DISTINCT toAddress FROM Transactions WHERE fromAddress IN ({placeholders})", chunk))
+        found.update(row[0] for row in conn.execute(
+            f"SELECT DISTINCT fromAddress FROM Transactions WHERE toAddress IN ({placeholders})", chunk))
+    return found
+
+
+def timed(function, repeat):
+    start_time = time.time()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.time() - start_time) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=500000)
+    parser.add_argument('--addresses', type=int, default=50000)
+    parser.add_argument('--fraud-wallets', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    addresses = [make_address(rng) for _ in range(args.addresses)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fraud_database = os.path.join(tmp, 'fraud_wallets.db')
+        with sqlite3.connect(fraud_database) as conn:
+            conn.execute("CREATE TABLE fraud_wallets (address TEXT)")
+            conn.executemany("INSERT INTO fraud_wallets VALUES (?)",
+                             [(address,) for address in rng.sample(addresses[len(addresses) // 1000:], args.fraud_wallets)])
+        conn.close()
+        fraud_wallets = fraud_wallet_list.FraudWalletList(fraud_database)
+
+        database = os.path.join(tmp, 'graph.db')
+        store = transaction_store.get_store(database)
+        page = []
+        start_time = time.time()
+        for tx in make_graph_transactions(rng, addresses, args.transactions):
+            page.append(tx)
+            if len(page) == 1000:
+                store.save(page)
+                page = []
+        store.save(page)
+        elapsed = time.time() - start_time
+        edges = graph_index.edge_count(database)
+        print(f"Saved {args.transactions} transactions ({edges} edges maintained) in {elapsed:.1f}s: "
+              f"{args.transactions / elapsed:.0f} rows/s")
+
+        start_time = time.time()
+        graph_index.rebuild(database)
+        print(f"Full Edges rebuild: {time.time() - start_time:.2f}s")
+
+        conn = sqlite3.connect(database)
+        samples = rng.sample(addresses[len(addresses) // 1000:], args.queries)
+        print(f"{'query':<28} {'Edges':>10} {'Transactions':>14}")
+        for label, on_edges, on_transactions in [
+            ('1-hop neighbours', lambda a: graph_index.neighbours(database, [a]), lambda a: transactions_neighbours(conn, [a])),
+            ('2-hop neighbours', lambda a: graph_index.neighbours(database, graph_index.neighbours(database, [a])),
+             lambda a: transactions_neighbours(conn, transactions_neighbours(conn, [a]))),
+        ]:
+            edge_ms = sum(timed(lambda: on_edges(a), 1)[1] for a in samples) / len(samples)
+            transaction_ms = sum(timed(lambda: on_transactions(a), 1)[1] for a in samples) / len(samples)
+            assert all(on_edges(a) == on_transactions(a) for a in samples[:3])
+            print(f"{label:<28} {edge_ms:8.1f}ms {transaction_ms:12.1f}ms")
+
+        distances = []
+        start_time = time.time()
+        for address in samples:
+            distances.append(graph_index.fraud_distance(database, address, fraud_wallets, max_hops=3))
+        fraud_ms = (time.time() - start_time) / len(samples) * 1000
+        print(f"{'distance to fraud wallet':<28} {fraud_ms:8.1f}ms   (distances {sorted(distances, key=str)})")
+        conn.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
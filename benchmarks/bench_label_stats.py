@@ -0,0 +1,111 @@
+#bench_label_stats.py //Checks that the LabelStats kept up by TransactionStore.save and
+#wallet_sync.refresh_confirmations match a full two-pass recomputation, and times the pieces: the
+#one-off build during migration, the cost per saved page, a refresh, and a parallel rebuild.
+#Finally labels the table with the maintained stats and with the recomputed ones.
+#Run from the repository root: python -m benchmarks.bench_label_stats --rows 1000000//
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import label_stats
+import transaction_data_pipeline
+import transaction_store
+import wallet_sync
+from benchmarks import synthetic
+
+
+def full_pass(database):
+    """Mean and sample standard deviation of every column with pandas, two passes over the table."""
+    conn = sqlite3.connect(database)
+    df = pd.read_sql_query(f"SELECT {', '.join(label_stats.COLUMNS)} FROM Transactions", conn).astype(np.float64)
+    conn.close()
+    return {column: (df[column].mean(), df[column].std()) for column in label_stats.COLUMNS}, df
+
+
+def worst_error(conn, expected):
+    moments, _ = label_stats.load(conn)
+    errors = []
+    for column, (mean, stdev) in expected.items():
+        errors.append(abs(moments[column].mean - mean) / max(abs(mean), 1e-300))
+        errors.append(abs(moments[column].stdev - stdev) / max(stdev, 1e-300))
+    return max(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--new-rows', type=int, default=100000, help="Rows saved page by page after the build")
+    parser.add_argument('--refresh-wallets', type=int, default=50)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'transactions.db')
+        table = synthetic.SyntheticTable(args.rows, seed=args.seed)
+        synthetic.write_database(table, database)
+
+        # Opening the store migrates the table, which builds LabelStats once
+        start = time.perf_counter()
+        store = transaction_store.get_store(database)
+        print(f"Migration of {args.rows} rows, LabelStats included: {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        with store.conn:
+            label_stats.build(store.conn)
+        print(f"LabelStats build alone: {time.perf_counter() - start:.2f}s")
+        expected, _ = full_pass(database)
+        print(f"After the build: worst relative error vs pandas {worst_error(store.conn, expected):.2e}")
+
+        pages = [synthetic.to_txlist(chunk) for chunk in
+                 synthetic.SyntheticTable(args.new_rows, seed=args.seed + 1, addresses=table.address_count).chunks(1000)]
+        update_seconds = 0.0
+        start = time.perf_counter()
+        for page in pages:
+            with store.conn:
+                rows = [transaction_store.transaction_row(tx) for tx in page]
+                update_start = time.perf_counter()
+                label_stats.update(store.conn, rows)
+                update_seconds += time.perf_counter() - update_start
+                store.conn.rollback()
+            store.save(page)
+        print(f"Saved {args.new_rows} rows in {len(pages)} pages in {time.perf_counter() - start:.2f}s; "
+              f"the stats update takes {update_seconds / len(pages) * 1000:.2f} ms per page")
+
+        wallets = table.addresses[:args.refresh_wallets]
+        start = time.perf_counter()
+        for wallet in wallets:
+            wallet_sync.refresh_confirmations(database, wallet, synthetic.head_block + 5000)
+        print(f"Refreshed confirmations of {len(wallets)} busiest wallets in {time.perf_counter() - start:.2f}s")
+
+        expected, df = full_pass(database)
+        error = worst_error(store.conn, expected)
+        print(f"After saves and refreshes: worst relative error vs pandas {error:.2e}")
+
+        start = time.perf_counter()
+        label_stats.compute(database, jobs=1)
+        serial = time.perf_counter() - start
+        start = time.perf_counter()
+        merged = label_stats.compute(database, jobs=args.jobs)
+        parallel = time.perf_counter() - start
+        merged_error = max(abs(merged[column].stdev - expected[column][1]) / expected[column][1] for column in expected)
+        print(f"Full rebuild: {serial:.2f}s in one process, {parallel:.2f}s in {args.jobs} "
+              f"(merged stdev error {merged_error:.2e})")
+
+        stored = transaction_data_pipeline.fraud_score_rules(database)
+        recomputed = [(column, *expected[column], weight) for column, _, _, weight in transaction_data_pipeline.FRAUD_SCORE_RULES]
+        same = np.array_equal(transaction_data_pipeline.label_transactions(df, 'b', stored),
+                              transaction_data_pipeline.label_transactions(df, 'b', recomputed))
+        print(f"Labels with the maintained stats match labels with recomputed stats: {same}")
+        store.close()
+        if not same or error > 1e-9:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#bench_labelling.py //Checks that the vectorized labeller gives every row of training1.csv the same
+#fraud score and flag as calculate_fraud_score and label_transaction applied row by row, for
+#methods a, b and c. Method a gets fraud wallet columns from a sample of the CSV's senders, and a
+#second rule set puts every threshold exactly on a value of its column to cover the tie checks.
+#Run from the repository root: python -m benchmarks.bench_labelling//
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import transaction_data_pipeline
+
+
+def tie_rules(df):
+    """FRAUD_SCORE_RULES with mean + stdev moved onto the median value of each column."""
+    return [(column, float(df[column].median()), 0.0, weight)
+            for column, _, _, weight in transaction_data_pipeline.FRAUD_SCORE_RULES]
+
+
+def check(df, method, rules, label):
+    start_time = time.time()
+    row_scores = np.array([transaction_data_pipeline.calculate_fraud_score(row, method, rules) for _, row in df.iterrows()])
+    row_flags = np.array([transaction_data_pipeline.label_transaction(row, method, rules) for _, row in df.iterrows()])
+    row_time = time.time() - start_time
+
+    start_time = time.time()
+    scores = transaction_data_pipeline.calculate_fraud_scores(df, method, rules)
+    flags = transaction_data_pipeline.label_transactions(df, method, rules)
+    vectorized_time = time.time() - start_time
+
+    score_mismatches = int((scores != row_scores).sum())
+    flag_mismatches = int((flags != row_flags).sum())
+    ok = not (score_mismatches or flag_mismatches)
+    counts = ', '.join(f"{flag} {int((flags == flag).sum())}" for flag in ['green', 'orange', 'red'])
+    print(f"method {method} {label:<8} rows {row_time:6.2f}s  vectorized {vectorized_time * 1000:6.1f} ms  "
+          f"{score_mismatches} score / {flag_mismatches} flag mismatches  ({counts})  {'OK' if ok else 'FAILED'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--csv', default='training1.csv')
+    parser.add_argument('--fraud-share', type=float, default=0.05, help="Share of senders taken as fraud wallets")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    senders = df['fromAddress'].dropna().unique()
+    rng = np.random.default_rng(args.seed)
+    fraud = set(rng.choice(senders, max(1, int(len(senders) * args.fraud_share)), replace=False))
+    df['is_from_fraud_wallet'] = df['fromAddress'].isin(fraud).astype(int)
+    df['is_to_fraud_wallet'] = df['toAddress'].isin(fraud).astype(int)
+    print(f"{args.csv}: {len(df)} rows, {len(fraud)} senders taken as fraud wallets")
+
+    ok = True
+    for method in ['a', 'b', 'c']:
+        ok &= check(df, method, transaction_data_pipeline.FRAUD_SCORE_RULES, 'offline')
+        ok &= check(df, method, tie_rules(df), 'ties')
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#bench_partitioned.py //Downloads an exchange-sized synthetic wallet from the local mock API, once in block
+#order with fetch_block_range and once as parallel density-sized partitions, and checks that both
+#return exactly the wallet's transactions: no gaps, no duplicates.
+#Run from the repository root: python -m benchmarks.bench_partitioned//
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('POLYSCAN_API_KEY', 'mock')
+
+import concurrent_fetcher
+import polygonscan_client
+from benchmarks.mock_polygonscan import make_dense_wallet_chain, start_mock_server
+
+
+def check(label, transactions, errors, expected_hashes):
+    hashes = [tx['hash'] for tx in transactions]
+    duplicates = len(hashes) - len(set(hashes))
+    missing = len(expected_hashes - set(hashes))
+    extra = len(set(hashes) - expected_hashes)
+    blocks = [int(tx['blockNumber']) for tx in transactions]
+    ordered = all(a <= b for a, b in zip(blocks, blocks[1:]))
+    ok = not (duplicates or missing or extra or errors)
+    print(f"{label:<12} {len(transactions):7d} txs  {duplicates} duplicates  {missing} missing  {extra} extra  "
+          f"{len(errors)} errors  {'ordered' if ordered else 'unordered'}  {'OK' if ok else 'FAILED'}")
+    return ok
+
+
+def run(label, fetch, server):
+    requests_before = server.request_count
+    start_time = time.time()
+    transactions, errors = fetch()
+    elapsed = time.time() - start_time
+    requests_made = server.request_count - requests_before
+    print(f"{label:<12} {elapsed:8.2f}s  {requests_made:6d} requests  {len(transactions) / elapsed:9.0f} tx/s")
+    return transactions, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=60000)
+    parser.add_argument('--rate', type=float, default=20, help="API quota in requests per second")
+    parser.add_argument('--latency', type=float, default=0.3, help="Simulated server latency in seconds")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    wallet, chain = make_dense_wallet_chain(transactions=args.transactions)
+    expected_hashes = {tx['hash'] for tx in chain.by_address[wallet]}
+    server = start_mock_server(chain, latency=args.latency, rate_limit=args.rate)
+    polygonscan_client.api_url = server.url
+    # Every request has to reach the mock server for the timings to mean anything
+    polygonscan_client.cache_path = ''
+    polygonscan_client.set_rate_limit(args.rate * 0.9, capacity=1)
+    start_block, end_block = 0, chain.head_block
+
+    print(f"Wallet with {len(expected_hashes)} transactions, quota {args.rate} req/s, latency {args.latency * 1000:.0f} ms")
+
+    def in_order():
+        transactions, error = concurrent_fetcher.fetch_block_range(wallet, start_block, end_block, args.chunk_size)
+        # fetch_block_range repeats the block it restarts from; fetch_wallet normally drops those
+        unique = list({tx['hash']: tx for tx in transactions}.values())
+        return unique, [error] if error else []
+
+    def partitioned():
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            return concurrent_fetcher.fetch_wallet_partitioned(wallet, start_block, end_block, args.chunk_size, executor)
+
+    ordered_txs, ordered_errors, ordered_time = run('in order', in_order, server)
+    partitioned_txs, partitioned_errors, partitioned_time = run('partitioned', partitioned, server)
+    print(f"Speedup: {ordered_time / partitioned_time:.1f}x")
+
+    ok = check('in order', ordered_txs, ordered_errors, expected_hashes)
+    ok &= check('partitioned', partitioned_txs, partitioned_errors, expected_hashes)
+    server.shutdown()
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
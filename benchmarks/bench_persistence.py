@@ -0,0 +1,86 @@
+#bench_persistence.py //Rows per second written to the Transactions table: the old per-row
+#connection/SELECT/INSERT path against TransactionStore. Run: python -m benchmarks.bench_persistence//
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import transaction_store
+from benchmarks.mock_polygonscan import make_address, make_transaction
+
+
+def make_pages(pages, page_size, duplicate_ratio, seed=0):
+    """Pages of txlist results where a share of each page repeats rows from earlier pages."""
+    rng = random.Random(seed)
+    wallet = make_address(rng)
+    seen = []
+    result = []
+    for _ in range(pages):
+        page = []
+        repeats = rng.sample(seen, min(len(seen), int(page_size * duplicate_ratio)))
+        page.extend(repeats)
+        for _ in range(page_size - len(repeats)):
+            page.append(make_transaction(rng, wallet, make_address(rng), rng.randint(20000000, 50000000), 60000000))
+        seen.extend(page[len(repeats):])
+        result.append(page)
+    return result
+
+
+def legacy_save_page(database, transactions):
+    """The original filter_unique_transactions + save_to_sql: two connections, one statement per row."""
+    conn = sqlite3.connect(database)
+    cursor = conn.cursor()
+    unique_transactions = []
+    for tx in transactions:
+        cursor.execute("SELECT COUNT(*) FROM Transactions WHERE hash = ?", (tx.get('hash'),))
+        if cursor.fetchone()[0] == 0:
+            unique_transactions.append(tx)
+    cursor.close()
+    conn.close()
+
+    conn = sqlite3.connect(database)
+    cursor = conn.cursor()
+    for tx in unique_transactions:
+        cursor.execute(transaction_store.INSERT_TRANSACTION.replace('INSERT OR IGNORE', 'INSERT'),
+                       transaction_store.transaction_row(tx))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return unique_transactions
+
+
+def run(label, save_page, pages):
+    start_time = time.perf_counter()
+    rows = sum(len(save_page(page)) for page in pages)
+    elapsed = time.perf_counter() - start_time
+    offered = sum(len(page) for page in pages)
+    print(f"{label:<28} {rows:7d} rows  {elapsed:7.2f}s  {offered / elapsed:10.0f} rows/s offered  {rows / elapsed:10.0f} rows/s written")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark writes to the Transactions table")
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--duplicates', type=float, default=0.2, help="Share of each page already stored")
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages, args.page_size, args.duplicates)
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = os.path.join(tmp, 'legacy.db')
+        transaction_store.TransactionStore(legacy_db, journal_mode='DELETE', synchronous='FULL').close()
+        legacy = run('before: per-row (DELETE/FULL)', lambda page: legacy_save_page(legacy_db, page), pages)
+
+        for journal_mode, synchronous in [('DELETE', 'FULL'), ('WAL', 'NORMAL'), ('WAL', 'OFF')]:
+            store = transaction_store.TransactionStore(os.path.join(tmp, f'{journal_mode}_{synchronous}.db'),
+                                                       journal_mode=journal_mode, synchronous=synchronous)
+            elapsed = run(f'after: store ({journal_mode}/{synchronous})', store.save, pages)
+            store.close()
+            print(f"{'':<28} {legacy / elapsed:.1f}x faster than per-row")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#bench_proximity.py //Times the CSR multi-source BFS of fraud_proximity on a synthetic edge list with
+#millions of edges, and checks its distances against graph_index.fraud_distance (one SQL BFS per
+#address) on a smaller database. Last, scores rows of a wallet the database has never seen: its
+#own edges must connect it, and a fraud wallet outside the graph must still be at distance 0.
+#Run from the repository root: python -m benchmarks.bench_proximity//
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import fraud_proximity
+import fraud_wallet_list
+import graph_index
+import transaction_store
+from benchmarks.bench_graph import make_graph_transactions
+from benchmarks.mock_polygonscan import make_address
+
+
+def synthetic_edges(rng, nodes, edges):
+    """Edge list over `nodes` addresses where a few hubs take part in a third of the edges."""
+    addresses = np.array([f'0x{i:040x}' for i in range(nodes)], dtype=object)
+    hubs = max(1, nodes // 1000)
+    sources = np.where(rng.random(edges) < 0.3, rng.integers(0, hubs, edges), rng.integers(0, nodes, edges))
+    targets = rng.integers(0, nodes, edges)
+    return pd.DataFrame({'fromAddress': addresses[sources], 'toAddress': addresses[targets],
+                         'tx_count': 1, 'value_sum': rng.random(edges) * 1e18}), addresses
+
+
+def time_csr(edge_count, node_count, fraud_count):
+    rng = np.random.default_rng(0)
+    edges, addresses = synthetic_edges(rng, node_count, edge_count)
+    fraud = set(rng.choice(addresses, fraud_count, replace=False))
+
+    start_time = time.time()
+    graph, sources, targets = fraud_proximity.build_graph(edges)
+    build_time = time.time() - start_time
+
+    start_time = time.time()
+    is_fraud = np.fromiter((address in fraud for address in graph.addresses), dtype=bool, count=len(graph))
+    distance = fraud_proximity.multi_source_bfs(graph, np.flatnonzero(is_fraud))
+    bfs_time = time.time() - start_time
+    counts = np.bincount(distance)
+    print(f"{edge_count} edges, {len(graph)} addresses: CSR build {build_time:.2f}s, BFS {bfs_time:.2f}s; "
+          f"addresses per distance {counts.tolist()}")
+
+
+def check_against_sql(transactions, addresses, fraud_count, samples):
+    rng = random.Random(1)
+    population = [make_address(rng) for _ in range(addresses)]
+    with tempfile.TemporaryDirectory() as tmp:
+        fraud_database = os.path.join(tmp, 'fraud_wallets.db')
+        with sqlite3.connect(fraud_database) as conn:
+            conn.execute("CREATE TABLE fraud_wallets (address TEXT)")
+            conn.executemany("INSERT INTO fraud_wallets VALUES (?)",
+                             [(address.upper(),) for address in rng.sample(population, fraud_count)])
+        conn.close()
+        fraud_wallets = fraud_wallet_list.FraudWalletList(fraud_database)
+
+        database = os.path.join(tmp, 'graph.db')
+        store = transaction_store.get_store(database)
+        transactions = list(make_graph_transactions(rng, population, transactions))
+        for i in range(0, len(transactions), 1000):
+            store.save(transactions[i:i + 1000])
+
+        features = fraud_proximity.compute_address_features(database, fraud_wallets)
+        mismatches = 0
+        for address in rng.sample(list(features.index), samples):
+            expected = graph_index.fraud_distance(database, address, fraud_wallets, fraud_proximity.max_hops)
+            expected = fraud_proximity.max_hops + 1 if expected is None else expected
+            mismatches += expected != features.at[address, 'fraud_distance']
+        print(f"Distances checked against graph_index.fraud_distance for {samples} addresses: {mismatches} mismatches")
+
+        # A new wallet paying an address one hop from a fraud wallet, and a new fraud wallet paying it
+        near = features.index[features['fraud_distance'].to_numpy() == 1][0]
+        wallet, new_fraud = make_address(rng), make_address(rng)
+        with sqlite3.connect(fraud_database) as conn:
+            conn.execute("INSERT INTO fraud_wallets VALUES (?)", (new_fraud,))
+        conn.close()
+        fraud_wallets = fraud_wallet_list.FraudWalletList(fraud_database)
+        scored = pd.DataFrame({'fromAddress': [wallet, new_fraud], 'toAddress': [near, wallet], 'value': ['5', '7']})
+        training_graph = fraud_proximity.compute_address_features(database, fraud_wallets)
+        fraud_proximity.add_features(scored, training_graph, fraud_wallets=fraud_wallets)
+        scoring_ok = scored['from_fraud_distance'].tolist() == [fraud_proximity.max_hops + 1, 0]
+        features = fraud_proximity.compute_address_features(database, fraud_wallets,
+                                                            extra_edges=fraud_proximity.transaction_edges(scored))
+        fraud_proximity.add_features(scored, features, fraud_wallets=fraud_wallets)
+        scoring_ok &= (scored['from_fraud_distance'].tolist() == [1, 0] and scored['to_fraud_distance'].tolist() == [1, 1])
+        print(f"Unseen wallet joined to the graph by its own edges, unseen fraud wallet at distance 0: {scoring_ok}")
+        store.close()
+        return mismatches == 0 and scoring_ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--edges', type=int, default=3000000)
+    parser.add_argument('--addresses', type=int, default=500000)
+    parser.add_argument('--fraud-wallets', type=int, default=200)
+    args = parser.parse_args()
+
+    ok = check_against_sql(transactions=30000, addresses=20000, fraud_count=20, samples=200)
+    time_csr(args.edges, args.addresses, args.fraud_wallets)
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#bench_relabel.py //Times what a rerun of the method a dataset build costs once flags are stored with
+#the hash of their rules: a first full build, a rerun on the unchanged database, and reruns after new
+#rows were saved, where update_dataset reads only those rows and labels the earlier ones again from
+#label_inputs.npy once the LabelStats drifted past rules_tolerance. A small append must not label any
+#earlier row again. Every update is checked against a full rebuild labelled with the same rules,
+#and a refresh of confirmations (rows changed in place) must send the update back to a rebuild.
+#Last, method c's cached CSV flags: labelled once, reused on a rerun, labelled again once the CSV changes.
+#Run from the repository root: python -m benchmarks.bench_relabel --rows 136000//
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataset_builder
+import transaction_data_pipeline
+import transaction_store
+import wallet_sync
+from benchmarks import synthetic
+
+feature_columns = ['gasUsed', 'value', 'confirmations', 'nonce', 'txreceipt_status', 'gasPrice', 'cumulativeGasUsed',
+                   'fromAddress', 'toAddress']
+
+
+def same_dataset(left, right, metadata):
+    """Same features, scores and flags in two dataset directories, right labelled again with the rules of left."""
+    arrays = {name: np.load(os.path.join(right, f'{name}.npy'), mmap_mode='r+') for name in dataset_builder.array_dtypes}
+    dataset_builder.relabel(arrays, metadata['rows'], metadata['method'], metadata['fraud_score_rules'],
+                            metadata['feature_names'])
+    for array in arrays.values():
+        array.flush()
+    del arrays
+    return all(np.array_equal(np.load(os.path.join(left, f'{name}.npy')), np.load(os.path.join(right, f'{name}.npy')))
+               for name in ['features', 'target', 'scores'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=136000)
+    parser.add_argument('--new-rows', type=int, default=2000, help="Rows saved before each update")
+    parser.add_argument('--updates', type=int, default=3)
+    parser.add_argument('--small-rows', type=int, default=100, help="Rows of an append too small to move the rules")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', default='training1.csv', help="Training CSV labelled for method c")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'transactions.db')
+        fraud_database = os.path.join(tmp, 'fraud_wallets.db')
+        table = synthetic.SyntheticTable(args.rows, seed=args.seed)
+        synthetic.write_database(table, database)
+        synthetic.write_fraud_wallets(table.fraud_wallets(), fraud_database)
+        store = transaction_store.get_store(database)
+        output_dir = os.path.join(tmp, 'dataset')
+        check_dir = os.path.join(tmp, 'check')
+
+        def build(directory):
+            start = time.perf_counter()
+            metadata = dataset_builder.build_dataset(database, feature_columns, 'a', directory,
+                                                     fraud_wallets_path=fraud_database)
+            return metadata, time.perf_counter() - start
+
+        metadata, seconds = build(output_dir)
+        print(f"Full build of {metadata['rows']} rows: {seconds:.2f}s")
+
+        start = time.perf_counter()
+        current = dataset_builder.is_current(output_dir, database, feature_columns, 'a', fraud_database)
+        print(f"Rerun on the unchanged database: reused {current}, {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        ok = current
+        for step in range(args.updates):
+            new_table = synthetic.SyntheticTable(args.new_rows, seed=args.seed + 1 + step, addresses=table.address_count)
+            for chunk in new_table.chunks(1000):
+                store.save(synthetic.to_txlist(chunk))
+            start = time.perf_counter()
+            metadata = dataset_builder.update_dataset(database, feature_columns, 'a', output_dir,
+                                                      fraud_wallets_path=fraud_database)
+            update_seconds = time.perf_counter() - start
+            _, build_seconds = build(check_dir)
+            same = metadata is not None and same_dataset(output_dir, check_dir, metadata)
+            ok = ok and same
+            print(f"+{args.new_rows} rows: update {update_seconds:.2f}s ({metadata['added_rows']} read, "
+                  f"{metadata['relabelled_rows']} labelled again from stored inputs), full build {build_seconds:.2f}s, "
+                  f"same dataset: {same}")
+
+        new_table = synthetic.SyntheticTable(args.small_rows, seed=args.seed + 1 + args.updates,
+                                             addresses=table.address_count)
+        store.save(synthetic.to_txlist(next(new_table.chunks(args.small_rows))))
+        previous_hash = metadata['rules_hash']
+        metadata = dataset_builder.update_dataset(database, feature_columns, 'a', output_dir,
+                                                  fraud_wallets_path=fraud_database)
+        build(check_dir)
+        kept = (metadata is not None and metadata['rules_hash'] == previous_hash and metadata['relabelled_rows'] == 0
+                and same_dataset(output_dir, check_dir, metadata))
+        ok = ok and kept
+        print(f"+{args.small_rows} rows: rules hash kept, no earlier row labelled again, same dataset: {kept}")
+
+        wallet_sync.refresh_confirmations(database, table.addresses[0], synthetic.head_block + 5000)
+        refused = dataset_builder.update_dataset(database, feature_columns, 'a', output_dir,
+                                                 fraud_wallets_path=fraud_database) is None
+        print(f"After refreshed confirmations the update defers to a rebuild: {refused}")
+        store.close()
+
+        csv_path = shutil.copy(args.csv, os.path.join(tmp, os.path.basename(args.csv)))
+        df = pd.read_csv(csv_path)
+        expected = transaction_data_pipeline.label_transactions(df, 'c', transaction_data_pipeline.FRAUD_SCORE_RULES)
+        for run in ['first run', 'rerun', 'CSV edited']:
+            if run == 'CSV edited':
+                os.utime(csv_path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+            cached = os.path.exists(transaction_data_pipeline.flags_path(csv_path))
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                flags = transaction_data_pipeline.flag_training_csv(
+                    df.drop(columns='flag', errors='ignore'), csv_path, 'c', transaction_data_pipeline.FRAUD_SCORE_RULES)['flag']
+            seconds = time.perf_counter() - start
+            key = str(np.load(transaction_data_pipeline.flags_path(csv_path))['key'])
+            same = np.array_equal(flags.to_numpy(), expected)
+            ok = ok and same
+            print(f"Method c {run}: {seconds * 1000:.1f} ms, cache file {'present' if cached else 'absent'}, "
+                  f"CSV fingerprint {key.split(':')[0][:12]}, flags match label_transactions: {same}")
+
+        if not ok or not refused:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
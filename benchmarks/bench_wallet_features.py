@@ -0,0 +1,82 @@
+#bench_wallet_features.py //Saves a growing synthetic history through TransactionStore, so WalletFeatures is
+#maintained page by page, and times joining wallet features onto a fixed batch at each size; the join
+#should stay flat as the history grows. Also checks the incremental rows and value histograms against a
+#full rebuild; value sums are added up page by page, so they only have to agree to rounding.
+#Run from the repository root: python -m benchmarks.bench_wallet_features//
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import transaction_store
+import wallet_features
+from benchmarks.bench_graph import make_graph_transactions
+from benchmarks.mock_polygonscan import make_address
+
+
+def read_table(conn):
+    rows = pd.read_sql_query(f"SELECT {', '.join(wallet_features.COLUMNS)} FROM WalletFeatures ORDER BY address", conn)
+    return rows.set_index('address')
+
+
+def read_histograms(conn):
+    return pd.read_sql_query("SELECT address, bucket, count FROM WalletValueHistogram ORDER BY address, bucket", conn)
+
+
+def same_tables(left, right):
+    """Same rows in two WalletFeatures tables read by read_table, the REAL value sums to within rounding."""
+    sums = ['value_sent', 'value_received', 'value_sq_sum']
+    return (left.index.equals(right.index) and left.drop(columns=sums).equals(right.drop(columns=sums))
+            and np.allclose(left[sums].to_numpy(), right[sums].to_numpy(), rtol=1e-12, atol=0.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--steps', type=int, default=4)
+    parser.add_argument('--step-transactions', type=int, default=100000)
+    parser.add_argument('--addresses', type=int, default=50000)
+    parser.add_argument('--batch', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    addresses = [make_address(rng) for _ in range(args.addresses)]
+    batch = pd.DataFrame([{'fromAddress': tx['from'], 'toAddress': tx['to']}
+                          for tx in make_graph_transactions(rng, addresses, args.batch)])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'wallets.db')
+        store = transaction_store.get_store(database)
+        total = 0
+        print(f"{'history':>10} {'save rows/s':>12} {'join ms':>9}")
+        for _ in range(args.steps):
+            transactions = list(make_graph_transactions(rng, addresses, args.step_transactions))
+            start_time = time.time()
+            for i in range(0, len(transactions), 1000):
+                store.save(transactions[i:i + 1000])
+            rate = len(transactions) / (time.time() - start_time)
+            total += len(transactions)
+
+            start_time = time.time()
+            wallet_features.add_features(batch.copy(), database)
+            join_ms = (time.time() - start_time) * 1000
+            print(f"{total:>10} {rate:>12.0f} {join_ms:>9.1f}")
+
+        incremental, incremental_histograms = read_table(store.conn), read_histograms(store.conn)
+        start_time = time.time()
+        with store.conn:
+            wallet_features.build(store.conn)
+        print(f"Full WalletFeatures rebuild: {time.time() - start_time:.2f}s")
+        same = same_tables(incremental, read_table(store.conn)) and incremental_histograms.equals(read_histograms(store.conn))
+        print(f"Incremental rows match the rebuild: {same}")
+        store.close()
+        if not same:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#compare.py //Compares two result files of benchmarks.run_suite step by step.
+#Prints the seconds of every step in both runs and the ratio, and marks steps that got slower
+#than the threshold allows. With --fail the exit code is 1 when any step regressed.
+#Run from the repository root: python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json//
+
+import argparse
+import json
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(baseline, current, threshold=0.1, min_seconds=0.05):
+    """Yield (size, step, baseline seconds, current seconds, regressed) for the steps both runs have.
+
+    Steps faster than min_seconds in both runs are too noisy to count as regressions.
+    """
+    for size, steps in current['results'].items():
+        for step, result in steps.items():
+            before = baseline['results'].get(size, {}).get(step)
+            if before is None:
+                continue
+            old, new = before['seconds'], result['seconds']
+            regressed = max(old, new) >= min_seconds and new > old * (1 + threshold)
+            yield size, step, old, new, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('baseline', help="Results of the reference run")
+    parser.add_argument('current', help="Results of the run to check")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Allowed slowdown, as a share of the baseline")
+    parser.add_argument('--fail', action='store_true', help="Exit with status 1 when a step regressed")
+    args = parser.parse_args()
+
+    baseline, current = load(args.baseline), load(args.current)
+    print(f"baseline {baseline['commit']} ({baseline['started_at']}) -> current {current['commit']} ({current['started_at']})")
+    print(f"{'size':<6} {'step':<20} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    regressions = 0
+    for size, step, old, new, regressed in compare(baseline, current, args.threshold):
+        ratio = f"{new / old:.2f}x" if old else ''
+        print(f"{size:<6} {step:<20} {old:9.3f}s {new:9.3f}s {ratio:>7}{'  SLOWER' if regressed else ''}")
+        regressions += regressed
+    print(f"{regressions} steps slower by more than {args.threshold:.0%}")
+    if args.fail and regressions:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#mock_polygonscan.py //A local stand-in for the Polygonscan API used by the benchmarks.
+#It serves txlist pagination (including the 10,000 result window), eth_blockNumber and the
+#"Max rate limit reached" response, with an optional per-request latency and a share of requests
+#that fail with HTTP 503//
+
+import bisect
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+max_result_window = 10000  # Polygonscan limit on page * offset
+
+
+def make_address(rng):
+    return '0x' + ''.join(rng.choice('0123456789abcdef') for _ in range(40))
+
+
+def make_transaction(rng, from_address, to_address, block_number, head_block):
+    """Build one txlist entry with the same fields and string formatting as Polygonscan."""
+    gas = rng.choice([21000, 50000, 100000, 250000, 1000000])
+    return {
+        'blockNumber': str(block_number),
+        'timeStamp': str(1600000000 + block_number * 2),
+        'hash': '0x' + '%064x' % rng.getrandbits(256),
+        'nonce': str(rng.randint(0, 5000)),
+        'blockHash': '0x' + '%064x' % rng.getrandbits(256),
+        'transactionIndex': str(rng.randint(0, 200)),
+        'from': from_address,
+        'to': to_address,
+        'value': str(int(rng.lognormvariate(40, 4))),
+        'gas': str(gas),
+        'gasPrice': str(rng.randint(1, 500) * 10**9),
+        'isError': '0',
+        'txreceipt_status': '1',
+        'input': '0x',
+        'contractAddress': '',
+        'cumulativeGasUsed': str(rng.randint(21000, 30000000)),
+        'gasUsed': str(rng.randint(21000, gas)),
+        'confirmations': str(head_block - block_number),
+    }
+
+
+class MockChain:
+    """In-memory set of transactions indexed by address and block number."""
+
+    def __init__(self, head_block=60000000):
+        self.head_block = head_block
+        self.by_address = {}
+
+    def add(self, tx):
+        for address in {tx['from'], tx['to']}:
+            if address:
+                self.by_address.setdefault(address, []).append(tx)
+
+    def finalize(self):
+        """Sort every address's transactions by block so range lookups can bisect."""
+        self.blocks = {}
+        for address, txs in self.by_address.items():
+            txs.sort(key=lambda tx: (int(tx['blockNumber']), int(tx['transactionIndex'])))
+            self.blocks[address] = [int(tx['blockNumber']) for tx in txs]
+        return self
+
+    def txlist(self, address, start_block, end_block, sort='asc'):
+        txs = self.by_address.get(address, [])
+        blocks = self.blocks.get(address, [])
+        selected = txs[bisect.bisect_left(blocks, start_block):bisect.bisect_right(blocks, end_block)]
+        return selected[::-1] if sort == 'desc' else selected
+
+
+def make_crawl_chain(seed=0, root_transactions=2000, neighbours=50, neighbour_transactions=300,
+                     start_block=20000000, end_block=50000000):
+    """A root wallet whose counterparties each have their own history: the shape of a depth-1 crawl."""
+    rng = random.Random(seed)
+    chain = MockChain(head_block=end_block + 1000)
+    root = make_address(rng)
+    counterparties = [make_address(rng) for _ in range(neighbours)]
+    for _ in range(root_transactions):
+        other = rng.choice(counterparties)
+        sender, receiver = (root, other) if rng.random() < 0.5 else (other, root)
+        chain.add(make_transaction(rng, sender, receiver, rng.randint(start_block, end_block), chain.head_block))
+    for address in counterparties:
+        for _ in range(neighbour_transactions):
+            chain.add(make_transaction(rng, address, make_address(rng), rng.randint(start_block, end_block), chain.head_block))
+    return root, chain.finalize()
+
+
+def make_dense_wallet_chain(seed=0, transactions=50000, start_block=20000000, end_block=50000000, hot_spots=3):
+    """One exchange-sized wallet whose activity is concentrated in a few dense block ranges."""
+    rng = random.Random(seed)
+    chain = MockChain(head_block=end_block + 1000)
+    wallet = make_address(rng)
+    centres = [rng.randint(start_block, end_block) for _ in range(hot_spots)]
+    for _ in range(transactions):
+        if rng.random() < 0.7:
+            block = int(rng.gauss(rng.choice(centres), (end_block - start_block) / 500))
+            block = min(max(block, start_block), end_block)
+        else:
+            block = rng.randint(start_block, end_block)
+        other = make_address(rng)
+        sender, receiver = (wallet, other) if rng.random() < 0.5 else (other, wallet)
+        chain.add(make_transaction(rng, sender, receiver, block, chain.head_block))
+    return wallet, chain.finalize()
+
+
+class MockPolygonscanHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        with server.stats_lock:
+            server.request_count += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        if server.failure_rate and server.random.random() < server.failure_rate:
+            with server.stats_lock:
+                server.failed_count += 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if server.rate_limit and not server.allow_request():
+            with server.stats_lock:
+                server.throttled_count += 1
+            return self.send_json({'status': '0', 'message': 'NOTOK', 'result': 'Max rate limit reached'})
+
+        if params.get('module') == 'proxy' and params.get('action') == 'eth_blockNumber':
+            return self.send_json({'jsonrpc': '2.0', 'id': 83, 'result': hex(server.chain.head_block)})
+
+        if params.get('module') == 'account' and params.get('action') == 'txlist':
+            page = int(params.get('page', 1))
+            offset = int(params.get('offset', 10000))
+            if page * offset > max_result_window:
+                return self.send_json({'status': '0', 'message': 'NOTOK',
+                                       'result': 'Result window is too large, PageNo x Offset size must be less than or equal to 10000'})
+            txs = server.chain.txlist(params.get('address'), int(params.get('startblock', 0)),
+                                      int(params.get('endblock', 99999999)), params.get('sort', 'asc'))
+            result = txs[(page - 1) * offset:page * offset]
+            if not result:
+                return self.send_json({'status': '0', 'message': 'No transactions found', 'result': []})
+            return self.send_json({'status': '1', 'message': 'OK', 'result': result})
+
+        self.send_json({'status': '0', 'message': 'NOTOK', 'result': 'Error! Missing Or invalid Module name'})
+
+
+class MockPolygonscanServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, chain, latency=0.0, rate_limit=None, failure_rate=0.0, seed=0):
+        super().__init__(('127.0.0.1', 0), MockPolygonscanHandler)
+        self.chain = chain
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.throttled_count = 0
+        self.failed_count = 0
+        self.stats_lock = threading.Lock()
+        self.window = []
+
+    def allow_request(self):
+        """Sliding one-second window, like the per-key limit of the real API."""
+        now = time.monotonic()
+        with self.stats_lock:
+            self.window = [t for t in self.window if now - t < 1.0]
+            if len(self.window) >= self.rate_limit:
+                return False
+            self.window.append(now)
+            return True
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/api'
+
+
+def start_mock_server(chain, latency=0.0, rate_limit=None, failure_rate=0.0):
+    """Start the mock API on a free local port in a background thread and return the server."""
+    server = MockPolygonscanServer(chain, latency, rate_limit, failure_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,243 @@
+#run_suite.py //End-to-end benchmark of the hot paths on synthetic Transactions tables.
+#For every size (10k, 1M and 10M rows by default the first two) a reproducible table is generated,
+#then ingest through TransactionStore, duplicate filtering, labelling, the fraud wallet cross-check,
+#the streaming dataset build, training and scoring are timed one after the other. Downloading a
+#wallet from the mock Polygonscan server is timed once. Each step records seconds, rows/s, peak
+#RSS and the profiling stages and counters it went through, and the run is saved as JSON under
+#benchmarks/results, named after the commit, so runs can be compared with benchmarks.compare.
+#Run from the repository root: python -m benchmarks.run_suite --sizes 10k 1m 10m//
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('POLYSCAN_API_KEY', 'mock')
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+
+import batch_score
+import concurrent_fetcher
+import dataset_builder
+import forest_engine
+import fraud_wallet_list
+import memory_usage
+import polygonscan_client
+import profiling
+import transaction_data_pipeline
+import transaction_store
+from benchmarks import synthetic
+from benchmarks.mock_polygonscan import make_dense_wallet_chain, start_mock_server
+
+results_dir = os.path.join('benchmarks', 'results')
+
+# Same columns as main.train for method a
+feature_columns = ['gasUsed', 'value', 'confirmations', 'nonce', 'txreceipt_status', 'gasPrice', 'cumulativeGasUsed',
+                   'fromAddress', 'toAddress']
+
+
+class Step:
+    """Times one benchmark step and collects the profiling stages and counters recorded inside it."""
+
+    def __init__(self, results, name):
+        self.results = results
+        self.name = name
+        self.rows = None
+        self.extra = {}
+
+    def __enter__(self):
+        profiling.reset()
+        self.monitor = memory_usage.PeakRSSMonitor().__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        self.monitor.__exit__(*exc_info)
+        inner = profiling.report()
+        self.results[self.name] = dict({
+            'seconds': round(seconds, 4),
+            'rows': self.rows,
+            'rows_per_second': round(self.rows / seconds) if self.rows and seconds else None,
+            'peak_rss_bytes': self.monitor.peak,
+            'stages': inner['stages'],
+            'counters': inner['counters'],
+        }, **self.extra)
+        rate = f"{self.rows / seconds:12.0f} rows/s" if self.rows and seconds else ''
+        print(f"  {self.name:<20} {seconds:9.2f}s {rate:>19}  peak RSS {memory_usage.format_bytes(self.monitor.peak)}")
+        return False
+
+
+def bench_size(rows, args, workdir):
+    results = {}
+    table = synthetic.SyntheticTable(rows, seed=args.seed)
+    database = os.path.join(workdir, 'transactions.db')
+    fraud_database = synthetic.write_fraud_wallets(table.fraud_wallets(), os.path.join(workdir, 'fraud_wallets.db'))
+    fraud_wallets = fraud_wallet_list.FraudWalletList(fraud_database)
+
+    with Step(results, 'generate') as step:
+        synthetic.write_database(table, database, args.chunk_size)
+        step.rows = rows
+
+    # Ingest goes through the real write path: txlist pages, dedup, Edges and WalletFeatures upkeep
+    ingest_rows = min(rows, args.ingest_rows)
+    pages = []
+    for chunk in synthetic.SyntheticTable(ingest_rows, seed=args.seed, addresses=table.address_count).chunks(1000):
+        pages.append(synthetic.to_txlist(chunk))
+    store = transaction_store.TransactionStore(os.path.join(workdir, 'ingest.db'))
+    with Step(results, 'ingest') as step:
+        step.rows = sum(len(store.save(page)) for page in pages)
+    with Step(results, 'dedup') as step:
+        # Every row is already stored, so this is the cost of filtering a re-fetched history
+        step.extra['rows_written'] = sum(len(store.save(page)) for page in pages)
+        step.rows = ingest_rows
+    store.close()
+    del pages
+
+    # The steps of create_dataset_from_df, chunk by chunk so every size fits in memory
+    conn = sqlite3.connect(database)
+    query = f"SELECT {', '.join(feature_columns)} FROM Transactions"
+    chunks = pd.read_sql_query(query, conn, chunksize=args.chunk_size)
+    timings = {'load': 0.0, 'labeling': 0.0, 'fraud_cross_check': 0.0}
+    flag_counts = pd.Series(dtype=np.int64)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        timings['load'] += time.perf_counter() - start
+        if chunk is None:
+            break
+        start = time.perf_counter()
+        fraud_wallet_list.flag_fraud_columns(chunk, fraud_wallets)
+        timings['fraud_cross_check'] += time.perf_counter() - start
+        start = time.perf_counter()
+        flags = transaction_data_pipeline.label_transactions(chunk, 'a')
+        timings['labeling'] += time.perf_counter() - start
+        flag_counts = flag_counts.add(pd.Series(flags).value_counts(), fill_value=0)
+    conn.close()
+    for name, seconds in timings.items():
+        results[name] = {'seconds': round(seconds, 4), 'rows': rows, 'rows_per_second': round(rows / seconds) if seconds else None}
+        print(f"  {name:<20} {seconds:9.2f}s {rows / seconds:12.0f} rows/s")
+    results['labeling']['flag_counts'] = {flag: int(count) for flag, count in flag_counts.items()}
+
+    output_dir = os.path.join(workdir, 'dataset')
+    with Step(results, 'dataset_build') as step:
+        metadata = dataset_builder.build_dataset(database, feature_columns, 'a', output_dir, args.chunk_size,
+                                                 fraud_wallets_path=fraud_database)
+        step.rows = metadata['rows']
+
+    dataset = dataset_builder.load_dataset(output_dir)
+    train_rows = min(rows, args.train_rows)
+    sample = np.sort(np.random.default_rng(args.seed).choice(len(dataset.target), train_rows, replace=False))
+    with Step(results, 'training') as step:
+        clf = RandomForestClassifier(n_estimators=args.trees, random_state=42)
+        clf.fit(dataset.data[sample], dataset.target[sample])
+        step.rows = train_rows
+        step.extra['trees'] = args.trees
+    artifact = {'model': clf, 'feature_columns': dataset.feature_names, 'engine': forest_engine.compile_forest(clf)}
+
+    # Scoring as batch_score does it: every transaction of a set of wallets, loaded through the address indexes
+    wallets = list(np.random.default_rng(args.seed).choice(table.addresses, min(args.score_wallets, len(table.addresses)),
+                                                           replace=False))
+    conn = sqlite3.connect(database)
+    with Step(results, 'scoring') as step:
+        with profiling.stage('load_transactions') as stage:
+            transactions_df = pd.concat([
+                pd.read_sql_query("SELECT * FROM Transactions WHERE fromAddress = ? OR toAddress = ?", conn,
+                                  params=(wallet, wallet)) for wallet in wallets], ignore_index=True)
+            stage.rows = len(transactions_df)
+        batch_score.predict(artifact, transactions_df, fraud_wallets)
+        step.rows = len(transactions_df)
+        step.extra['wallets'] = len(wallets)
+    conn.close()
+    return results
+
+
+def bench_fetch(args):
+    """Download one dense wallet from the mock server without latency: the client's own overhead."""
+    results = {}
+    wallet, chain = make_dense_wallet_chain(seed=args.seed, transactions=args.fetch_transactions)
+    server = start_mock_server(chain)
+    polygonscan_client.api_url = server.url
+    polygonscan_client.cache_path = ''
+    polygonscan_client.set_rate_limit(1000, capacity=10)
+    with Step(results, 'fetch') as step:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            transactions, errors = concurrent_fetcher.fetch_wallet_partitioned(wallet, 0, chain.head_block, 1000, executor)
+        step.rows = len(transactions)
+        step.extra['errors'] = len(errors)
+    server.shutdown()
+    return results
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                                    text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', nargs='+', default=['10k', '1m'], help="Table sizes, e.g. 10k 1m 10m")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=100000, help="Rows per chunk when reading the table")
+    parser.add_argument('--ingest-rows', type=int, default=200000, help="Cap on rows ingested through TransactionStore")
+    parser.add_argument('--train-rows', type=int, default=200000, help="Cap on rows the RandomForest is trained on")
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--score-wallets', type=int, default=200)
+    parser.add_argument('--fetch-transactions', type=int, default=20000)
+    parser.add_argument('--output', help="JSON file to write (default: benchmarks/results/<time>_<commit>.json)")
+    parser.add_argument('--workdir', help="Directory for the generated databases (default: a temporary directory)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    commit, dirty = git_commit()
+    run = {
+        'commit': commit,
+        'dirty': dirty,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'args': vars(args),
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for size in args.sizes:
+            rows = synthetic.parse_size(size)
+            print(f"{rows} rows")
+            size_dir = os.path.join(workdir, str(rows))
+            os.makedirs(size_dir)
+            run['results'][size.lower()] = bench_size(rows, args, size_dir)
+    print("mock Polygonscan")
+    run['results']['api'] = bench_fetch(args)
+
+    output = args.output
+    if not output:
+        if not os.path.exists(results_dir):
+            os.makedirs(results_dir)
+        output = os.path.join(results_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{commit or 'unknown'}{'-dirty' if dirty else ''}.json")
+    with open(output, 'w') as file:
+        json.dump(run, file, indent=4)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
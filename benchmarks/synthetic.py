@@ -0,0 +1,149 @@
+#synthetic.py //Synthetic Transactions tables for the benchmark suite.
+#Columns follow the real schema and their distributions are fitted to the quantiles of
+#training.csv: most transfers use 21000 gas, values are log-normal around 2e21 wei with 10% zero
+#value contract calls, gas prices cluster around 150 gwei, nonces and transaction indexes are
+#heavy-tailed and recent blocks are denser. A few hub addresses (exchanges, contracts) take part
+#in most transactions. Rows are generated in vectorized chunks with a fixed seed, so every run
+#and every commit benchmarks the same table//
+
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import transaction_store
+
+first_block = 18676540
+head_block = 61300000
+genesis_timestamp = 1594090000  # timestamp of block 0 at 2 seconds per block
+zero_value_share = 0.1
+fraud_share = 0.002  # of the address population
+
+
+def parse_size(size):
+    """'10k', '1m', '10M' or '2500' -> number of rows."""
+    size = str(size).strip().lower()
+    multiplier = {'k': 10**3, 'm': 10**6}.get(size[-1:], 1)
+    return int(float(size.rstrip('km')) * multiplier)
+
+
+def make_addresses(rng, count):
+    raw = np.frombuffer(rng.bytes(20 * count), dtype='S20')
+    return np.array(['0x' + address.hex() for address in raw], dtype=object)
+
+
+def make_hashes(rng, count):
+    raw = np.frombuffer(rng.bytes(32 * count), dtype='S32')
+    return np.array(['0x' + digest.hex() for digest in raw], dtype=object)
+
+
+def pick_addresses(rng, addresses, count):
+    """Power-law choice: the first addresses of the population are the busiest."""
+    return addresses[(len(addresses) * rng.random(count) ** 3).astype(np.int64)]
+
+
+def log_normal_integers(rng, median, sigma, count, low, high):
+    return np.clip(np.rint(rng.lognormal(np.log(median), sigma, count)), low, high).astype(np.int64)
+
+
+def generate_chunk(rng, addresses, rows):
+    """One DataFrame of `rows` transactions with the columns of the Transactions table."""
+    blocks = first_block + (rng.beta(3.0, 1.3, rows) * (head_block - first_block)).astype(np.int64)
+    values = np.minimum(rng.lognormal(np.log(2e21), 4.0, rows), 1e26)
+    values[rng.random(rows) < zero_value_share] = 0
+    values = np.floor(values)
+
+    gas = np.where(rng.random(rows) < 0.75, 21000, log_normal_integers(rng, 150000, 1.2, rows, 21000, 30000000))
+    gas_used = np.where(gas == 21000, 21000, (gas * rng.uniform(0.3, 1.0, rows)).astype(np.int64))
+    is_error = (rng.random(rows) < 0.0023).astype(np.int64)
+
+    wei = [int(value) for value in values]
+    return pd.DataFrame({
+        'hash': make_hashes(rng, rows),
+        'nonce': log_normal_integers(rng, 18, 2.5, rows, 0, 200000),
+        'blockHash': make_hashes(rng, rows),
+        'blockNumber': blocks,
+        'transactionIndex': log_normal_integers(rng, 11, 1.3, rows, 0, 600),
+        'fromAddress': pick_addresses(rng, addresses, rows),
+        'toAddress': pick_addresses(rng, addresses, rows),
+        'value': values,
+        'value_wei': [transaction_store.wei_to_blob(amount) for amount in wei],
+        'gas': gas,
+        'gasPrice': log_normal_integers(rng, 150e9, 0.45, rows, 10**9, 5 * 10**12),
+        'isError': is_error,
+        'txreceipt_status': 1 - is_error,
+        'input': np.where(gas == 21000, '0x', '0xa9059cbb'),
+        'contractAddress': '',
+        'cumulativeGasUsed': np.maximum(log_normal_integers(rng, 1.46e6, 1.55, rows, 21000, 30000000), gas_used),
+        'gasUsed': gas_used,
+        'confirmations': head_block - blocks,
+        'timestamp': genesis_timestamp + blocks * 2,
+    })
+
+
+class SyntheticTable:
+    """A reproducible table: the same seed and row count always give the same rows."""
+
+    def __init__(self, rows, seed=0, addresses=None):
+        self.rows = rows
+        self.seed = seed
+        # About ten transactions per address, like the crawled data
+        self.address_count = addresses or max(100, rows // 10)
+        self.addresses = make_addresses(np.random.default_rng([seed, 0]), self.address_count)
+
+    def chunks(self, chunk_size=100000):
+        rng = np.random.default_rng([self.seed, 1])
+        for start in range(0, self.rows, chunk_size):
+            yield generate_chunk(rng, self.addresses, min(chunk_size, self.rows - start))
+
+    def fraud_wallets(self):
+        """A fixed sample of the population, busy hubs included, to use as known fraud wallets."""
+        rng = np.random.default_rng([self.seed, 2])
+        count = max(1, int(self.address_count * fraud_share))
+        return rng.choice(self.addresses, count, replace=False)
+
+
+def write_database(table, path, chunk_size=100000):
+    """Write a SyntheticTable as the Transactions table of a new database, with its indexes.
+
+    Only Transactions is written: the Edges and WalletFeatures tables are left to the migration
+    that TransactionStore runs when it first opens the database.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute(transaction_store.TRANSACTIONS_SCHEMA)
+    columns = None
+    for chunk in table.chunks(chunk_size):
+        columns = columns or ', '.join(chunk.columns)
+        placeholders = ', '.join('?' * len(chunk.columns))
+        conn.executemany(f"INSERT INTO Transactions ({columns}) VALUES ({placeholders})",
+                         chunk.itertuples(index=False, name=None))
+    conn.executescript(transaction_store.TRANSACTIONS_INDEXES)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def write_fraud_wallets(addresses, path):
+    """A fraud_wallets.db like the real one (upper-case addresses are normalized by FraudWalletList)."""
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE fraud_wallets (address TEXT)")
+    conn.executemany("INSERT INTO fraud_wallets VALUES (?)", [(address,) for address in addresses])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def to_txlist(chunk):
+    """Turn generated rows back into Polygonscan txlist entries (all strings), for ingest benchmarks."""
+    records = chunk.drop(columns=['value_wei']).rename(
+        columns={'fromAddress': 'from', 'toAddress': 'to', 'timestamp': 'timeStamp'})
+    records['value'] = [str(int(value)) for value in chunk['value']]
+    records = records.astype(str)
+    return records.to_dict('records')
@@ -0,0 +1,108 @@
+#chunked_forest.py //Trains the method a RandomForest without the training set in memory.
+#The rows of an on-disk dataset from dataset_builder are dealt out into chunks, a sub-forest is
+#fitted on each chunk as it is read from the memory-mapped features, and the trees of all of them
+#are pooled into one RandomForestClassifier. Peak memory follows the chunk size instead of the
+#table. Every chunk is dealt rows of every flag, so the sub-forests share their classes; a flag
+#too rare to go round is copied into every chunk instead. The test rows are predicted chunk by chunk too. Each tree sees only its own chunk, so with more chunks
+#the trees are fitted on fewer rows than in-memory training would use.
+#Usage: python chunked_forest.py Datasets/method_a --chunk-rows 1000000 [--trees 100]//
+
+import argparse
+import logging
+import math
+import os
+import time
+
+import numpy as np
+from sklearn import metrics
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+
+import dataset_builder
+import memory_usage
+import profiling
+
+
+def split(codes, test_size=0.3, random_state=1):
+    """Stratified train/test split of the row numbers of a dataset, each half sorted for reads in file order."""
+    train_rows, test_rows = train_test_split(np.arange(len(codes)), test_size=test_size, random_state=random_state,
+                                             stratify=np.asarray(codes))
+    return np.sort(train_rows), np.sort(test_rows)
+
+
+def deal(rows, codes, chunk_count, random_state=42):
+    """Split rows into chunk_count chunks with the same share of every flag, each sorted.
+
+    The rows of a flag with fewer rows than chunks are copied into every chunk, so each still has
+    every flag and grows by fewer than chunk_count rows per such flag.
+    """
+    rng = np.random.default_rng(random_state)
+    row_codes = np.asarray(codes[rows])
+    parts = [[] for _ in range(chunk_count)]
+    for code in np.unique(row_codes):
+        members = rng.permutation(rows[row_codes == code])
+        for i in range(chunk_count):
+            parts[i].append(members if len(members) < chunk_count else members[i::chunk_count])
+    return [np.sort(np.concatenate(part)) for part in parts]
+
+
+def fit(data, codes, target_names, rows, n_estimators=100, chunk_rows=1000000, random_state=42, n_jobs=-1):
+    """Fit a RandomForestClassifier on the given rows of a dataset, one chunk of rows in memory at a time.
+
+    The n_estimators trees are shared out over the chunks, at least one per chunk; with fewer trees
+    than chunk_rows allows for, the chunks grow past chunk_rows and a warning says by how much.
+    """
+    target_names = np.asarray(target_names)
+    chunk_count = max(1, math.ceil(len(rows) / chunk_rows))
+    if chunk_count > n_estimators:
+        chunk_count = n_estimators
+        logging.warning(f"{n_estimators} trees can't cover chunks of {chunk_rows} rows; "
+                        f"fitting {chunk_count} chunks of about {math.ceil(len(rows) / chunk_count)} rows")
+
+    forest = None
+    for i, chunk in enumerate(deal(rows, codes, chunk_count, random_state)):
+        trees = n_estimators // chunk_count + (i < n_estimators % chunk_count)
+        with profiling.stage('fit_chunk') as stage:
+            X = np.asarray(data[chunk])
+            y = target_names[codes[chunk]]
+            sub_forest = RandomForestClassifier(n_estimators=trees, random_state=random_state + i, n_jobs=n_jobs)
+            sub_forest.fit(X, y)
+            stage.rows = len(chunk)
+        del X, y
+        if forest is None:
+            forest = sub_forest
+        elif not np.array_equal(forest.classes_, sub_forest.classes_):
+            raise ValueError(f"Chunk {i} has flags {sub_forest.classes_}, expected {forest.classes_}")
+        else:
+            forest.estimators_ += sub_forest.estimators_
+    forest.n_estimators = len(forest.estimators_)
+    return forest
+
+
+def predict(clf, data, rows, chunk_rows=1000000):
+    """Predicted flags of the given rows of a dataset, read chunk by chunk."""
+    predictions = [clf.predict(np.asarray(data[rows[start:start + chunk_rows]]))
+                   for start in range(0, len(rows), chunk_rows)]
+    return np.concatenate(predictions) if predictions else np.array([], dtype=object)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a RandomForest from sub-forests fitted on chunks of a built dataset.")
+    parser.add_argument('dataset', nargs='?', default=os.path.join(dataset_builder.datasets_dir, 'method_a'),
+                        help="Directory written by dataset_builder.py")
+    parser.add_argument('--chunk-rows', type=int, default=1000000, help="Training rows in memory at a time")
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--jobs', type=int, default=-1)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    with memory_usage.PeakRSSMonitor() as monitor:
+        dataset = dataset_builder.load_dataset(args.dataset, decode_target=False)
+        train_rows, test_rows = split(dataset.target)
+        clf = fit(dataset.data, dataset.target, dataset.target_names, train_rows, args.trees, args.chunk_rows,
+                  n_jobs=args.jobs)
+        y_pred = predict(clf, dataset.data, test_rows, args.chunk_rows)
+    y_test = np.asarray(dataset.target_names)[dataset.target[test_rows]]
+    print(f"{len(train_rows)} training rows, {len(clf.estimators_)} trees in {time.time() - start_time:.1f}s, "
+          f"peak RSS {memory_usage.format_bytes(monitor.peak)} (+{memory_usage.format_bytes(monitor.peak - monitor.start)})")
+    print("Accuracy:", metrics.accuracy_score(y_test, y_pred))
@@ -0,0 +1,168 @@
+#columnar.py //Parquet copies of the Transactions table, the training CSVs and scoring results.
+#A Parquet file stores every column typed and compressed on its own, so loading only the feature
+#columns reads only those columns from disk (projection pushdown), and row groups carry min/max
+#statistics so a block range filter skips the row groups outside it (predicate pushdown). The
+#training CSVs are converted once, with their column types, and the copy is used until the CSV
+#changes. Needs pyarrow; without it the training sets are read from CSV as before.
+#Usage: python columnar.py export Database/transactions.db Datasets/transactions.parquet
+#       python columnar.py import training.csv
+#       python columnar.py read Datasets/transactions.parquet --columns value gasUsed --blocks 0 1000000//
+
+import argparse
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # optional, see available()
+    pa = None
+
+import memory_usage
+
+# Rows per Parquet row group: the unit a block range filter can skip
+row_group_size = 131072
+
+# Arrow type of each SQLite column type of the Transactions table
+sqlite_types = {'INTEGER': 'int64', 'REAL': 'float64', 'TEXT': 'string', 'BLOB': 'binary'}
+
+
+def available():
+    return pa is not None
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("The Parquet path needs pyarrow: pip install pyarrow")
+
+
+def transactions_schema(conn):
+    """Arrow schema of the Transactions table, from its declared SQLite column types."""
+    require_pyarrow()
+    fields = []
+    for _, name, column_type, _, _, _ in conn.execute("PRAGMA table_info(Transactions)"):
+        fields.append(pa.field(name, getattr(pa, sqlite_types.get(column_type.upper(), 'string'))()))
+    return pa.schema(fields)
+
+
+def export_transactions(database_path, output_path, chunk_size=100000, columns=None, sort=True):
+    """Write the Transactions table (or some of its columns) to a Parquet file, chunk by chunk.
+
+    With sort the rows are written in block order, so every row group covers a narrow block range
+    and block range filters skip most of the file. Returns the number of rows written.
+    """
+    require_pyarrow()
+    conn = sqlite3.connect(database_path)
+    schema = transactions_schema(conn)
+    if columns:
+        schema = pa.schema([schema.field(column) for column in columns])
+    query = f"SELECT {', '.join(schema.names)} FROM Transactions"
+    if sort:
+        query += " ORDER BY blockNumber, transactionIndex"
+
+    rows = 0
+    directory = os.path.dirname(output_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with pq.ParquetWriter(output_path + '.tmp', schema, compression='zstd') as writer:
+        for chunk in pd.read_sql_query(query, conn, chunksize=chunk_size):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False),
+                               row_group_size=row_group_size)
+            rows += len(chunk)
+    conn.close()
+    # A crash never leaves a half-written file under the real name
+    os.replace(output_path + '.tmp', output_path)
+    return rows
+
+
+def block_filter(start_block=None, end_block=None):
+    """Parquet filter for start_block <= blockNumber <= end_block, or None for every block."""
+    filters = []
+    if start_block is not None:
+        filters.append(('blockNumber', '>=', start_block))
+    if end_block is not None:
+        filters.append(('blockNumber', '<=', end_block))
+    return filters or None
+
+
+def read_transactions(path, columns=None, start_block=None, end_block=None):
+    """Load the given columns of an exported Transactions file, only for blocks in the range."""
+    require_pyarrow()
+    table = pq.read_table(path, columns=columns, filters=block_filter(start_block, end_block))
+    return table.to_pandas()
+
+
+def parquet_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+
+def import_csv(csv_path, output_path=None):
+    """Convert a CSV to Parquet with the column types inferred once, e.g. 3.00E+18 as a float64.
+
+    Empty fields become nulls. Returns the path written.
+    """
+    require_pyarrow()
+    output_path = output_path or parquet_path(csv_path)
+    table = pa_csv.read_csv(csv_path, convert_options=pa_csv.ConvertOptions(strings_can_be_null=True))
+    pq.write_table(table, output_path + '.tmp', compression='zstd', row_group_size=row_group_size)
+    os.replace(output_path + '.tmp', output_path)
+    return output_path
+
+
+def read_training_set(csv_path, columns=None):
+    """Load a training CSV, or only some of its columns, through its Parquet copy when pyarrow is there.
+
+    The copy is made on first use and again whenever the CSV is newer than it.
+    """
+    if pa is None:
+        return pd.read_csv(csv_path, usecols=columns)
+    path = parquet_path(csv_path)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(csv_path):
+        import_csv(csv_path, path)
+    return pq.read_table(path, columns=columns).to_pandas()
+
+
+def write_results(results_df, path):
+    """Write scoring results as Parquet when the path ends in .parquet, otherwise as CSV."""
+    if path.endswith('.parquet'):
+        require_pyarrow()
+        pq.write_table(pa.Table.from_pandas(results_df, preserve_index=False), path, compression='zstd')
+    else:
+        results_df.to_csv(path, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parquet export, import and reads of transactions.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help="Export a Transactions table to Parquet")
+    export_parser.add_argument('database')
+    export_parser.add_argument('output')
+    export_parser.add_argument('--columns', nargs='+', help="Columns to export (default: all)")
+    export_parser.add_argument('--chunk-size', type=int, default=100000)
+    export_parser.add_argument('--unsorted', action='store_true', help="Keep table order instead of block order")
+    import_parser = commands.add_parser('import', help="Convert a training CSV to Parquet")
+    import_parser.add_argument('csv')
+    import_parser.add_argument('output', nargs='?', help="Parquet file to write (default: next to the CSV)")
+    read_parser = commands.add_parser('read', help="Time loading columns and a block range of a Parquet file")
+    read_parser.add_argument('path')
+    read_parser.add_argument('--columns', nargs='+')
+    read_parser.add_argument('--blocks', type=int, nargs=2, metavar=('START', 'END'), help="Block range to load")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.command == 'export':
+        rows = export_transactions(args.database, args.output, args.chunk_size, args.columns, sort=not args.unsorted)
+        print(f"Exported {rows} rows to {args.output} ({memory_usage.format_bytes(os.path.getsize(args.output))}) "
+              f"in {time.time() - start_time:.1f}s")
+    elif args.command == 'import':
+        path = import_csv(args.csv, args.output)
+        print(f"Wrote {path} ({memory_usage.format_bytes(os.path.getsize(path))}, CSV "
+              f"{memory_usage.format_bytes(os.path.getsize(args.csv))}) in {time.time() - start_time:.2f}s")
+    else:
+        start_block, end_block = args.blocks or (None, None)
+        df = read_transactions(args.path, args.columns, start_block, end_block)
+        print(f"Loaded {len(df)} rows x {len(df.columns)} columns in {time.time() - start_time:.2f}s")
@@ -0,0 +1,290 @@
+#concurrent_fetcher.py //Fetches many wallets and block ranges from Polygonscan at the same time.
+#All requests go through the shared rate limiter in polygonscan_client, so the total request
+#rate stays at the API key's quota no matter how many threads are running//
+
+import json
+import logging
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+import requests
+
+import polygonscan_client
+
+max_transactions_per_query = 10000  # Polygonscan limit
+
+
+class FetchError(str):
+    """Error message of a failed fetch that also says which block range is missing."""
+
+    def __new__(cls, message, start_block, end_block):
+        error = super().__new__(cls, message)
+        error.start_block = start_block
+        error.end_block = end_block
+        return error
+
+
+def split_block_range(start_block, end_block, parts):
+    """Split [start_block, end_block] into at most `parts` contiguous, non-overlapping ranges."""
+    parts = max(1, min(parts, end_block - start_block + 1))
+    step = (end_block - start_block + 1) // parts
+    ranges = []
+    for i in range(parts):
+        range_start = start_block + i * step
+        range_end = end_block if i == parts - 1 else range_start + step - 1
+        ranges.append((range_start, range_end))
+    return ranges
+
+
+def fetch_page(wallet_address, start_block, end_block, page, chunk_size):
+    """Fetch one txlist page in ascending block order. Returns (transactions, error).
+
+    An error is a FetchError covering [start_block, end_block], the part of the range not saved yet.
+    """
+    query_params = {
+        'module': 'account',
+        'action': 'txlist',
+        'address': wallet_address,
+        'startblock': start_block,
+        'endblock': end_block,
+        'sort': 'asc',
+        'page': page,
+        'offset': chunk_size,
+    }
+    try:
+        tx_data = polygonscan_client.get_json(query_params)
+    except requests.RequestException as e:
+        return [], FetchError(f"Request error: {e}", start_block, end_block)
+    except json.JSONDecodeError:
+        return [], FetchError("Failed to decode JSON from response.", start_block, end_block)
+
+    if not ('result' in tx_data and isinstance(tx_data['result'], list)):
+        return [], FetchError(f"Invalid or empty response: {tx_data}", start_block, end_block)
+    return tx_data['result'], None
+
+
+def fetch_block_range(wallet_address, start_block, end_block, chunk_size):
+    """Fetch every transaction of a wallet in [start_block, end_block].
+
+    Pages through the range like populate_single_wallet.fetch_transactions. When the 10,000
+    result cap is hit it starts again from the highest block seen, since that block may only
+    have been partly returned; the repeats are dropped by fetch_wallet's hash dedup.
+    Returns (transactions, error) where error is None when the whole range was fetched.
+    """
+    transactions = []
+    while start_block <= end_block:
+        page = 1
+        transactions_fetched = 0
+        highest_block = None
+        while True:
+            batch, error = fetch_page(wallet_address, start_block, end_block, page, chunk_size)
+            if error:
+                return transactions, error
+            if not batch:
+                break
+
+            transactions.extend(batch)
+            transactions_fetched += len(batch)
+            highest_block = max(int(tx['blockNumber']) for tx in batch)
+            page += 1
+
+            if len(batch) < chunk_size:
+                break
+            if transactions_fetched >= max_transactions_per_query:
+                break
+
+        if transactions_fetched < max_transactions_per_query or highest_block is None:
+            break
+        if highest_block <= start_block:
+            return transactions, FetchError(f"More than {max_transactions_per_query} transactions in block {start_block}",
+                                            start_block, end_block)
+        start_block = highest_block
+    return transactions, None
+
+
+def fetch_wallet(wallet_address, start_block, end_block, chunk_size, ranges_per_wallet=1, executor=None):
+    """Fetch one wallet, optionally splitting its block range so several ranges are in flight.
+
+    Returns (transactions, errors) with transactions deduplicated by hash.
+    """
+    ranges = split_block_range(start_block, end_block, ranges_per_wallet)
+    if executor is None or len(ranges) == 1:
+        results = [fetch_block_range(wallet_address, s, e, chunk_size) for s, e in ranges]
+    else:
+        futures = [executor.submit(fetch_block_range, wallet_address, s, e, chunk_size) for s, e in ranges]
+        results = [future.result() for future in futures]
+
+    seen = set()
+    transactions = []
+    errors = []
+    for batch, error in results:
+        for tx in batch:
+            if tx['hash'] not in seen:
+                seen.add(tx['hash'])
+                transactions.append(tx)
+        if error:
+            errors.append(error)
+    return transactions, errors
+
+
+def split_by_density(start_block, end_block, density, target=max_transactions_per_query // 2, max_parts=4):
+    """Split [start_block, end_block] into ranges expected to hold about `target` transactions each.
+
+    `density` is transactions per block as seen so far; the target stays under the 10,000 cap so a
+    range that turns out a little denser than estimated still fits in one query window. Activity
+    is rarely uniform, so at most `max_parts` ranges are made at a time and dense ones are split
+    again when they are fetched; an empty range still costs a request.
+    """
+    expected = density * (end_block - start_block + 1)
+    return split_block_range(start_block, end_block, min(max_parts, max(1, math.ceil(expected / target))))
+
+
+def fetch_partition(wallet_address, start_block, end_block, chunk_size):
+    """Fetch one partition of a wallet's history, or as much of it as one query window allows.
+
+    Returns (transactions, remaining_ranges, error). When the partition holds more than a page
+    and looks too dense for one window, or the 10,000 cap is reached, only the blocks below the
+    highest block seen are kept, since those are known to be complete. The rest of the range is
+    handed back, split by the density observed so far, so the partitions never overlap.
+    """
+    transactions = []
+    page = 1
+    while True:
+        batch, error = fetch_page(wallet_address, start_block, end_block, page, chunk_size)
+        if error:
+            return transactions, [], error
+        transactions.extend(batch)
+        if len(batch) < chunk_size:
+            return transactions, [], None
+
+        highest_block = max(int(tx['blockNumber']) for tx in batch)
+        density = len(transactions) / (highest_block - start_block + 1)
+        window_full = page * chunk_size >= max_transactions_per_query
+        # Nothing can be split off while the first block is all we have seen, so keep paging
+        too_dense = (page == 1 and highest_block > start_block
+                     and density * (end_block - start_block + 1) > max_transactions_per_query)
+        if window_full or too_dense:
+            break
+        page += 1
+
+    if highest_block <= start_block:
+        return transactions, [], FetchError(f"More than {max_transactions_per_query} transactions in block {start_block}",
+                                            start_block, end_block)
+
+    complete = [tx for tx in transactions if int(tx['blockNumber']) < highest_block]
+    return complete, split_by_density(highest_block, end_block, density), None
+
+
+def fetch_wallet_partitioned(wallet_address, start_block, end_block, chunk_size, executor):
+    """Download a large wallet's history as block-range partitions fetched in parallel.
+
+    The first request shows how dense the history is; dense ranges are split further and every
+    new partition is submitted to `executor` as soon as it is known, so call this from outside
+    the executor's own threads. Returns (transactions,
+    errors) like fetch_wallet, with transactions in block order and deduplicated by hash.
+    """
+    pending = {executor.submit(fetch_partition, wallet_address, start_block, end_block, chunk_size)}
+    batches = []
+    errors = []
+    partitions = 0
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            partitions += 1
+            transactions, remaining_ranges, error = future.result()
+            batches.append(transactions)
+            if error:
+                errors.append(error)
+            for range_start, range_end in remaining_ranges:
+                pending.add(executor.submit(fetch_partition, wallet_address, range_start, range_end, chunk_size))
+
+    seen = set()
+    transactions = []
+    for tx in sorted((tx for batch in batches for tx in batch),
+                     key=lambda tx: (int(tx['blockNumber']), int(tx['transactionIndex']))):
+        if tx['hash'] not in seen:
+            seen.add(tx['hash'])
+            transactions.append(tx)
+    logging.info(f"Fetched {len(transactions)} transactions for {wallet_address} in {partitions} partitions")
+    return transactions, errors
+
+
+def fetch_wallets(wallets, start_block, end_block, chunk_size, max_workers=8, start_blocks=None):
+    """Fetch several wallets concurrently.
+
+    `start_blocks` can map a wallet to its own first block (e.g. the block after its last sync);
+    other wallets start at start_block. Yields (wallet_address, transactions, errors) as each
+    wallet finishes, so the caller can write results to the database from a single thread.
+    """
+    start_blocks = start_blocks or {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_wallet, wallet, start_blocks.get(wallet, start_block), end_block, chunk_size): wallet
+            for wallet in wallets
+        }
+        for future in as_completed(futures):
+            transactions, errors = future.result()
+            yield futures[future], transactions, errors
+
+
+def crawl(wallet_address, start_block, end_block, chunk_size, save, log_error, max_depth=1,
+          max_workers=8, processed_wallets=None):
+    """Concurrent version of populate_training_data.fetch_tx_by_address.
+
+    The root wallet is fetched as parallel block-range partitions, then every
+    neighbour at the next depth is fetched at the same time. Neighbours start from block 0
+    instead of asking the API for their first block, which saves one request per wallet.
+    `save(transactions)` is called from this thread only; it returns the number of new rows.
+    """
+    if processed_wallets is None:
+        processed_wallets = set()
+
+    start_time = time.time()
+    total_transactions = 0
+    api_calls_before = polygonscan_client.request_count()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        processed_wallets.add(wallet_address)
+        transactions, errors = fetch_wallet_partitioned(wallet_address, start_block, end_block, chunk_size, executor)
+        for error in errors:
+            log_error(wallet_address, error)
+        total_transactions += save(transactions)
+        frontier = neighbours(transactions, processed_wallets)
+
+        depth = 1
+        while frontier and depth <= max_depth:
+            processed_wallets.update(frontier)
+            futures = {
+                executor.submit(fetch_wallet, wallet, 0, end_block, chunk_size): wallet
+                for wallet in frontier
+            }
+            next_frontier = set()
+            for future in as_completed(futures):
+                wallet = futures[future]
+                transactions, errors = future.result()
+                for error in errors:
+                    log_error(wallet, error)
+                total_transactions += save(transactions)
+                logging.info(f"Fetched {len(transactions)} transactions for {wallet} at depth {depth}")
+                if depth < max_depth:
+                    next_frontier |= neighbours(transactions, processed_wallets)
+            frontier = next_frontier - processed_wallets
+            depth += 1
+
+    total_time = time.time() - start_time
+    logging.info(f"Total time taken: {total_time:.2f} seconds")
+    logging.info(f"Total transactions processed: {total_transactions}")
+    logging.info(f"API calls made: {polygonscan_client.request_count() - api_calls_before}")
+    return total_transactions
+
+
+def neighbours(transactions, processed_wallets):
+    """Return the counterparties in `transactions` that have not been processed yet."""
+    new_wallets = set()
+    for tx in transactions:
+        if tx['to'] and tx['to'] not in processed_wallets:
+            new_wallets.add(tx['to'])
+        if tx['from'] and tx['from'] not in processed_wallets:
+            new_wallets.add(tx['from'])
+    return new_wallets
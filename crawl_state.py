@@ -0,0 +1,125 @@
+#crawl_state.py //Persisted crawl frontier for populate_training_data.
+#Every wallet of a crawl is stored with its depth, status and the last block whose transactions
+#are all saved, so an interrupted crawl resumes where it stopped instead of starting over//
+
+import os
+import sqlite3
+import time
+
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+
+CRAWL_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS Crawls (
+    root TEXT PRIMARY KEY,
+    end_block INTEGER NOT NULL,
+    max_depth INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS CrawlFrontier (
+    root TEXT NOT NULL,
+    address TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    start_block INTEGER,
+    last_block INTEGER,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (root, address)
+);
+CREATE INDEX IF NOT EXISTS idx_crawl_frontier_status ON CrawlFrontier (root, status, depth);
+"""
+
+
+def crawl_state_path(database):
+    """The crawl state of Database/transactions.db lives next to it in Database/transactions_crawl_state.db."""
+    return os.path.splitext(database)[0] + '_crawl_state.db'
+
+
+class CrawlFrontier:
+    """Wallets still to fetch, and how far each one got, for every crawl started from a root wallet."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(CRAWL_STATE_SCHEMA)
+        self.conn.commit()
+
+    def get_crawl(self, root):
+        """Return (end_block, max_depth, status) of a crawl, or None if it was never started."""
+        return self.conn.execute("SELECT end_block, max_depth, status FROM Crawls WHERE root = ?", (root,)).fetchone()
+
+    def start_crawl(self, root, start_block, end_block, max_depth):
+        """Register a new crawl with the root wallet as its first pending entry."""
+        now = int(time.time())
+        with self.conn:
+            self.conn.execute("DELETE FROM CrawlFrontier WHERE root = ?", (root,))
+            self.conn.execute("INSERT OR REPLACE INTO Crawls (root, end_block, max_depth, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                              (root, end_block, max_depth, IN_PROGRESS, now))
+            self.conn.execute("INSERT INTO CrawlFrontier (root, address, depth, status, start_block, last_block, updated_at) VALUES (?, ?, 0, ?, ?, NULL, ?)",
+                              (root, root, PENDING, start_block, now))
+
+    def next_wallet(self, root):
+        """Return (address, depth, start_block, last_block) of the next wallet to fetch, shallowest first."""
+        return self.conn.execute("""
+            SELECT address, depth, start_block, last_block FROM CrawlFrontier
+            WHERE root = ? AND status IN (?, ?)
+            ORDER BY depth, CASE status WHEN ? THEN 0 ELSE 1 END, address
+            LIMIT 1
+        """, (root, IN_PROGRESS, PENDING, IN_PROGRESS)).fetchone()
+
+    def retry_failed(self, root):
+        """Put the wallets that failed in an earlier run back in the queue; their last_block is kept."""
+        with self.conn:
+            self.conn.execute("UPDATE CrawlFrontier SET status = ?, updated_at = ? WHERE root = ? AND status = ?",
+                              (PENDING, int(time.time()), root, FAILED))
+
+    def set_start_block(self, root, address, start_block):
+        with self.conn:
+            self.conn.execute("UPDATE CrawlFrontier SET start_block = ?, updated_at = ? WHERE root = ? AND address = ?",
+                              (start_block, int(time.time()), root, address))
+
+    def record_page(self, root, address, last_block, new_wallets=(), depth=None):
+        """Checkpoint one saved page: blocks up to last_block are complete, and new_wallets join the frontier."""
+        now = int(time.time())
+        with self.conn:
+            self.conn.execute("UPDATE CrawlFrontier SET status = ?, last_block = ?, updated_at = ? WHERE root = ? AND address = ?",
+                              (IN_PROGRESS, last_block, now, root, address))
+            if depth is not None:
+                self.conn.executemany("""
+                    INSERT OR IGNORE INTO CrawlFrontier (root, address, depth, status, start_block, last_block, updated_at)
+                    VALUES (?, ?, ?, ?, NULL, NULL, ?)
+                """, [(root, wallet, depth, PENDING, now) for wallet in new_wallets])
+
+    def set_status(self, root, address, status):
+        with self.conn:
+            self.conn.execute("UPDATE CrawlFrontier SET status = ?, updated_at = ? WHERE root = ? AND address = ?",
+                              (status, int(time.time()), root, address))
+
+    def finish_crawl(self, root):
+        """Mark the crawl done, or failed if some wallets could not be fetched."""
+        status = FAILED if self.summary(root).get(FAILED) else DONE
+        with self.conn:
+            self.conn.execute("UPDATE Crawls SET status = ?, updated_at = ? WHERE root = ?", (status, int(time.time()), root))
+        return status
+
+    def summary(self, root):
+        """Return a {status: wallet count} dictionary for a crawl."""
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM CrawlFrontier WHERE root = ? GROUP BY status", (root,))
+        return dict(rows.fetchall())
+
+    def close(self):
+        self.conn.close()
+
+
+_frontiers = {}
+
+
+def get_frontier(database):
+    """Return the shared CrawlFrontier stored next to a transactions database."""
+    path = crawl_state_path(database)
+    if path not in _frontiers:
+        _frontiers[path] = CrawlFrontier(path)
+    return _frontiers[path]
@@ -0,0 +1,434 @@
+#dataset_builder.py //Streaming version of transaction_data_pipeline.create_dataset_from_df.
+#Transactions are read, labelled and encoded chunk by chunk and written to memory-mapped .npy
+#files, so peak memory depends on the chunk size rather than on the size of the table. Each row's
+#fraud score and flag are stored with a hash of the rules they came from, so a rerun reuses an
+#unchanged dataset, reads and labels only the rows added since, and labels the earlier rows again
+#from their stored inputs only when the rules changed.
+#Usage: python dataset_builder.py Database/transactions.db --method a [--update]//
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.utils import Bunch
+
+import fraud_proximity
+import fraud_wallet_list
+import label_stats
+import memory_usage
+import model_store
+import transaction_data_pipeline
+import transaction_store
+import wallet_features as wallet_feature_store
+
+datasets_dir = 'Datasets'
+target_names = ['green', 'orange', 'red']
+address_columns = ['fromAddress', 'toAddress']
+fraud_columns = ['is_from_fraud_wallet', 'is_to_fraud_wallet']
+# Columns the rule-based labeller scores, kept as label_inputs.npy so the rows can be labelled again
+label_columns = [rule[0] for rule in transaction_data_pipeline.FRAUD_SCORE_RULES]
+# The .npy files of a dataset
+array_dtypes = {'features': np.float32, 'target': np.int8, 'label_inputs': np.float64, 'scores': np.float64}
+
+
+def dataset_feature_names(feature_columns, method, graph_features=False, wallet_features=False):
+    """Columns of the feature matrix, in the order create_dataset_from_df produces them.
+
+    The optional fraud_proximity and then wallet_features columns come last.
+    """
+    feature_names = [column for column in feature_columns if column not in address_columns]
+    if method == 'a':
+        feature_names += fraud_columns
+    if graph_features:
+        feature_names += fraud_proximity.TRANSACTION_FEATURES
+    if wallet_features:
+        feature_names += wallet_feature_store.TRANSACTION_FEATURES
+    return feature_names
+
+
+def open_arrays(output_dir, rows, feature_count, suffix=''):
+    """Create the memory-mapped arrays of a dataset with room for `rows` rows."""
+    shapes = {'features': (rows, feature_count), 'target': (rows,), 'label_inputs': (rows, len(label_columns)),
+              'scores': (rows,)}
+    return {name: np.lib.format.open_memmap(os.path.join(output_dir, f'{name}.npy{suffix}'), mode='w+',
+                                            dtype=dtype, shape=shapes[name])
+            for name, dtype in array_dtypes.items()}
+
+
+def label_inputs(chunk):
+    """The scored columns of a chunk as float64, and whether every value survived the conversion.
+
+    Integers beyond 2**53 do not, so the flags of such rows cannot be recomputed from the stored inputs.
+    """
+    inputs = np.empty((len(chunk), len(label_columns)))
+    exact = True
+    for i, column in enumerate(label_columns):
+        values = chunk[column]
+        if pd.api.types.is_integer_dtype(values):
+            exact = exact and (len(values) == 0 or int(values.abs().max()) <= 2 ** 53)
+        elif not pd.api.types.is_float_dtype(values):
+            exact = False
+        inputs[:, i] = pd.to_numeric(values).to_numpy(dtype=np.float64)
+    return inputs, exact
+
+
+def write_chunk(arrays, offset, chunk, method, rules, feature_names):
+    """Encode and label a chunk of Transactions rows into rows offset: of the dataset arrays.
+
+    Returns whether its label inputs are exact, see label_inputs.
+    """
+    end = offset + len(chunk)
+    inputs, exact = label_inputs(chunk)
+    scores = transaction_data_pipeline.calculate_fraud_scores(chunk, method, rules)
+    arrays['features'][offset:end] = chunk[feature_names].to_numpy(dtype=np.float32)
+    arrays['label_inputs'][offset:end] = inputs
+    arrays['scores'][offset:end] = scores
+    arrays['target'][offset:end] = np.searchsorted(target_names, transaction_data_pipeline.flags_from_scores(scores))
+    return exact
+
+
+def relabel(arrays, rows, method, rules, feature_names, chunk_size=100000):
+    """Label the first `rows` rows again from their stored label inputs and fraud columns."""
+    for start in range(0, rows, chunk_size):
+        end = min(rows, start + chunk_size)
+        chunk = pd.DataFrame(arrays['label_inputs'][start:end], columns=label_columns)
+        for column in fraud_columns:
+            if column in feature_names:
+                chunk[column] = arrays['features'][start:end, feature_names.index(column)]
+        scores = transaction_data_pipeline.calculate_fraud_scores(chunk, method, rules)
+        arrays['scores'][start:end] = scores
+        arrays['target'][start:end] = np.searchsorted(target_names, transaction_data_pipeline.flags_from_scores(scores))
+
+
+def label_rules(database_path, method, fraud_wallets=None, labelled_with=None):
+    """The rules rows are labelled with now, and the hash stored with the flags.
+
+    labelled_with are the rules of the flags already stored, kept while the LabelStats stay close
+    to them (transaction_data_pipeline.settled_rules).
+    """
+    rules = transaction_data_pipeline.settled_rules(labelled_with, transaction_data_pipeline.fraud_score_rules(database_path))
+    return rules, transaction_data_pipeline.rules_hash(rules, method, fraud_wallets.version if fraud_wallets else None)
+
+
+def last_row_hash(conn, rowid):
+    row = conn.execute("SELECT hash FROM Transactions WHERE rowid = ?", (rowid,)).fetchone()
+    return row[0] if row else None
+
+
+def build_dataset(database_path, feature_columns, method, output_dir=None, chunk_size=100000,
+                  fraud_wallets_path='Database/fraud_wallets.db', graph_features=False, wallet_features=False):
+    """Label and encode the Transactions table into features.npy / target.npy under output_dir.
+
+    Features are float32, the precision the RandomForest trains at anyway, and targets are int8
+    indexes into target_names. Rows inserted while the build runs are left out. graph_features
+    adds the multi-hop fraud proximity of each row's addresses and wallet_features their
+    aggregates from the WalletFeatures table (method a only, both need addresses). Rows are labelled
+    with the database's LabelStats as they were when the build started; their fraud scores and
+    scored columns are kept in scores.npy and label_inputs.npy for update_dataset.
+    Returns the metadata written to dataset.json, including peak RSS per stage.
+    """
+    method = method.lower()
+    graph_features = graph_features and method == 'a'
+    wallet_features = wallet_features and method == 'a'
+    output_dir = output_dir or os.path.join(datasets_dir, f'method_{method}')
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    feature_names = dataset_feature_names(feature_columns, method, graph_features, wallet_features)
+    read_columns = list(dict.fromkeys(feature_columns + label_columns))
+    stages = {}
+    start_time = time.time()
+
+    if graph_features or wallet_features:
+        # Opened first: TransactionStore may still have to migrate the database to get Edges and WalletFeatures
+        transaction_store.get_store(database_path)
+
+    address_features = None
+    if graph_features:
+        with memory_usage.PeakRSSMonitor() as monitor:
+            address_features = fraud_proximity.compute_address_features(
+                database_path, fraud_wallet_list.get_fraud_wallet_list(fraud_wallets_path))
+        stages['graph_features'] = monitor
+
+    conn = sqlite3.connect(database_path)
+    try:
+        with memory_usage.PeakRSSMonitor() as monitor:
+            # Fix the set of rows up front so the row count and the chunks agree
+            max_rowid, rows = conn.execute("SELECT COALESCE(MAX(rowid), 0), COUNT(*) FROM Transactions").fetchone()
+            # Every chunk is labelled with the same stats, read once from LabelStats
+            stats_version = label_stats.load(conn)[1]
+            replaced = label_stats.replaced(conn)
+            last_hash = last_row_hash(conn, max_rowid)
+            fraud_wallets = fraud_wallet_list.get_fraud_wallet_list(fraud_wallets_path) if method == 'a' else None
+            rules, rules_hash = label_rules(database_path, method, fraud_wallets)
+            arrays = open_arrays(output_dir, rows, len(feature_names))
+        stages['prepare'] = monitor
+
+        query = f"SELECT {', '.join(read_columns)} FROM Transactions WHERE rowid <= ? ORDER BY rowid"
+        offset = 0
+        exact = True
+        with memory_usage.PeakRSSMonitor() as monitor:
+            for chunk in pd.read_sql_query(query, conn, params=(max_rowid,), chunksize=chunk_size):
+                if method == 'a':
+                    fraud_wallet_list.flag_fraud_columns(chunk, fraud_wallets)
+                if address_features is not None:
+                    fraud_proximity.add_features(chunk, address_features)
+                if wallet_features:
+                    wallet_feature_store.add_features(chunk, database_path)
+                exact = write_chunk(arrays, offset, chunk, method, rules, feature_names) and exact
+                offset += len(chunk)
+        stages['label_and_encode'] = monitor
+
+        with memory_usage.PeakRSSMonitor() as monitor:
+            for array in arrays.values():
+                array.flush()
+            flag_counts = np.bincount(arrays['target'], minlength=len(target_names))
+            del arrays
+        stages['flush'] = monitor
+    finally:
+        conn.close()
+
+    metadata = {
+        'source': database_path,
+        'method': method,
+        'fingerprint': model_store.fingerprint([database_path, fraud_wallets_path]),
+        'rows': rows,
+        'max_rowid': max_rowid,
+        'last_hash': last_hash,
+        'label_stats_version': stats_version,
+        'label_stats_replaced': replaced,
+        'fraud_wallets_version': fraud_wallets.version if fraud_wallets else None,
+        'fraud_score_rules': rules,
+        'rules_hash': rules_hash,
+        'label_inputs_exact': exact,
+        'added_rows': rows,
+        'relabelled_rows': 0,
+        'chunk_size': chunk_size,
+        'graph_features': graph_features,
+        'wallet_features': wallet_features,
+        'feature_names': feature_names,
+        'target_names': target_names,
+        'flag_counts': dict(zip(target_names, flag_counts.tolist())),
+        'seconds': round(time.time() - start_time, 3),
+        'peak_rss_bytes': {stage: monitor.peak for stage, monitor in stages.items()},
+        'peak_rss_increase_bytes': {stage: monitor.peak - monitor.start for stage, monitor in stages.items()},
+    }
+    with open(os.path.join(output_dir, 'dataset.json'), 'w') as file:
+        json.dump(metadata, file, indent=4)
+    return metadata
+
+
+def update_dataset(database_path, feature_columns, method, output_dir=None, chunk_size=100000,
+                   fraud_wallets_path='Database/fraud_wallets.db', graph_features=False, wallet_features=False):
+    """Bring a dataset built earlier up to date without reading the rows it already holds.
+
+    Rows added since are read, encoded and labelled as build_dataset does. The earlier rows keep
+    their features and flags, and are only labelled again, from label_inputs.npy, when the rules
+    hash changed, i.e. the rules did or the LabelStats drifted past transaction_data_pipeline.rules_tolerance.
+    New rows are labelled with the same rules as the earlier ones, so the dataset can differ a little
+    from a full build, which labels with the current LabelStats.
+    Returns the new metadata, or None when the dataset has to be rebuilt: other features, graph or
+    wallet features (they depend on every row), a changed fraud list, or rows deleted or changed in place.
+    """
+    method = method.lower()
+    output_dir = output_dir or os.path.join(datasets_dir, f'method_{method}')
+    metadata_path = os.path.join(output_dir, 'dataset.json')
+    if ((graph_features or wallet_features) and method == 'a') or not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path) as file:
+        previous = json.load(file)
+    feature_names = dataset_feature_names(feature_columns, method)
+    if previous['method'] != method or previous['feature_names'] != feature_names or 'rules_hash' not in previous:
+        return None
+
+    read_columns = list(dict.fromkeys(feature_columns + label_columns))
+    stages = {}
+    start_time = time.time()
+    conn = sqlite3.connect(database_path)
+    try:
+        with memory_usage.PeakRSSMonitor() as monitor:
+            max_rowid, rows = conn.execute("SELECT COALESCE(MAX(rowid), 0), COUNT(*) FROM Transactions").fetchone()
+            stats_version = label_stats.load(conn)[1]
+            replaced = label_stats.replaced(conn)
+            last_hash = last_row_hash(conn, max_rowid)
+            added = conn.execute("SELECT COUNT(*) FROM Transactions WHERE rowid > ? AND rowid <= ?",
+                                 (previous['max_rowid'], max_rowid)).fetchone()[0]
+            # Only rows appended after the dataset's last row can be taken over as they are
+            if (max_rowid < previous['max_rowid'] or previous['rows'] + added != rows
+                    or last_row_hash(conn, previous['max_rowid']) != previous['last_hash']
+                    or replaced is None or replaced != previous['label_stats_replaced']):
+                return None
+            fraud_wallets = fraud_wallet_list.get_fraud_wallet_list(fraud_wallets_path) if method == 'a' else None
+            if (fraud_wallets.version if fraud_wallets else None) != previous['fraud_wallets_version']:
+                return None
+            rules, rules_hash = label_rules(database_path, method, fraud_wallets, previous['fraud_score_rules'])
+            if rules_hash != previous['rules_hash'] and not previous['label_inputs_exact']:
+                return None
+
+            arrays = open_arrays(output_dir, rows, len(feature_names), '.tmp')
+            for name, array in arrays.items():
+                array[:previous['rows']] = np.load(os.path.join(output_dir, f'{name}.npy'), mmap_mode='r')
+        stages['prepare'] = monitor
+
+        query = f"SELECT {', '.join(read_columns)} FROM Transactions WHERE rowid > ? AND rowid <= ? ORDER BY rowid"
+        offset = previous['rows']
+        exact = previous['label_inputs_exact']
+        with memory_usage.PeakRSSMonitor() as monitor:
+            for chunk in pd.read_sql_query(query, conn, params=(previous['max_rowid'], max_rowid), chunksize=chunk_size):
+                if method == 'a':
+                    fraud_wallet_list.flag_fraud_columns(chunk, fraud_wallets)
+                exact = write_chunk(arrays, offset, chunk, method, rules, feature_names) and exact
+                offset += len(chunk)
+        stages['label_and_encode'] = monitor
+
+        relabelled = 0
+        if rules_hash != previous['rules_hash']:
+            with memory_usage.PeakRSSMonitor() as monitor:
+                relabel(arrays, previous['rows'], method, rules, feature_names, chunk_size)
+                relabelled = previous['rows']
+            stages['relabel'] = monitor
+
+        with memory_usage.PeakRSSMonitor() as monitor:
+            for array in arrays.values():
+                array.flush()
+            flag_counts = np.bincount(arrays['target'], minlength=len(target_names))
+            del arrays
+            # Without dataset.json an interrupted swap is never taken for a current dataset
+            os.remove(metadata_path)
+            for name in array_dtypes:
+                path = os.path.join(output_dir, f'{name}.npy')
+                os.replace(path + '.tmp', path)
+        stages['flush'] = monitor
+    finally:
+        conn.close()
+
+    metadata = dict(previous, **{
+        'fingerprint': model_store.fingerprint([database_path, fraud_wallets_path]),
+        'rows': rows,
+        'max_rowid': max_rowid,
+        'last_hash': last_hash,
+        'label_stats_version': stats_version,
+        'fraud_score_rules': rules,
+        'rules_hash': rules_hash,
+        'label_inputs_exact': exact,
+        'added_rows': added,
+        'relabelled_rows': relabelled,
+        'flag_counts': dict(zip(target_names, flag_counts.tolist())),
+        'seconds': round(time.time() - start_time, 3),
+        'peak_rss_bytes': {stage: monitor.peak for stage, monitor in stages.items()},
+        'peak_rss_increase_bytes': {stage: monitor.peak - monitor.start for stage, monitor in stages.items()},
+    })
+    with open(metadata_path, 'w') as file:
+        json.dump(metadata, file, indent=4)
+    return metadata
+
+
+def load_dataset(output_dir, mmap_mode='r', decode_target=True):
+    """Open a built dataset as a Bunch like create_dataset_from_df returns, with memory-mapped data.
+
+    With decode_target=False the target stays the memory-mapped int8 indexes into target_names.
+    """
+    with open(os.path.join(output_dir, 'dataset.json')) as file:
+        metadata = json.load(file)
+    data = np.load(os.path.join(output_dir, 'features.npy'), mmap_mode=mmap_mode)
+    codes = np.load(os.path.join(output_dir, 'target.npy'), mmap_mode=mmap_mode)
+    target = np.asarray(metadata['target_names'])[codes] if decode_target else codes
+    return Bunch(data=data, feature_names=metadata['feature_names'], target=target,
+                 target_names=metadata['target_names'], DESCR="Transactions Dataset")
+
+
+def is_current(output_dir, database_path, feature_columns, method, fraud_wallets_path='Database/fraud_wallets.db',
+               graph_features=False, wallet_features=False):
+    """True when output_dir holds a dataset built from the current database with the same features."""
+    metadata_path = os.path.join(output_dir, 'dataset.json')
+    if not os.path.exists(metadata_path):
+        return False
+    with open(metadata_path) as file:
+        metadata = json.load(file)
+    method = method.lower()
+    feature_names = dataset_feature_names(feature_columns, method, graph_features and method == 'a',
+                                          wallet_features and method == 'a')
+    if (metadata.get('fingerprint') != model_store.fingerprint([database_path, fraud_wallets_path])
+            or metadata['feature_names'] != feature_names or metadata['method'] != method):
+        return False
+    # Writes in WAL mode can leave the file untouched until a checkpoint, so check the rows too
+    conn = sqlite3.connect(database_path)
+    try:
+        max_rowid, rows = conn.execute("SELECT COALESCE(MAX(rowid), 0), COUNT(*) FROM Transactions").fetchone()
+        stats_version = label_stats.load(conn)[1]
+    finally:
+        conn.close()
+    # Labels depend on the stats too, e.g. after refreshed confirmations
+    if (max_rowid, rows, stats_version) != (metadata['max_rowid'], metadata['rows'], metadata.get('label_stats_version')):
+        return False
+    fraud_wallets = fraud_wallet_list.get_fraud_wallet_list(fraud_wallets_path) if method == 'a' else None
+    return label_rules(database_path, method, fraud_wallets)[1] == metadata.get('rules_hash')
+
+
+def create_dataset_streaming(database_path, feature_columns, target_column, method, output_dir=None, chunk_size=100000,
+                             graph_features=False, wallet_features=False, rebuild=False, decode_target=True):
+    """Drop-in replacement for create_dataset_from_df that builds the dataset on disk first.
+
+    A dataset already built from the current data with the same features is reused, and one the
+    database only gained rows since is brought up to date by update_dataset, unless rebuild is set.
+    """
+    output_dir = output_dir or os.path.join(datasets_dir, f'method_{method.lower()}')
+    if not rebuild and is_current(output_dir, database_path, feature_columns, method,
+                                  graph_features=graph_features, wallet_features=wallet_features):
+        with open(os.path.join(output_dir, 'dataset.json')) as file:
+            metadata = json.load(file)
+        print(f"Using the dataset built at {output_dir}")
+    else:
+        metadata = None if rebuild else update_dataset(database_path, feature_columns, method, output_dir, chunk_size,
+                                                       graph_features=graph_features, wallet_features=wallet_features)
+        if metadata is None:
+            metadata = build_dataset(database_path, feature_columns, method, output_dir, chunk_size,
+                                     graph_features=graph_features, wallet_features=wallet_features)
+        else:
+            print(f"Updated the dataset at {output_dir}: {metadata['added_rows']} rows added, "
+                  f"{metadata['relabelled_rows']} earlier rows labelled again")
+
+    # Print out the number of red, green, and orange labels
+    print(f"Number of 'red' flags: {metadata['flag_counts']['red']}")
+    print(f"Number of 'green' flags: {metadata['flag_counts']['green']}")
+    print(f"Number of 'orange' flags: {metadata['flag_counts']['orange']}")
+    return load_dataset(output_dir, decode_target=decode_target)
+
+
+def print_report(metadata):
+    print(f"Rows: {metadata['rows']}, features: {len(metadata['feature_names'])}, time: {metadata['seconds']:.2f}s")
+    for stage, peak in metadata['peak_rss_bytes'].items():
+        increase = metadata['peak_rss_increase_bytes'][stage]
+        print(f"  {stage:<18} peak RSS {memory_usage.format_bytes(peak):>10}  (+{memory_usage.format_bytes(increase)})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an on-disk feature matrix from a transactions database.")
+    parser.add_argument('database', help="SQLite database with a Transactions table")
+    parser.add_argument('--method', choices=['a', 'b', 'c'], default='a')
+    parser.add_argument('--output', help="Output directory (default: Datasets/method_<method>)")
+    parser.add_argument('--chunk-size', type=int, default=100000, help="Rows read and labelled at a time")
+    parser.add_argument('--graph-features', action='store_true', help="Add multi-hop fraud proximity features (method a)")
+    parser.add_argument('--wallet-features', action='store_true', help="Add per-wallet aggregate features (method a)")
+    parser.add_argument('--update', action='store_true', help="Only add the rows saved since the last build when possible")
+    args = parser.parse_args()
+
+    feature_columns = ['gasUsed', 'value', 'confirmations', 'nonce', 'txreceipt_status', 'gasPrice', 'cumulativeGasUsed']
+    if args.method == 'a':
+        feature_columns += address_columns
+    metadata = None
+    if args.update:
+        metadata = update_dataset(args.database, feature_columns, args.method, args.output, args.chunk_size,
+                                  graph_features=args.graph_features, wallet_features=args.wallet_features)
+        if metadata is None:
+            print("The dataset cannot be updated in place, rebuilding it")
+        else:
+            print(f"{metadata['added_rows']} rows added, {metadata['relabelled_rows']} earlier rows labelled again")
+    if metadata is None:
+        metadata = build_dataset(args.database, feature_columns, args.method, args.output, args.chunk_size,
+                                 graph_features=args.graph_features, wallet_features=args.wallet_features)
+    print_report(metadata)
@@ -0,0 +1,258 @@
+#error_log.py //Append-only log of fetch errors, shared by every script and thread.
+#Each error is one JSON line in errors/errors.jsonl, written with a single O_APPEND write, so
+#logging costs the same however long the log is, and lines from concurrent threads or processes
+#never overwrite each other. A record keeps the wallet, the block range that failed (when known),
+#an error type and the database the transactions belong in. Re-fetched ranges are marked resolved
+#by appending another line, never by rewriting the file.
+#Usage: python error_log.py summary  |  python error_log.py requeue [--dry-run]//
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+
+error_directory = 'errors'
+log_path = os.path.join(error_directory, 'errors.jsonl')
+# The read-modify-write log this one replaces; still read by the summary
+legacy_path = os.path.join(error_directory, 'errors.json')
+
+REQUEST = 'request'
+RATE_LIMIT = 'rate_limit'
+DECODE = 'decode'
+INVALID_RESPONSE = 'invalid_response'
+DENSE_BLOCK = 'dense_block'
+OTHER = 'other'
+
+
+def error_type(message):
+    """Group an error message under one of the types above."""
+    lowered = message.lower()
+    if 'rate limit' in lowered or 'too many requests' in lowered or re.search(r'\b429\b', lowered):
+        return RATE_LIMIT
+    if lowered.startswith('request error'):
+        return REQUEST
+    if lowered.startswith('failed to decode json'):
+        return DECODE
+    if lowered.startswith('invalid or empty response'):
+        return INVALID_RESPONSE
+    if lowered.startswith('more than'):
+        return DENSE_BLOCK
+    return OTHER
+
+
+def append(record, path=None):
+    """Append one record as a JSON line in a single write."""
+    path = path or log_path
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    line = (json.dumps(record, default=str) + '\n').encode('utf-8')
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def log_error(wallet_address, error_message, start_block=None, end_block=None, database=None, path=None):
+    """Record a failed fetch. The block range defaults to the one carried by concurrent_fetcher's errors."""
+    if start_block is None:
+        start_block = getattr(error_message, 'start_block', None)
+    if end_block is None:
+        end_block = getattr(error_message, 'end_block', None)
+    message = str(error_message)
+    append({
+        'timestamp': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        'wallet_address': wallet_address,
+        'error_type': error_type(message),
+        'error_message': message,
+        'start_block': start_block,
+        'end_block': end_block,
+        'database': database,
+        'source': os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+        'pid': os.getpid(),
+    }, path)
+    logging.error(f"Error logged for address {wallet_address}")
+
+
+def mark_resolved(wallet_address, start_block, end_block, database=None, path=None):
+    """Record that a failed range of a wallet was fetched again successfully into a database."""
+    append({
+        'timestamp': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        'wallet_address': wallet_address,
+        'resolved': True,
+        'start_block': start_block,
+        'end_block': end_block,
+        'database': database,
+    }, path)
+
+
+def read_records(path=None, include_legacy=True):
+    """Yield the records of the old errors.json, if there is one, then those of the log, oldest first.
+
+    A line cut short by a crash is skipped.
+    """
+    path = path or log_path
+    if include_legacy and os.path.exists(legacy_path):
+        try:
+            with open(legacy_path) as file:
+                for record in json.load(file):
+                    record.setdefault('error_type', error_type(record.get('error_message', '')))
+                    yield record
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not read {legacy_path}: {e}")
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def merge_ranges(ranges):
+    """Merge overlapping or adjacent (start, end) block ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(block_range) for block_range in merged]
+
+
+def subtract_ranges(ranges, resolved):
+    """The parts of `ranges` not covered by `resolved`; both lists are merged (start, end) ranges."""
+    remaining = []
+    for start, end in ranges:
+        for resolved_start, resolved_end in resolved:
+            if resolved_end < start or resolved_start > end:
+                continue
+            if resolved_start > start:
+                remaining.append((start, resolved_start - 1))
+            start = resolved_end + 1
+            if start > end:
+                break
+        if start <= end:
+            remaining.append((start, end))
+    return remaining
+
+
+def failed_ranges(records):
+    """Block ranges still failed per (database, wallet): {(database, wallet): [(start, end), ...]}.
+
+    Ranges resolved later in the log for the same database are left out, as are errors without a
+    block range. Resolved records without a database, written before they carried one, count for
+    every database.
+    """
+    failed = defaultdict(list)
+    resolved = defaultdict(list)
+    for record in records:
+        if record.get('start_block') is None or record.get('end_block') is None:
+            continue
+        block_range = (int(record['start_block']), int(record['end_block']))
+        if record.get('resolved'):
+            resolved[(record.get('database'), record['wallet_address'])].append(block_range)
+        else:
+            failed[(record.get('database'), record['wallet_address'])].append(block_range)
+    pending = {}
+    for (database, wallet), ranges in failed.items():
+        remaining = subtract_ranges(merge_ranges(ranges),
+                                    merge_ranges(resolved[(database, wallet)] + resolved[(None, wallet)]))
+        if remaining:
+            pending[(database, wallet)] = remaining
+    return pending
+
+
+def summarize(records):
+    """Group the errors by wallet and error type.
+
+    Returns a list of dicts with the count, first and last time, merged block ranges and the last
+    message of each group, most frequent first.
+    """
+    groups = {}
+    for record in records:
+        if record.get('resolved'):
+            continue
+        key = (record.get('wallet_address'), record.get('error_type') or error_type(record.get('error_message', '')))
+        group = groups.setdefault(key, {'wallet_address': key[0], 'error_type': key[1], 'count': 0,
+                                        'first_seen': record.get('timestamp'), 'ranges': [], 'last_message': None})
+        group['count'] += 1
+        group['last_seen'] = record.get('timestamp')
+        group['last_message'] = record.get('error_message')
+        if record.get('start_block') is not None and record.get('end_block') is not None:
+            group['ranges'].append((int(record['start_block']), int(record['end_block'])))
+    for group in groups.values():
+        group['ranges'] = merge_ranges(group['ranges'])
+    return sorted(groups.values(), key=lambda group: (-group['count'], str(group['wallet_address'])))
+
+
+def print_summary(records):
+    records = list(records)
+    groups = summarize(records)
+    by_type = defaultdict(int)
+    for group in groups:
+        by_type[group['error_type']] += group['count']
+    print(f"{sum(by_type.values())} errors for {len({group['wallet_address'] for group in groups})} wallets: "
+          + ', '.join(f"{name} {count}" for name, count in sorted(by_type.items(), key=lambda item: -item[1])))
+    print(f"{'wallet':<44} {'type':<17} {'count':>6} {'last seen':<20} block ranges")
+    for group in groups:
+        ranges = ', '.join(f"{start}-{end}" for start, end in group['ranges'][:3])
+        if len(group['ranges']) > 3:
+            ranges += f", ... ({len(group['ranges'])} ranges)"
+        print(f"{str(group['wallet_address']):<44} {group['error_type']:<17} {group['count']:>6} "
+              f"{str(group['last_seen']):<20} {ranges}")
+    pending = failed_ranges(records)
+    print(f"{sum(len(ranges) for ranges in pending.values())} block ranges of {len(pending)} wallets still to re-fetch")
+
+
+def requeue(records, default_database, chunk_size=1000, dry_run=False, path=None):
+    """Fetch every failed block range again and save it in the database it was meant for.
+
+    Ranges that come back complete are marked resolved; those that fail again are logged again.
+    Returns (ranges fetched, ranges still failing).
+    """
+    import concurrent_fetcher
+    import transaction_store
+
+    fetched = failing = 0
+    for (database, wallet), ranges in failed_ranges(records).items():
+        target = database or default_database
+        for start_block, end_block in ranges:
+            if dry_run:
+                print(f"{wallet} {start_block}-{end_block} -> {target}")
+                continue
+            transactions, error = concurrent_fetcher.fetch_block_range(wallet, start_block, end_block, chunk_size)
+            transaction_store.get_store(target).save(transactions)
+            if error:
+                log_error(wallet, error, database=target, path=path)
+                failing += 1
+            else:
+                # Under the database the error was logged with, so failed_ranges matches them up
+                mark_resolved(wallet, start_block, end_block, database, path)
+                fetched += 1
+    return fetched, failing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the fetch error log and re-fetch the failed block ranges.")
+    parser.add_argument('command', choices=['summary', 'requeue'], nargs='?', default='summary')
+    parser.add_argument('--log', default=log_path, help="Error log to read (default: errors/errors.jsonl)")
+    parser.add_argument('--database', default=os.path.join('Database', 'transactions2.db'),
+                        help="Database for errors logged without one")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help="List the ranges requeue would fetch")
+    args = parser.parse_args()
+
+    if args.command == 'summary':
+        print_summary(read_records(args.log))
+    else:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        fetched, failing = requeue(list(read_records(args.log)), args.database, args.chunk_size, args.dry_run, args.log)
+        if not args.dry_run:
+            print(f"{fetched} ranges fetched, {failing} still failing")
@@ -0,0 +1,179 @@
+#forest_engine.py //Compiled, array-backed form of a fitted RandomForestClassifier for fast scoring.
+#All trees are flattened into one set of node arrays (feature, float32 threshold, children) and
+#every (row, tree) pair walks down at once, one vectorized step per tree level; pairs that reach
+#a leaf drop out, so the work follows the actual path lengths rather than the deepest tree. Leaves
+#are not stored as nodes: children point straight into a table of class probabilities, summed
+#tree by tree in the order scikit-learn uses, so the labels are the same as clf.predict. The
+#compiled forest keeps only what prediction needs, so it is a fraction of the size of the pickled
+#estimator, and predicting a single wallet skips scikit-learn's input validation and thread pool.
+#Large batches are still faster through scikit-learn's Cython tree walk; model_store.predict
+#switches between the two.
+#Usage: python forest_engine.py --method a  (compiles the saved model and prints its size)//
+
+import argparse
+
+import numpy as np
+
+from memory_usage import format_bytes
+
+# Rows walked through the trees at a time; bounds the (rows x trees) node index matrix
+block_rows = 8192
+
+
+def float32_at_most(values):
+    """Largest float32 <= each float64 value, so `x <= threshold` is unchanged for float32 inputs."""
+    rounded = values.astype(np.float32)
+    too_big = rounded.astype(np.float64) > values
+    rounded[too_big] = np.nextafter(rounded[too_big], np.float32(-np.inf))
+    return rounded
+
+
+class CompiledForest:
+    """Flat node arrays of every tree of a forest; only split nodes are stored.
+
+    Split node i tests X[:, feature[i]] <= threshold[i] and goes to children[2 * i] when it holds,
+    children[2 * i + 1] otherwise; NaN goes left where missing_left[i] is set. A child (or root)
+    j >= 0 is another split node, j < 0 the leaf whose class probabilities are leaf_values[-1 - j].
+    """
+
+    def __init__(self, classes, n_features, roots, feature, threshold, children, missing_left, leaf_values, max_depth):
+        self.classes = classes
+        self.n_features = n_features
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_left = missing_left
+        self.leaf_values = leaf_values
+        self.max_depth = max_depth
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in [self.classes, self.roots, self.feature, self.threshold, self.children,
+                                              self.missing_left, self.leaf_values])
+
+    def _leaves(self, X):
+        """Row of leaf_values reached in every tree by every row of a float32 block: (rows, trees)."""
+        flat_X = np.ascontiguousarray(X, dtype=np.float32).ravel()
+        # One entry per (row, tree) pair, row-major
+        nodes = np.tile(self.roots, len(X))
+        offsets = np.repeat(np.arange(len(X), dtype=self.roots.dtype) * self.n_features, self.n_trees)
+        pairs = np.arange(len(nodes))
+        reached = np.empty(len(nodes), dtype=self.roots.dtype)
+        has_nan = np.isnan(flat_X).any()
+        while True:
+            done = nodes < 0
+            if done.any():
+                reached[pairs[done]] = -1 - nodes[done]
+                walking = ~done
+                pairs, nodes, offsets = pairs[walking], nodes[walking], offsets[walking]
+                if not len(nodes):
+                    break
+            values = flat_X[offsets + self.feature[nodes]]
+            go_right = values > self.threshold[nodes]
+            if has_nan:
+                missing = np.isnan(values)
+                go_right[missing] = ~self.missing_left[nodes[missing]]
+            nodes = self.children[2 * nodes + go_right]
+        return reached.reshape(len(X), self.n_trees)
+
+    def predict_proba(self, X):
+        """Mean class probabilities of the trees, as RandomForestClassifier.predict_proba."""
+        to_block = _block_reader(X)
+        n_rows = len(X)
+        proba = np.zeros((n_rows, len(self.classes)), dtype=np.float64)
+        for start in range(0, n_rows, block_rows):
+            block = to_block(start, min(n_rows, start + block_rows))
+            if block.shape[1] != self.n_features:
+                raise ValueError(f"X has {block.shape[1]} features, the forest expects {self.n_features}")
+            leaves = self._leaves(block)
+            out = proba[start:start + len(block)]
+            # One tree at a time, like scikit-learn's accumulation, so ties resolve the same way
+            for tree in range(self.n_trees):
+                out += self.leaf_values[leaves[:, tree]]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def _block_reader(X):
+    """Return f(start, end) giving rows of X as float32, converting one block at a time.
+
+    Values go through float64 first, as in scikit-learn, so large integers round the same way.
+    """
+    if hasattr(X, 'iloc'):
+        return lambda start, end: X.iloc[start:end].to_numpy(dtype=np.float64).astype(np.float32)
+    X = np.asarray(X)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if X.dtype == np.float32:
+        return lambda start, end: X[start:end]
+    return lambda start, end: np.asarray(X[start:end], dtype=np.float64).astype(np.float32)
+
+
+def compile_forest(clf):
+    """Compile a fitted RandomForestClassifier (single output) into a CompiledForest."""
+    trees = [estimator.tree_ for estimator in clf.estimators_]
+    total_nodes = sum(tree.node_count for tree in trees)
+    index_type = np.int32 if total_nodes < 2**31 else np.int64
+
+    roots, features, thresholds, children, missing_left, leaf_values = [], [], [], [], [], []
+    split_count = leaf_count = 0
+    for tree in trees:
+        is_leaf = tree.children_left == -1
+        splits = np.flatnonzero(~is_leaf)
+        leaves = np.flatnonzero(is_leaf)
+        # New id of every node of this tree: split nodes count up, leaves count down from -1
+        ids = np.empty(tree.node_count, dtype=index_type)
+        ids[splits] = split_count + np.arange(len(splits))
+        ids[leaves] = -1 - (leaf_count + np.arange(len(leaves)))
+        split_count += len(splits)
+        leaf_count += len(leaves)
+
+        roots.append(ids[0])
+        features.append(tree.feature[splits])
+        thresholds.append(float32_at_most(tree.threshold[splits]))
+        children.append(np.column_stack([ids[tree.children_left[splits]], ids[tree.children_right[splits]]]).ravel())
+        if hasattr(tree, 'missing_go_to_left'):
+            missing_left.append(tree.missing_go_to_left[splits].astype(bool))
+        else:
+            missing_left.append(np.zeros(len(splits), dtype=bool))
+
+        # Normalized the way DecisionTreeClassifier.predict_proba does it
+        values = tree.value[leaves, 0, :]
+        normalizer = values.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        leaf_values.append(values / normalizer)
+
+    return CompiledForest(
+        classes=np.asarray(clf.classes_),
+        n_features=clf.n_features_in_,
+        roots=np.asarray(roots, dtype=index_type),
+        feature=np.concatenate(features).astype(np.uint16 if clf.n_features_in_ < 2**16 else np.uint32),
+        threshold=np.concatenate(thresholds),
+        children=np.concatenate(children).astype(index_type),
+        missing_left=np.concatenate(missing_left),
+        leaf_values=np.concatenate(leaf_values),
+        max_depth=max(tree.max_depth for tree in trees),
+    )
+
+
+if __name__ == "__main__":
+    import model_store
+
+    parser = argparse.ArgumentParser(description="Compile the saved model of a method and report its size.")
+    parser.add_argument('--method', choices=['a', 'b', 'c'], default='a')
+    args = parser.parse_args()
+
+    artifact = model_store.load_model(args.method, mmap_mode=None)
+    if artifact is None:
+        raise SystemExit(f"No saved model for method {args.method}, train one first")
+    engine = model_store.save_engine(args.method, artifact)
+    print(f"{engine.n_trees} trees, {len(engine.feature)} split nodes, depth {engine.max_depth}: {format_bytes(engine.nbytes)} "
+          f"in {model_store.engine_path(args.method)}")
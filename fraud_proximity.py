@@ -0,0 +1,175 @@
+#fraud_proximity.py //Multi-hop fraud proximity features for every address in the crawled data.
+#The Edges table (see graph_index.py) is loaded into a compact CSR graph: addresses become
+#integer ids, and each address's neighbours sit in one slice of an index array. A multi-source
+#BFS from all fraud wallets at once then gives every address its hop distance to the nearest one,
+#one vectorized NumPy step per hop, and the value exchanged with addresses near fraud wallets is
+#summed with bincount over the edge arrays.
+#Usage: python fraud_proximity.py Database/transactions.db//
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import fraud_wallet_list
+import graph_index
+
+# Hops searched from the fraud wallets; farther (or unconnected) addresses get max_hops + 1
+max_hops = 4
+
+# Value is counted on edges whose counterparty is within this many hops of a fraud wallet
+# (0 = the counterparty is a fraud wallet itself)
+value_hops = 1
+
+ADDRESS_FEATURES = ['fraud_distance', 'fraud_value_in', 'fraud_value_out']
+
+# Columns added to a transactions DataFrame by add_features, usable as classifier features
+TRANSACTION_FEATURES = ['from_fraud_distance', 'to_fraud_distance', 'from_fraud_value', 'to_fraud_value']
+
+
+class CSRGraph:
+    """Undirected adjacency of an edge list in compressed sparse row form.
+
+    The neighbours of node i are indices[indptr[i]:indptr[i + 1]]; addresses[i] is its address.
+    """
+
+    def __init__(self, addresses, sources, targets):
+        self.addresses = addresses
+        nodes = len(addresses)
+        # Both directions of every edge, grouped by their first node
+        heads = np.concatenate([sources, targets])
+        tails = np.concatenate([targets, sources])
+        order = np.argsort(heads)  # neighbour order within a node doesn't matter
+        self.indices = tails[order].astype(np.int32)
+        self.indptr = np.zeros(nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=nodes), out=self.indptr[1:])
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def neighbours_of(self, nodes):
+        """All neighbours of an array of nodes, concatenated (with repeats)."""
+        starts = self.indptr[nodes]
+        lengths = self.indptr[nodes + 1] - starts
+        total = lengths.sum()
+        if total == 0:
+            return np.empty(0, dtype=np.int32)
+        # Position of every neighbour in `indices`: each node's start plus 0..length-1
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.indices[offsets + np.arange(total)]
+
+
+def build_graph(edges_df):
+    """Turn an edge DataFrame (fromAddress, toAddress, ...) into (CSRGraph, source ids, target ids)."""
+    codes, addresses = pd.factorize(pd.concat([edges_df['fromAddress'], edges_df['toAddress']], ignore_index=True))
+    sources = codes[:len(edges_df)]
+    targets = codes[len(edges_df):]
+    return CSRGraph(np.asarray(addresses, dtype=object), sources, targets), sources, targets
+
+
+def multi_source_bfs(graph, sources, max_hops=max_hops):
+    """Hop distance from every node to the nearest source node; unreached nodes get max_hops + 1."""
+    distance = np.full(len(graph), max_hops + 1, dtype=np.int16)
+    frontier = np.unique(sources)
+    distance[frontier] = 0
+    for hop in range(1, max_hops + 1):
+        if len(frontier) == 0:
+            break
+        reached = graph.neighbours_of(frontier)
+        frontier = np.unique(reached[distance[reached] > max_hops])
+        distance[frontier] = hop
+    return distance
+
+
+def transaction_edges(transactions_df):
+    """Group the rows of a transactions DataFrame into edges, as migrate_schema.build_edges does in SQL."""
+    edges = pd.DataFrame({
+        'fromAddress': fraud_wallet_list.normalize_addresses(transactions_df['fromAddress']).to_numpy(),
+        'toAddress': fraud_wallet_list.normalize_addresses(transactions_df['toAddress']).to_numpy(),
+        'value_sum': pd.to_numeric(transactions_df['value'], errors='coerce').fillna(0.0).to_numpy(dtype=np.float64),
+    })
+    edges = edges[(edges['fromAddress'].fillna('') != '') & (edges['toAddress'].fillna('') != '')]
+    return edges.groupby(['fromAddress', 'toAddress'], as_index=False, sort=False).agg(
+        tx_count=('value_sum', 'size'), value_sum=('value_sum', 'sum'))
+
+
+def compute_address_features(databases, fraud_wallets, max_hops=max_hops, value_hops=value_hops, extra_edges=None):
+    """Fraud proximity of every address in the Edges of one or more transactions databases.
+
+    extra_edges (e.g. transaction_edges of the rows being scored) are added to the graph where the
+    databases have no edge between the same two addresses, so a wallet synced after training is
+    still connected to its counterparties.
+
+    Returns a DataFrame indexed by address with:
+      fraud_distance   hops to the nearest fraud wallet (edge direction ignored), max_hops + 1 if none
+      fraud_value_in   value received from addresses within value_hops of a fraud wallet
+      fraud_value_out  value sent to addresses within value_hops of a fraud wallet
+    """
+    if isinstance(databases, str):
+        databases = [databases]
+    edges = pd.concat([graph_index.load_edges(database) for database in databases], ignore_index=True)
+    if len(databases) > 1:
+        edges = edges.groupby(['fromAddress', 'toAddress'], as_index=False, sort=False).agg(
+            {'tx_count': 'sum', 'value_sum': 'sum'})
+    if extra_edges is not None and len(extra_edges):
+        known = pd.MultiIndex.from_frame(edges[['fromAddress', 'toAddress']])
+        new = ~pd.MultiIndex.from_frame(extra_edges[['fromAddress', 'toAddress']]).isin(known)
+        edges = pd.concat([edges, extra_edges.loc[new, edges.columns]], ignore_index=True)
+
+    graph, sources, targets = build_graph(edges)
+    is_fraud = fraud_wallets.contains(graph.addresses)
+    distance = multi_source_bfs(graph, np.flatnonzero(is_fraud), max_hops)
+
+    values = edges['value_sum'].to_numpy(dtype=np.float64)
+    nodes = len(graph)
+    fraud_value_in = np.bincount(targets, weights=np.where(distance[sources] <= value_hops, values, 0.0), minlength=nodes)
+    fraud_value_out = np.bincount(sources, weights=np.where(distance[targets] <= value_hops, values, 0.0), minlength=nodes)
+
+    return pd.DataFrame({
+        'fraud_distance': distance,
+        'fraud_value_in': fraud_value_in,
+        'fraud_value_out': fraud_value_out,
+    }, index=pd.Index(graph.addresses, name='address', dtype=object))
+
+
+def add_features(transactions_df, address_features, max_hops=max_hops, fraud_wallets=None):
+    """Add TRANSACTION_FEATURES for the sender and receiver of every row.
+
+    Addresses missing from the graph count as unreachable with no fraud value, except members of
+    fraud_wallets, which are at distance 0 whether or not the graph has them.
+    """
+    distances = address_features['fraud_distance'].to_numpy()
+    flows = (address_features['fraud_value_in'] + address_features['fraud_value_out']).to_numpy()
+    for side, column in [('from', 'fromAddress'), ('to', 'toAddress')]:
+        addresses = fraud_wallet_list.normalize_addresses(transactions_df[column])
+        positions = address_features.index.get_indexer(addresses)
+        found = positions >= 0
+        distance = np.full(len(transactions_df), max_hops + 1, dtype=np.int64)
+        distance[found] = distances[positions[found]]
+        if fraud_wallets is not None:
+            distance[fraud_wallets.contains(addresses)] = 0
+        value = np.zeros(len(transactions_df))
+        value[found] = flows[positions[found]]
+        transactions_df[f'{side}_fraud_distance'] = distance
+        transactions_df[f'{side}_fraud_value'] = value
+    return transactions_df
+
+
+def uses_graph_features(feature_columns):
+    """True when a model was trained with the TRANSACTION_FEATURES columns."""
+    return set(TRANSACTION_FEATURES) <= set(feature_columns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute fraud proximity for every address in the transaction graph.")
+    parser.add_argument('databases', nargs='+', help="Transactions databases whose Edges make up the graph")
+    parser.add_argument('--fraud-wallets', default='Database/fraud_wallets.db')
+    parser.add_argument('--max-hops', type=int, default=max_hops)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    features = compute_address_features(args.databases, fraud_wallet_list.get_fraud_wallet_list(args.fraud_wallets),
+                                        args.max_hops)
+    print(f"{len(features)} addresses in {time.time() - start_time:.2f} seconds")
+    print(features['fraud_distance'].value_counts().sort_index().rename('addresses').to_string())
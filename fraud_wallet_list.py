@@ -0,0 +1,125 @@
+#fraud_wallet_list.py //Cached, normalized view of fraud_wallets.db.
+#The list is read once per process and afterwards only the rows added since the last read are
+#loaded, when the database file has changed. Whole address columns are checked against it with
+#one hash lookup per row//
+
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+
+def normalize_addresses(addresses):
+    """Vectorized transaction_data_pipeline.normalize_address for a column of addresses.
+
+    Kept as object dtype: lookups only reuse the Index's hash table when both sides share a dtype.
+    """
+    return pd.Series(addresses, dtype=object).str.lower().str.strip().astype(object)
+
+
+class FraudWalletList:
+    """The addresses in a fraud_wallets table, lower-cased and stripped."""
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self.mtime = None
+        self.max_rowid = 0
+        self.row_count = 0
+        # Addresses live in a large base index plus a small index of recent additions, so an
+        # incremental refresh only rebuilds a hash table the size of what was added
+        self.index = pd.Index([], dtype=object)
+        self.recent = pd.Index([], dtype=object)
+        self.refresh()
+
+    def refresh(self):
+        """Load rows added since the last refresh if the database file changed. Returns True if it did.
+
+        New rows are found by rowid; if rows were deleted the whole list is reloaded.
+        """
+        mtime = self._file_version()
+        if mtime == self.mtime:
+            return False
+
+        conn = sqlite3.connect(self.database_path)
+        try:
+            row_count, max_rowid = conn.execute("SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM fraud_wallets").fetchone()
+            new_rows = pd.read_sql_query("SELECT address FROM fraud_wallets WHERE rowid > ?", conn, params=(self.max_rowid,))
+            if self.row_count + len(new_rows) != row_count:
+                # Rows were deleted or replaced, so the earlier ones cannot be trusted
+                self.index = pd.Index([], dtype=object)
+                self.recent = pd.Index([], dtype=object)
+                new_rows = pd.read_sql_query("SELECT address FROM fraud_wallets", conn)
+        finally:
+            conn.close()
+
+        new_addresses = normalize_addresses(new_rows['address']).dropna()
+        if len(new_addresses):
+            recent = np.concatenate([self.recent.to_numpy(dtype=object), new_addresses.to_numpy(dtype=object)])
+            if len(recent) * 10 > len(self.index):
+                # Merge into the base once the recent additions reach a tenth of it
+                self.index = _build_index(np.concatenate([self.index.to_numpy(dtype=object), recent]))
+                self.recent = pd.Index([], dtype=object)
+            else:
+                self.recent = _build_index(recent)
+        self.mtime = mtime
+        self.max_rowid = max_rowid
+        self.row_count = row_count
+        return True
+
+    def _file_version(self):
+        # Writes in WAL mode land in the -wal file before the database file itself changes
+        wal_path = self.database_path + '-wal'
+        wal_mtime = os.stat(wal_path).st_mtime_ns if os.path.exists(wal_path) else None
+        return os.stat(self.database_path).st_mtime_ns, wal_mtime
+
+    def contains(self, addresses):
+        """Return a boolean array telling which addresses of a column are fraud wallets."""
+        addresses = normalize_addresses(addresses)
+        found = self.index.get_indexer(addresses) >= 0
+        if len(self.recent):
+            found |= self.recent.get_indexer(addresses) >= 0
+        return found
+
+    def __contains__(self, address):
+        if not isinstance(address, str):
+            return False
+        address = address.lower().strip()
+        return address in self.index or address in self.recent
+
+    def __len__(self):
+        return len(self.index) + len(self.recent.difference(self.index))
+
+    @property
+    def version(self):
+        """Identifies the loaded contents, e.g. to tell whether labels computed earlier are stale."""
+        return f'{self.row_count}:{self.max_rowid}'
+
+    def as_set(self):
+        return set(self.index) | set(self.recent)
+
+
+def _build_index(addresses):
+    """Deduplicated object-dtype Index whose hash table is built up front rather than on the first lookup."""
+    index = pd.Index(pd.unique(addresses), dtype=object)
+    index.is_unique
+    return index
+
+
+_lists = {}
+
+
+def get_fraud_wallet_list(database_path='Database/fraud_wallets.db'):
+    """Return the process-wide FraudWalletList for a database, refreshed if the file changed."""
+    if database_path in _lists:
+        _lists[database_path].refresh()
+    else:
+        _lists[database_path] = FraudWalletList(database_path)
+    return _lists[database_path]
+
+
+def flag_fraud_columns(transactions_df, fraud_wallets):
+    """Add the 0/1 is_from_fraud_wallet and is_to_fraud_wallet columns to a DataFrame."""
+    transactions_df['is_from_fraud_wallet'] = fraud_wallets.contains(transactions_df['fromAddress']).astype(np.int64)
+    transactions_df['is_to_fraud_wallet'] = fraud_wallets.contains(transactions_df['toAddress']).astype(np.int64)
+    return transactions_df
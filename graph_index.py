@@ -0,0 +1,122 @@
+#graph_index.py //Queries over the Edges table: the address graph of a transactions database.
+#Edges holds one row per (fromAddress, toAddress) pair with its transaction count, summed value
+#and first/last block; TransactionStore.save keeps it current as pages are inserted, and
+#migrate_schema.build_edges rebuilds it from scratch. Lookups go through the primary key and
+#idx_edges_to, so they touch only the rows of the addresses asked about.
+#Usage: python graph_index.py Database/transactions.db 0xabc... [--fraud-distance]//
+
+import argparse
+import time
+
+import pandas as pd
+
+import fraud_wallet_list
+import migrate_schema
+import transaction_store
+
+max_query_parameters = transaction_store.max_query_parameters
+
+
+def _connection(database):
+    return transaction_store.get_store(database).conn
+
+
+def _chunks(addresses):
+    addresses = list(addresses)
+    for i in range(0, len(addresses), max_query_parameters):
+        yield addresses[i:i + max_query_parameters]
+
+
+def edges_of(database, address):
+    """Return the outgoing and incoming edges of one address as a DataFrame with a `direction` column."""
+    address = address.lower()
+    query = """
+        SELECT 'out' AS direction, toAddress AS counterparty, tx_count, value_sum, first_block, last_block
+        FROM Edges WHERE fromAddress = ?
+        UNION ALL
+        SELECT 'in' AS direction, fromAddress AS counterparty, tx_count, value_sum, first_block, last_block
+        FROM Edges WHERE toAddress = ?
+    """
+    return pd.read_sql_query(query, _connection(database), params=(address, address))
+
+
+def neighbours(database, addresses, direction='both'):
+    """Return the set of counterparties of any of `addresses`.
+
+    direction is 'out' (addresses they sent to), 'in' (addresses they received from) or 'both'.
+    """
+    conn = _connection(database)
+    found = set()
+    for chunk in _chunks(address.lower() for address in addresses):
+        placeholders = ', '.join('?' * len(chunk))
+        if direction in ('out', 'both'):
+            found.update(row[0] for row in conn.execute(
+                f"SELECT DISTINCT toAddress FROM Edges WHERE fromAddress IN ({placeholders})", chunk))
+        if direction in ('in', 'both'):
+            found.update(row[0] for row in conn.execute(
+                f"SELECT DISTINCT fromAddress FROM Edges WHERE toAddress IN ({placeholders})", chunk))
+    return found
+
+
+def fraud_distance(database, address, fraud_wallets, max_hops=3):
+    """Number of hops from an address to the nearest fraud wallet, ignoring edge direction.
+
+    A fraud wallet itself is at distance 0. Returns None when none is found within max_hops.
+    The search expands one frontier per query batch, so it only reads the edges it reaches.
+    """
+    address = address.lower()
+    if address in fraud_wallets:
+        return 0
+    visited = {address}
+    frontier = [address]
+    for hop in range(1, max_hops + 1):
+        frontier = list(neighbours(database, frontier) - visited)
+        if not frontier:
+            return None
+        if fraud_wallets.contains(frontier).any():
+            return hop
+        visited.update(frontier)
+    return None
+
+
+def load_edges(database, columns=('fromAddress', 'toAddress', 'tx_count', 'value_sum')):
+    """Read the whole edge list, e.g. to build an in-memory graph."""
+    return pd.read_sql_query(f"SELECT {', '.join(columns)} FROM Edges", _connection(database))
+
+
+def edge_count(database):
+    return _connection(database).execute("SELECT COUNT(*) FROM Edges").fetchone()[0]
+
+
+def rebuild(database):
+    """Rebuild Edges from the Transactions table, e.g. after rows were written without TransactionStore."""
+    conn = _connection(database)
+    with conn:
+        migrate_schema.build_edges(conn)
+    return edge_count(database)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look up an address in the transaction graph.")
+    parser.add_argument('database', help="Transactions database")
+    parser.add_argument('address', nargs='?', help="Address to show the edges of")
+    parser.add_argument('--fraud-distance', action='store_true', help="Also search for the nearest fraud wallet")
+    parser.add_argument('--max-hops', type=int, default=3)
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild the Edges table first")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        start_time = time.time()
+        print(f"Rebuilt {rebuild(args.database)} edges in {time.time() - start_time:.2f} seconds")
+    if args.address:
+        start_time = time.time()
+        edges = edges_of(args.database, args.address)
+        print(edges.to_string(index=False))
+        print(f"{len(edges)} edges in {(time.time() - start_time) * 1000:.1f} ms")
+        if args.fraud_distance:
+            start_time = time.time()
+            distance = fraud_distance(args.database, args.address,
+                                      fraud_wallet_list.get_fraud_wallet_list('Database/fraud_wallets.db'),
+                                      args.max_hops)
+            found = f"{distance} hops" if distance is not None else f"none within {args.max_hops} hops"
+            print(f"Nearest fraud wallet: {found} ({(time.time() - start_time) * 1000:.1f} ms)")
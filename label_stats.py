@@ -0,0 +1,234 @@
+#label_stats.py //Mean and standard deviation of the columns the rule-based labeller scores, kept in
+#the LabelStats table of a transactions database. Each column holds Welford moments (count, mean
+#and M2, the sum of squared deviations from the mean). Moments of two sets of rows merge exactly,
+#so TransactionStore.save folds every new page into the table, wallet_sync swaps in the rows
+#whose confirmations it refreshes, and a rebuild can split the table across processes. The labeller
+#reads the current values through transaction_data_pipeline.fraud_score_rules, so relabelling
+#never needs a pass over the table to get them. Every change bumps the stats version, and each
+#column also counts the rows changed in place, which tells dataset_builder whether a dataset built
+#earlier can be extended with the new rows only.
+#Usage: python label_stats.py Database/transactions.db [--rebuild --jobs 4]//
+
+import argparse
+import math
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import transaction_store
+
+# The columns scored by transaction_data_pipeline.FRAUD_SCORE_RULES
+COLUMNS = ['gasUsed', 'value', 'confirmations', 'nonce', 'gasPrice', 'cumulativeGasUsed']
+
+LABEL_STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS LabelStats (
+    column_name TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    mean REAL NOT NULL,
+    m2 REAL NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL,
+    replaced INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+# Below this many rows the stats are too noisy to label with; the offline values are used instead
+min_rows = 1000
+
+
+class Moments:
+    """Count, mean and M2 of a set of values; merge combines two disjoint sets (Chan et al.)."""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def of(cls, values):
+        """Moments of an array, NaN (NULL) values left out."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return cls()
+        mean = float(values.mean())
+        return cls(len(values), mean, float(((values - mean) ** 2).sum()))
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            return Moments(other.count, other.mean, other.m2)
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        mean = self.mean + delta * other.count / count
+        m2 = self.m2 + other.m2 + delta * delta * self.count * other.count / count
+        return Moments(count, mean, m2)
+
+    def remove(self, other):
+        """Moments of this set without the rows of `other`, which must be part of it."""
+        if other.count == 0:
+            return self
+        count = self.count - other.count
+        if count <= 0:
+            return Moments()
+        mean = (self.mean * self.count - other.mean * other.count) / count
+        delta = other.mean - mean
+        m2 = self.m2 - other.m2 - delta * delta * count * other.count / self.count
+        return Moments(count, mean, max(m2, 0.0))
+
+    @property
+    def stdev(self):
+        """Sample standard deviation, as pandas' std()."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+def ensure_table(conn):
+    conn.execute(LABEL_STATS_SCHEMA)
+    # Tables from schema version 5 have no replaced column yet
+    if 'replaced' not in [row[1] for row in conn.execute("PRAGMA table_info(LabelStats)")]:
+        conn.execute("ALTER TABLE LabelStats ADD COLUMN replaced INTEGER NOT NULL DEFAULT 0")
+
+
+def load(conn):
+    """Return ({column: Moments}, version) as stored; version 0 when nothing is stored."""
+    try:
+        rows = conn.execute("SELECT column_name, count, mean, m2, version FROM LabelStats").fetchall()
+    except sqlite3.OperationalError:  # database from before the table existed
+        return {}, 0
+    moments = {column: Moments(count, mean, m2) for column, count, mean, m2, _ in rows}
+    return moments, max((row[4] for row in rows), default=0)
+
+
+def store(conn, moments, version=None):
+    """Write the moments of every column under a new version (the next one by default).
+
+    The replaced counts are kept.
+    """
+    if version is None:
+        version = load(conn)[1] + 1
+    now = int(time.time())
+    conn.executemany("INSERT INTO LabelStats (column_name, count, mean, m2, version, updated_at) "
+                     "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (column_name) DO UPDATE SET count = excluded.count, "
+                     "mean = excluded.mean, m2 = excluded.m2, version = excluded.version, updated_at = excluded.updated_at",
+                     [(column, m.count, m.mean, m.m2, version, now) for column, m in moments.items()])
+    return version
+
+
+def update(conn, rows):
+    """Fold new Transactions rows (INSERT_TRANSACTION parameter tuples) into the stored moments."""
+    if not rows:
+        return
+    moments, version = load(conn)
+    for column in COLUMNS:
+        index = transaction_store.ROW_COLUMNS.index(column)
+        values = np.array([row[index] for row in rows], dtype=np.float64)
+        moments[column] = moments.get(column, Moments()).merge(Moments.of(values))
+    store(conn, moments, version + 1)
+
+
+def replace(conn, column, old_values, new_values):
+    """Swap stored rows' old values of one column for their new ones, e.g. refreshed confirmations."""
+    moments, version = load(conn)
+    if column not in moments:
+        return
+    moments[column] = moments[column].remove(Moments.of(old_values)).merge(Moments.of(new_values))
+    store(conn, moments, version + 1)
+    conn.execute("UPDATE LabelStats SET replaced = replaced + ? WHERE column_name = ?", (len(old_values), column))
+
+
+def replaced(conn):
+    """Rows changed in place through replace, summed over the columns; None without the count."""
+    try:
+        return conn.execute("SELECT COALESCE(SUM(replaced), 0) FROM LabelStats").fetchone()[0]
+    except sqlite3.OperationalError:  # no LabelStats table, or one from schema version 5
+        return None
+
+
+def fold(cursor, chunk_size=100000):
+    """Moments of every column over the rows of a cursor selecting COLUMNS, one chunk at a time."""
+    moments = {column: Moments() for column in COLUMNS}
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        values = np.array(rows, dtype=np.float64)
+        for i, column in enumerate(COLUMNS):
+            moments[column] = moments[column].merge(Moments.of(values[:, i]))
+    return moments
+
+
+def scan(database_path, first_rowid=None, last_rowid=None, chunk_size=100000):
+    """Moments of every column over the rows of a rowid range (the whole table by default)."""
+    conn = sqlite3.connect(database_path)
+    query = f"SELECT {', '.join(COLUMNS)} FROM Transactions"
+    params = ()
+    if first_rowid is not None:
+        query += " WHERE rowid BETWEEN ? AND ?"
+        params = (first_rowid, last_rowid)
+    try:
+        return fold(conn.execute(query, params), chunk_size)
+    finally:
+        conn.close()
+
+
+def compute(database_path, jobs=1, chunk_size=100000):
+    """Moments of the whole table, with the rowid range split over `jobs` processes and merged."""
+    conn = sqlite3.connect(database_path)
+    low, high = conn.execute("SELECT MIN(rowid), MAX(rowid) FROM Transactions").fetchone()
+    conn.close()
+    if low is None or jobs <= 1:
+        return scan(database_path, chunk_size=chunk_size)
+    step = (high - low) // jobs + 1
+    ranges = [(start, min(high, start + step - 1)) for start in range(low, high + 1, step)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        parts = list(executor.map(scan, [database_path] * len(ranges), *zip(*ranges), [chunk_size] * len(ranges)))
+    moments = {column: Moments() for column in COLUMNS}
+    for part in parts:
+        for column in COLUMNS:
+            moments[column] = moments[column].merge(part[column])
+    return moments
+
+
+def build(conn, chunk_size=100000):
+    """(Re)compute the table from every stored transaction, inside the caller's transaction."""
+    ensure_table(conn)
+    store(conn, fold(conn.execute(f"SELECT {', '.join(COLUMNS)} FROM Transactions"), chunk_size))
+
+
+def current(database_path):
+    """Return ({column: (mean, stdev)}, version) of a database, or (None, 0) while it has too few rows."""
+    conn = sqlite3.connect(database_path)
+    try:
+        moments, version = load(conn)
+    finally:
+        conn.close()
+    if any(column not in moments or moments[column].count < min_rows for column in COLUMNS):
+        return None, 0
+    return {column: (moments[column].mean, moments[column].stdev) for column in COLUMNS}, version
+
+
+if __name__ == "__main__":
+    import transaction_data_pipeline
+
+    parser = argparse.ArgumentParser(description="Show or rebuild the labelling statistics of a transactions database.")
+    parser.add_argument('database')
+    parser.add_argument('--rebuild', action='store_true', help="Recompute the stats with a full pass over Transactions")
+    parser.add_argument('--jobs', type=int, default=1, help="Processes for --rebuild")
+    args = parser.parse_args()
+
+    conn = transaction_store.get_store(args.database).conn
+    if args.rebuild:
+        start_time = time.time()
+        moments = compute(args.database, args.jobs)
+        with conn:
+            version = store(conn, moments)
+        print(f"Rebuilt version {version} in {time.time() - start_time:.2f}s")
+    moments, version = load(conn)
+    print(f"Version {version}")
+    print(f"{'column':<18} {'rows':>10} {'mean':>14} {'stdev':>14} {'offline mean':>14} {'offline stdev':>14}")
+    for column, mean, stdev, _ in transaction_data_pipeline.FRAUD_SCORE_RULES:
+        m = moments.get(column, Moments())
+        print(f"{column:<18} {m.count:>10} {m.mean:>14.6g} {m.stdev:>14.6g} {mean:>14.6g} {stdev:>14.6g}")
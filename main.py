@@ -6,6 +6,7 @@ import transaction_data_pipeline
 import populate_single_wallet
 import sqlite3
 import os
+import argparse
 
 from populate_single_wallet import fetch_transactions
 from sklearn import metrics
@@ -13,21 +14,27 @@ from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.utils import Bunch
 
-def main():
-    print("Classifier script is running")
-    
-    # Get user input for method selection
-    print("Select the method you want to use:")
-    print("a) Original dataset (Using 136k transactions + rule-based labeling)")
-    print("b) Jacob's dataset")
-    print("c) Labeling Jacob's dataset and training on it")
-    
-    method = input("Please enter 'a', 'b', or 'c': ").lower()
+import chunked_forest
+import columnar
+import dataset_builder
+import model_store
+import fraud_proximity
+import fraud_wallet_list
+import profiling
+import wallet_features as wallet_feature_store
 
-    if method not in ['a', 'b', 'c']:
-        print("Invalid input. Please restart and enter a valid option.")
-        return
+# Databases whose Edges make up the graph of the fraud proximity features, in training and scoring alike
+graph_databases = ['Database/transactions.db']
+
+def train(method, graph_features=False, wallet_features=False, n_jobs=-1, chunk_rows=None):
+    """Train the RandomForest for a method, evaluate it and save it with model_store.
 
+    graph_features adds the multi-hop fraud proximity columns of fraud_proximity and
+    wallet_features the per-wallet aggregates of wallet_features.py (method a only).
+    The trees are fitted on n_jobs cores (-1: all of them); the model doesn't depend on it.
+    With chunk_rows, method a is trained out of core by chunked_forest, at most that many rows at a time.
+    """
+    chunk_rows = chunk_rows if method == 'a' else None
     # Feature columns to use based on the method
     if method == 'a':
         feature_columns = ['gasUsed', 'value', 'confirmations', 'nonce', 'txreceipt_status', 'gasPrice', 'cumulativeGasUsed', 'fromAddress', 'toAddress']
@@ -39,37 +46,62 @@ def main():
     
     if method == 'a':
         # Method a: Using the original dataset with 136k transactions and rule-based labeling
-        transactions_dataset = transaction_data_pipeline.create_dataset_from_df('Database/transactions.db', feature_columns, target_column, method)
+        # Built chunk by chunk into Datasets/method_a so the table doesn't have to fit in memory
+        with profiling.stage('load_dataset', memory=True) as stage:
+            transactions_dataset = dataset_builder.create_dataset_streaming('Database/transactions.db', feature_columns, target_column, method,
+                                                                            graph_features=graph_features, wallet_features=wallet_features,
+                                                                            decode_target=chunk_rows is None)
+            stage.rows = len(transactions_dataset.target)
         X = transactions_dataset.data
         y = transactions_dataset.target
-        X_train, X_test, y_train, y_test = train_test_split(X, y, random_state=1, test_size=0.3, stratify=y)
+        if chunk_rows:
+            # Only row numbers are split; the features stay on disk until a chunk of them is fitted
+            train_rows, test_rows = chunked_forest.split(y, test_size=0.3, random_state=1)
+            y_test = np.asarray(transactions_dataset.target_names)[y[test_rows]]
+        else:
+            X_train, X_test, y_train, y_test = train_test_split(X, y, random_state=1, test_size=0.3, stratify=y)
     
     elif method == 'b':
         # Method b: Using Jacob's dataset
-        transactions_dataframe = pd.read_csv('training.csv')
+        with profiling.stage('load_dataset', memory=True) as stage:
+            # Only the columns used, from the typed Parquet copy when pyarrow is installed
+            transactions_dataframe = columnar.read_training_set('training.csv', feature_columns + [target_column])
+            stage.rows = len(transactions_dataframe)
         X = transactions_dataframe[feature_columns]
         y = transactions_dataframe[target_column]
         target_names = ['green', 'orange', 'red']
-        transactions_dataset = Bunch(data=X.values, target=y.values, feature_names=feature_columns, target_names=target_names)
+        transactions_dataset = Bunch(data=X.to_numpy(), target=y.to_numpy(), feature_names=feature_columns, target_names=target_names)
         X_train, X_test, y_train, y_test = train_test_split(transactions_dataset.data, transactions_dataset.target, test_size=0.3, random_state=42)
     
     elif method == 'c':
         # Method c: Labeling Jacob's dataset and training on it
-        transactions_dataframe = pd.read_csv('training1.csv')
-        transactions_dataframe = transaction_data_pipeline.flag_transactions_csv(transactions_dataframe,method)  # Flag the CSV
+        with profiling.stage('load_dataset', memory=True) as stage:
+            transactions_dataframe = columnar.read_training_set('training1.csv', feature_columns)
+            # Flag the CSV, or reuse its flags while the CSV and the rules are unchanged
+            transactions_dataframe = transaction_data_pipeline.flag_training_csv(transactions_dataframe, 'training1.csv', method)
+            stage.rows = len(transactions_dataframe)
         X = transactions_dataframe[feature_columns]
         y = transactions_dataframe[target_column]
         target_names = ['green', 'orange', 'red']
-        transactions_dataset = Bunch(data=X.values, target=y.values, feature_names=feature_columns, target_names=target_names)
+        transactions_dataset = Bunch(data=X.to_numpy(), target=y.to_numpy(), feature_names=feature_columns, target_names=target_names)
         X_train, X_test, y_train, y_test = train_test_split(transactions_dataset.data, transactions_dataset.target, test_size=0.3, random_state=42)
 
     # Train RandomForest Classifier
-    clf = RandomForestClassifier(n_estimators=100, random_state=42)
-    clf.fit(X_train, y_train)
+    with profiling.stage('fit', memory=True) as stage:
+        if chunk_rows:
+            clf = chunked_forest.fit(X, y, transactions_dataset.target_names, train_rows, n_estimators=100,
+                                     chunk_rows=chunk_rows, random_state=42, n_jobs=n_jobs)
+            stage.rows = len(train_rows)
+        else:
+            clf = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=n_jobs)
+            clf.fit(X_train, y_train)
+            stage.rows = len(X_train)
     print("RandomForestClassifier Training completed")
 
     # Evaluate model performance
-    y_pred = clf.predict(X_test)
+    with profiling.stage('evaluate') as stage:
+        y_pred = chunked_forest.predict(clf, X, test_rows, chunk_rows) if chunk_rows else clf.predict(X_test)
+        stage.rows = len(y_test)
     print("Accuracy:", metrics.accuracy_score(y_test, y_pred))
 
     # Confusion matrix
@@ -83,46 +115,93 @@ def main():
     print("Feature importance %")
     print(clf.feature_importances_)
 
-    # Empty and recreate the transactions2.db
-    transaction_data_pipeline.empty_and_recreate_transactions_db()
+    # Save the model with the columns it expects, in training order, so scoring can skip all of the above
+    with profiling.stage('save_model'):
+        artifact = model_store.save_model(method, clf, transactions_dataset.feature_names, transactions_dataset.target_names,
+                                          accuracy=metrics.accuracy_score(y_test, y_pred),
+                                          graph_databases=graph_databases if graph_features and method == 'a' else None)
+    print(f"Model saved to {model_store.model_path(method)}")
+    return artifact
+
+def load_or_train(method, retrain=False):
+    """Return the saved model of a method, retraining only when its training data changed."""
+    artifact = None if retrain else model_store.load_model(method)
+    if model_store.is_current(artifact, method):
+        print(f"Using saved model trained at {artifact['trained_at']}")
+        return artifact
+    if artifact is not None:
+        print("Training data changed since the saved model was trained, retraining")
+        # Keep the feature set the saved model was trained with
+        return train(method, graph_features=fraud_proximity.uses_graph_features(artifact['feature_columns']),
+                     wallet_features=wallet_feature_store.uses_wallet_features(artifact['feature_columns']))
+    return train(method)
+
+def add_graph_features(transactions_df, fraud_wallets, databases=None):
+    """Add the fraud proximity columns, measured on the graph of the given databases.
 
-    # Ask for wallet and populate transactions2 database
-    wallet_address = populate_single_wallet.main()
+    Pass the artifact's graph_databases so the features come from the graph the model was trained on;
+    the default is the training database. The edges of the scored rows themselves are added to that
+    graph, so wallets synced into transactions2.db after training still reach their counterparties.
+    """
+    address_features = fraud_proximity.compute_address_features(
+        databases or graph_databases, fraud_wallets, extra_edges=fraud_proximity.transaction_edges(transactions_df))
+    return fraud_proximity.add_features(transactions_df, address_features, fraud_wallets=fraud_wallets)
+
+def score(method, full_refresh=False, retrain=False, results_format='csv'):
+    """Score the transactions of one wallet with the saved model of a method.
+
+    The results go to Results/<wallet>.csv, or Results/<wallet>.parquet with results_format='parquet'.
+    """
+    with profiling.stage('load_model'):
+        artifact = load_or_train(method, retrain)
+
+    # Empty and recreate the transactions2.db only when asked to, otherwise known wallets are synced incrementally
+    if full_refresh:
+        transaction_data_pipeline.empty_and_recreate_transactions_db()
+
+    # Ask for wallet and bring its transactions in transactions2 database up to date
+    with profiling.stage('sync_wallet'):
+        wallet_address = populate_single_wallet.main(incremental=True)
 
     # Connect to SQLite database
     #conn = sqlite3.connect('Database/orange_wallet_db.db')
     conn = sqlite3.connect('Database/transactions2.db')
 
-    # Build the query string
-    if feature_columns:
-        columns = ', '.join(feature_columns)
-    
-    query = f"SELECT * FROM Transactions"
-    wallet_transactions_df = pd.read_sql_query(query, conn)
+    # transactions2.db keeps every synced wallet, so only load the transactions of this one
+    query = f"SELECT * FROM Transactions WHERE fromAddress = ? OR toAddress = ?"
+    with profiling.stage('load_transactions') as stage:
+        wallet_transactions_df = pd.read_sql_query(query, conn, params=(wallet_address, wallet_address))
+        stage.rows = len(wallet_transactions_df)
 
-    # Load fraud wallets from the database and normalize them
-    fraud_wallets = set(transaction_data_pipeline.normalize_address(addr) for addr in transaction_data_pipeline.get_fraud_wallets('Database/fraud_wallets.db'))
+    # Load fraud wallets (cached and normalized once per process)
+    fraud_wallets = fraud_wallet_list.get_fraud_wallet_list('Database/fraud_wallets.db')
 
-    # Normalize the addresses in the DataFrame and apply the cross-check
-    wallet_transactions_df['is_from_fraud_wallet'] = wallet_transactions_df['fromAddress'].apply(
-        lambda x: 1 if transaction_data_pipeline.normalize_address(x) in fraud_wallets else 0)
-    wallet_transactions_df['is_to_fraud_wallet'] = wallet_transactions_df['toAddress'].apply(
-        lambda x: 1 if transaction_data_pipeline.normalize_address(x) in fraud_wallets else 0)
+    # Cross-check the whole address columns against the fraud wallets
+    with profiling.stage('fraud_cross_check') as stage:
+        fraud_wallet_list.flag_fraud_columns(wallet_transactions_df, fraud_wallets)
+        stage.rows = len(wallet_transactions_df)
 
 
 
     # Close the connection
     conn.close()
 
-    if method == 'a':
-        actual_feature_columns = ['gasUsed', 'value', 'confirmations', 'nonce', 'txreceipt_status', 'gasPrice', 'cumulativeGasUsed', 'is_from_fraud_wallet', 'is_to_fraud_wallet']
-    elif method == 'b' or method == 'c':
-        actual_feature_columns = ['gasUsed', 'value', 'confirmations', 'nonce', 'txreceipt_status', 'gasPrice', 'cumulativeGasUsed']
+    if fraud_proximity.uses_graph_features(artifact['feature_columns']):
+        with profiling.stage('graph_features', memory=True):
+            add_graph_features(wallet_transactions_df, fraud_wallets, artifact.get('graph_databases'))
+    if wallet_feature_store.uses_wallet_features(artifact['feature_columns']):
+        with profiling.stage('wallet_features'):
+            wallet_feature_store.add_features(wallet_transactions_df, populate_single_wallet.database)
+
+    # The saved model knows which columns it was trained on
+    actual_feature_columns = artifact['feature_columns']
     
-    wallet_transactions_data = wallet_transactions_df[actual_feature_columns].values
+    wallet_transactions_data = wallet_transactions_df[actual_feature_columns]
 
     # Predict the labels for these transactions
-    predicted_labels = clf.predict(wallet_transactions_data)
+    with profiling.stage('predict') as stage:
+        predicted_labels = model_store.predict(artifact, wallet_transactions_data)
+        stage.rows = len(wallet_transactions_data)
     wallet_transactions_df['predicted_label'] = predicted_labels
 
 
@@ -153,14 +232,57 @@ def main():
     print(f"Orange transactions: {num_orange}")
     print(f"Green transactions: {num_green}")
 
-    # Save the results to a CSV
+    # Save the results
     result_df = wallet_transactions_df[['hash', 'fromAddress', 'predicted_label']]
     results_dir = 'Results'
     if not os.path.exists(results_dir):
         os.makedirs(results_dir)
 
-    result_df.to_csv(f'./Results/{wallet_address}.csv', index=False)
-    print(f"Results saved to {wallet_address}.csv")
+    with profiling.stage('write_csv') as stage:
+        columnar.write_results(result_df, f'./Results/{wallet_address}.{results_format}')
+        stage.rows = len(result_df)
+    print(f"Results saved to {wallet_address}.{results_format}")
+
+def main(full_refresh=False):
+    print("Classifier script is running")
+    
+    # Get user input for method selection
+    print("Select the method you want to use:")
+    print("a) Original dataset (Using 136k transactions + rule-based labeling)")
+    print("b) Jacob's dataset")
+    print("c) Labeling Jacob's dataset and training on it")
+    
+    method = input("Please enter 'a', 'b', or 'c': ").lower()
+
+    if method not in ['a', 'b', 'c']:
+        print("Invalid input. Please restart and enter a valid option.")
+        return
+
+    score(method, full_refresh=full_refresh)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train the classifier and score the transactions of a wallet.")
+    parser.add_argument('command', nargs='?', choices=['train', 'score'],
+                        help="'train' fits and saves the model, 'score' uses the saved model; without a command the script asks for a method")
+    parser.add_argument('--method', choices=['a', 'b', 'c'], help="Training method, required with a command")
+    parser.add_argument('--retrain', action='store_true', help="With 'score', retrain even if the saved model is current")
+    parser.add_argument('--full-refresh', action='store_true', help="Empty transactions2.db and re-download the wallet's whole history")
+    parser.add_argument('--graph-features', action='store_true', help="With 'train' and method a, add multi-hop fraud proximity features")
+    parser.add_argument('--wallet-features', action='store_true', help="With 'train' and method a, add per-wallet aggregate features")
+    parser.add_argument('--jobs', type=int, default=-1, help="With 'train', number of cores to fit on (default: all)")
+    parser.add_argument('--chunk-rows', type=int, help="With 'train' and method a, fit sub-forests on this many rows at a time")
+    parser.add_argument('--results-format', choices=['csv', 'parquet'], default='csv',
+                        help="With 'score', file format of Results/<wallet> (parquet needs pyarrow)")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+
+    if args.command and not args.method:
+        parser.error("--method is required with a command")
+    if args.command == 'train':
+        train(args.method, graph_features=args.graph_features, wallet_features=args.wallet_features, n_jobs=args.jobs,
+              chunk_rows=args.chunk_rows)
+    elif args.command == 'score':
+        score(args.method, full_refresh=args.full_refresh, retrain=args.retrain, results_format=args.results_format)
+    else:
+        main(full_refresh=args.full_refresh)
+    profiling.finish(args.profile)
@@ -0,0 +1,69 @@
+#memory_usage.py //Resident memory measurements for reports on how much RAM each stage needs//
+
+import os
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def current_rss():
+    """Current resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss()
+
+
+def peak_rss():
+    """Highest resident set size of this process so far, in bytes (0 where it can't be measured)."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class PeakRSSMonitor:
+    """Samples the RSS in a background thread to find the peak of one stage.
+
+    The process-wide peak can't be reset between stages, so it is sampled instead:
+        with PeakRSSMonitor() as monitor:
+            ...
+        monitor.peak  # bytes
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self.start = self.peak = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+        return False
+
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(size) < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}'
+        size /= 1024
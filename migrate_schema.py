@@ -0,0 +1,159 @@
+#migrate_schema.py //Converts existing transactions databases to the typed Transactions layout.
+#Older databases store value/gas/gasPrice/cumulativeGasUsed/gasUsed as TEXT (populate_*.py) or
+#value as REAL (empty_and_recreate_transactions_db). The typed layout stores them as numbers and
+#keeps the exact wei amount in value_wei, see transaction_store.TRANSACTIONS_SCHEMA. Version 3 adds the
+#Edges table of address pairs, version 4 the WalletFeatures table and version 5 the LabelStats
+#table, all built here once from the existing rows. Version 6 counts rows changed in place in LabelStats
+#and version 7 moves the wallet value histograms into rows of their own.
+#Usage: python migrate_schema.py Database/transactions.db [Database/transactions2.db ...]//
+
+import argparse
+import sqlite3
+import time
+from decimal import Decimal
+
+import label_stats
+import transaction_store
+import wallet_features
+
+COLUMNS = ['hash', 'nonce', 'blockHash', 'blockNumber', 'transactionIndex', 'fromAddress', 'toAddress', 'value',
+           'gas', 'gasPrice', 'isError', 'txreceipt_status', 'input', 'contractAddress', 'cumulativeGasUsed',
+           'gasUsed', 'confirmations', 'timestamp']
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def transactions_table(conn):
+    """Return the name of the transactions table as it was created (its case varies), or None."""
+    row = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND lower(name) = 'transactions'").fetchone()
+    return row[0] if row else None
+
+
+def parse_int(value):
+    """Parse a stored number exactly, whether it was kept as an integer, a float or text like '3.00E+18'."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        return int(Decimal(value))
+    return int(value)
+
+
+def convert_row(row):
+    """Turn one row of an old table (in COLUMNS order) into INSERT_TRANSACTION parameters."""
+    (tx_hash, nonce, block_hash, block_number, transaction_index, from_address, to_address, value, gas, gas_price,
+     is_error, txreceipt_status, tx_input, contract_address, cumulative_gas_used, gas_used, confirmations,
+     timestamp) = row
+    wei = parse_int(value) or 0
+    return (
+        tx_hash, parse_int(nonce), block_hash, parse_int(block_number), parse_int(transaction_index),
+        from_address, to_address, float(wei), transaction_store.wei_to_blob(wei),
+        to_integer_or_none(gas), to_integer_or_none(gas_price), parse_int(is_error), parse_int(txreceipt_status),
+        tx_input, contract_address, to_integer_or_none(cumulative_gas_used), to_integer_or_none(gas_used),
+        parse_int(confirmations), parse_int(timestamp),
+    )
+
+
+def to_integer_or_none(value):
+    number = parse_int(value)
+    return None if number is None else transaction_store.to_integer(number)
+
+
+def migrate_connection(conn, chunk_size=50000):
+    """Bring the Transactions table of an open connection to the current layout.
+
+    Version 2 converted the numeric columns, version 3 added the Edges table, version 4 the
+    WalletFeatures table, version 5 the LabelStats table, version 6 its replaced counts and version 7
+    the WalletValueHistogram table. The whole upgrade runs in one transaction, so an interrupted
+    migration leaves the old tables untouched.
+    Returns the number of rows converted.
+    """
+    table = transactions_table(conn)
+    if table is None:
+        conn.execute(transaction_store.TRANSACTIONS_SCHEMA)
+        conn.execute(transaction_store.EDGES_SCHEMA)
+        wallet_features.ensure_tables(conn)
+        label_stats.ensure_table(conn)
+        conn.execute(f"PRAGMA user_version = {transaction_store.SCHEMA_VERSION}")
+        conn.commit()
+        return 0
+
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+    version = schema_version(conn)
+    conn.commit()
+    conn.execute("BEGIN")
+    try:
+        migrated = 0
+        if 'value_wei' not in columns:
+            migrated = convert_table(conn, table, chunk_size)
+        if version < 3:
+            build_edges(conn)
+        if version < 4:
+            wallet_features.build(conn, chunk_size)
+        elif version < 7:
+            wallet_features.convert_histograms(conn, chunk_size)
+        if version < 5:
+            label_stats.build(conn, chunk_size)
+        elif version < 6:
+            label_stats.ensure_table(conn)
+        conn.execute(f"PRAGMA user_version = {transaction_store.SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return migrated
+
+
+def convert_table(conn, table, chunk_size):
+    """Copy an untyped transactions table into the typed layout and swap it in."""
+    conn.execute("DROP TABLE IF EXISTS Transactions_migrating")
+    conn.execute(transaction_store.TRANSACTIONS_SCHEMA.replace('Transactions', 'Transactions_migrating', 1))
+    insert = transaction_store.INSERT_TRANSACTION.replace('INTO Transactions', 'INTO Transactions_migrating')
+
+    migrated = 0
+    cursor = conn.execute(f'SELECT {", ".join(COLUMNS)} FROM "{table}"')
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        conn.executemany(insert, [convert_row(row) for row in rows])
+        migrated += len(rows)
+
+    conn.execute(f'DROP TABLE "{table}"')
+    conn.execute("ALTER TABLE Transactions_migrating RENAME TO Transactions")
+    return migrated
+
+
+def build_edges(conn):
+    """(Re)build the Edges table from every stored transaction with one GROUP BY."""
+    conn.execute(transaction_store.EDGES_SCHEMA)
+    conn.execute("DELETE FROM Edges")
+    conn.execute("""
+        INSERT INTO Edges (fromAddress, toAddress, tx_count, value_sum, first_block, last_block)
+        SELECT lower(fromAddress), lower(toAddress), COUNT(*), TOTAL(value), MIN(blockNumber), MAX(blockNumber)
+        FROM Transactions
+        WHERE fromAddress IS NOT NULL AND fromAddress != '' AND toAddress IS NOT NULL AND toAddress != ''
+        GROUP BY lower(fromAddress), lower(toAddress)
+    """)
+
+
+def migrate(database):
+    """Migrate one database file and print what was done."""
+    conn = sqlite3.connect(database)
+    try:
+        start_time = time.time()
+        version = schema_version(conn)
+        migrated = migrate_connection(conn)
+        print(f"{database}: schema version {version} -> {transaction_store.SCHEMA_VERSION}, "
+              f"{migrated} rows converted in {time.time() - start_time:.2f} seconds")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert transactions databases to the typed Transactions layout.")
+    parser.add_argument('databases', nargs='+', help="SQLite files to migrate in place")
+    args = parser.parse_args()
+    for database in args.databases:
+        migrate(database)
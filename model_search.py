@@ -0,0 +1,175 @@
+#model_search.py //Parallel search over feature sets and RandomForest settings.
+#The feature matrix is built once with dataset_builder (method a, which holds every column of the
+#other methods too) and memory-mapped; each candidate only picks its columns out of it, so no
+#candidate rebuilds or copies the dataset. Candidates are fitted in parallel worker processes,
+#one core each, on the same train/test split as main.train, and each one is scored on the test
+#split; only the scores come back from the workers, the best model is refitted if it is saved.
+#The report gives every configuration's accuracy, macro F1 and fit time, and the speedup of
+#the parallel run over fitting the candidates one after another.
+#Usage: python model_search.py --trees 50 100 200 --depths 8 16 none --jobs -1//
+
+import argparse
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn import metrics
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+
+import dataset_builder
+import fraud_proximity
+import model_store
+import profiling
+import wallet_features
+
+reports_dir = 'Reports'
+
+# Columns main.train reads for method a; b and c use the same minus the addresses
+method_a_columns = ['gasUsed', 'value', 'confirmations', 'nonce', 'txreceipt_status', 'gasPrice', 'cumulativeGasUsed',
+                    'fromAddress', 'toAddress']
+method_bc_columns = method_a_columns[:7]
+
+
+def feature_sets(feature_names):
+    """The column sets to compare, as far as the built dataset has them."""
+    sets = {
+        'method_a': dataset_builder.dataset_feature_names(method_a_columns, 'a'),
+        'method_bc': dataset_builder.dataset_feature_names(method_bc_columns, 'b'),
+    }
+    extra = {'graph': fraud_proximity.TRANSACTION_FEATURES, 'wallet': wallet_features.TRANSACTION_FEATURES}
+    for name, columns in extra.items():
+        if set(columns) <= set(feature_names):
+            sets[f'method_a+{name}'] = sets['method_a'] + columns
+    if all(set(columns) <= set(feature_names) for columns in extra.values()):
+        sets['method_a+graph+wallet'] = sets['method_a'] + extra['graph'] + extra['wallet']
+    return sets
+
+
+def fit_model(data, target, train_index, columns, n_estimators, max_depth, n_jobs=1):
+    """Fit one configuration; data is the memory-mapped matrix, columns its column indexes."""
+    clf = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth, random_state=42, n_jobs=n_jobs)
+    clf.fit(data[np.ix_(train_index, columns)], target[train_index])
+    return clf
+
+
+def fit_candidate(data, target, train_index, test_index, columns, n_estimators, max_depth):
+    """Fit and score one configuration on one core.
+
+    cpu_seconds is what the candidate would take alone on a free core, even when workers share cores.
+    """
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    clf = fit_model(data, target, train_index, columns, n_estimators, max_depth)
+    fit_seconds = time.perf_counter() - start_time
+    y_pred = clf.predict(data[np.ix_(test_index, columns)])
+    return {
+        'accuracy': metrics.accuracy_score(target[test_index], y_pred),
+        'f1_macro': metrics.f1_score(target[test_index], y_pred, average='macro'),
+        'fit_seconds': fit_seconds,
+        'seconds': time.perf_counter() - start_time,
+        'cpu_seconds': time.process_time() - start_cpu,
+    }
+
+
+def search(dataset, trees=(100,), depths=(None,), sets=None, n_jobs=-1):
+    """Score every combination of feature set, tree count and depth.
+
+    Candidates run in n_jobs processes (-1: all cores) that share the memory-mapped dataset.
+    Returns the candidates best first, the timing of the search and the training rows of the split.
+    """
+    sets = sets or list(feature_sets(dataset.feature_names))
+    available = feature_sets(dataset.feature_names)
+    target = np.asarray(dataset.target)
+    # Same split as main.train for method a
+    train_index, test_index = train_test_split(np.arange(len(target)), random_state=1, test_size=0.3, stratify=target)
+    train_index.sort()
+    test_index.sort()
+
+    candidates = []
+    for name, n_estimators, max_depth in itertools.product(sets, trees, depths):
+        columns = [dataset.feature_names.index(column) for column in available[name]]
+        candidates.append({'feature_set': name, 'n_estimators': n_estimators, 'max_depth': max_depth, 'columns': columns})
+
+    start_time = time.perf_counter()
+    with profiling.stage('model_search', memory=True) as stage:
+        outcomes = Parallel(n_jobs=n_jobs)(
+            delayed(fit_candidate)(dataset.data, target, train_index, test_index, candidate['columns'],
+                                   candidate['n_estimators'], candidate['max_depth'])
+            for candidate in candidates)
+        stage.rows = len(candidates)
+    wall_seconds = time.perf_counter() - start_time
+
+    results = []
+    for candidate, scores in zip(candidates, outcomes):
+        result = dict(candidate)
+        result.update(scores)
+        results.append(result)
+    results.sort(key=lambda result: (-result['f1_macro'], -result['accuracy'], result['fit_seconds']))
+    serial_seconds = sum(result['cpu_seconds'] for result in results)
+    timing = {'wall_seconds': wall_seconds, 'serial_seconds': serial_seconds,
+              'speedup': serial_seconds / wall_seconds if wall_seconds else None}
+    return results, timing, train_index
+
+
+def print_results(results, timing):
+    print(f"{'feature set':<24} {'trees':>6} {'depth':>6} {'accuracy':>9} {'f1 macro':>9} {'fit s':>8}")
+    for result in results:
+        depth = result['max_depth'] if result['max_depth'] is not None else '-'
+        print(f"{result['feature_set']:<24} {result['n_estimators']:>6} {depth:>6} {result['accuracy']:>9.4f} "
+              f"{result['f1_macro']:>9.4f} {result['fit_seconds']:>8.2f}")
+    print(f"{len(results)} candidates in {timing['wall_seconds']:.1f}s wall clock, {timing['serial_seconds']:.1f}s "
+          f"fitted one by one: {timing['speedup']:.2f}x speedup")
+
+
+def write_report(results, timing, dataset_dir, path=None):
+    if not path:
+        if not os.path.exists(reports_dir):
+            os.makedirs(reports_dir)
+        path = os.path.join(reports_dir, f"model_search_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as file:
+        json.dump({
+            'dataset': dataset_dir,
+            'cpus': os.cpu_count(),
+            'timing': timing,
+            'results': [{key: value for key, value in result.items() if key != 'columns'} for result in results],
+        }, file, indent=4)
+    return path
+
+
+def parse_depth(depth):
+    return None if depth.lower() == 'none' else int(depth)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare feature sets and RandomForest settings in parallel.")
+    parser.add_argument('--database', default='Database/transactions.db')
+    parser.add_argument('--trees', type=int, nargs='+', default=[50, 100, 200])
+    parser.add_argument('--depths', type=parse_depth, nargs='+', default=[None, 16], help="Tree depths, 'none' for unlimited")
+    parser.add_argument('--sets', nargs='+', help="Feature sets to try (default: all the dataset supports)")
+    parser.add_argument('--jobs', type=int, default=-1, help="Candidates fitted at once (default: one per core)")
+    parser.add_argument('--graph-features', action='store_true', help="Include the fraud proximity columns")
+    parser.add_argument('--wallet-features', action='store_true', help="Include the per-wallet aggregate columns")
+    parser.add_argument('--save-best', action='store_true', help="Save the best candidate as the method a model")
+    parser.add_argument('--output', help="JSON report to write (default: Reports/model_search_<time>.json)")
+    args = parser.parse_args()
+
+    # Built once, or reused if the data hasn't changed since the last build
+    dataset_dir = os.path.join(dataset_builder.datasets_dir, 'method_a')
+    dataset = dataset_builder.create_dataset_streaming(args.database, method_a_columns, 'flag', 'a', dataset_dir,
+                                                       graph_features=args.graph_features,
+                                                       wallet_features=args.wallet_features)
+    results, timing, train_index = search(dataset, args.trees, args.depths, args.sets, args.jobs)
+    print_results(results, timing)
+    print(f"Report saved to {write_report(results, timing, dataset_dir, args.output)}")
+
+    if args.save_best:
+        best = results[0]
+        # Fitting is deterministic, so the refit on every core is the model that was scored
+        clf = fit_model(dataset.data, np.asarray(dataset.target), train_index, best['columns'], best['n_estimators'], best['max_depth'], n_jobs=-1)
+        columns = [dataset.feature_names[index] for index in best['columns']]
+        model_store.save_model('a', clf, columns, dataset.target_names, accuracy=best['accuracy'])
+        print(f"Saved {best['feature_set']} with {best['n_estimators']} trees to {model_store.model_path('a')}")
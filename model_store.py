@@ -0,0 +1,164 @@
+#model_store.py //Saves the trained classifier to disk so scoring can skip training.
+#An artifact holds the fitted model, its feature columns, target names and a fingerprint of the
+#training data; it is only rebuilt when that fingerprint changes. A compiled copy of the forest
+#(see forest_engine.py) is kept in the artifact for scoring and also saved on its own, without
+#the scikit-learn estimator, for services that only predict//
+
+import hashlib
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import sklearn
+
+import forest_engine
+
+models_dir = 'Models'
+
+# Largest batch predict() scores with the compiled forest (see benchmarks/bench_forest.py)
+engine_max_rows = 500
+
+# Files each training method reads; a change to any of them invalidates the saved model
+TRAINING_SOURCES = {
+    'a': ['Database/transactions.db', 'Database/fraud_wallets.db'],
+    'b': ['training.csv'],
+    'c': ['training1.csv'],
+}
+
+# Database whose LabelStats label the training rows of a method (transaction_data_pipeline.fraud_score_rules).
+# Method b trains on the flags stored in training.csv, which the stats don't touch
+LABEL_STATS_SOURCES = {
+    'a': 'Database/transactions.db',
+    'c': 'Database/transactions.db',
+}
+
+
+def model_path(method):
+    return os.path.join(models_dir, f'model_{method}.joblib')
+
+
+def engine_path(method):
+    return os.path.join(models_dir, f'model_{method}.engine.joblib')
+
+
+def fingerprint(paths):
+    """Fingerprint the training data by path, size and modification time.
+
+    Missing files are part of the fingerprint too, so creating one also invalidates the model.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+        else:
+            digest.update(f'{path}:missing\n'.encode())
+    return digest.hexdigest()
+
+
+def label_rules(method, labelled_with=None):
+    """The rules the training rows of a method are labelled with now, None when its flags are stored.
+
+    labelled_with are the rules of an earlier model, kept while the LabelStats stay close to them
+    (transaction_data_pipeline.settled_rules).
+    """
+    if method not in LABEL_STATS_SOURCES:
+        return None
+    import transaction_data_pipeline  # imports this module
+
+    return transaction_data_pipeline.settled_rules(
+        labelled_with, transaction_data_pipeline.fraud_score_rules(LABEL_STATS_SOURCES[method]))
+
+
+def training_fingerprint(method, rules=None):
+    """Fingerprint of the training files, plus the hash of the rules the rows are labelled with.
+
+    LabelStats that drifted give other labels, so they invalidate the model even with the files unchanged.
+    """
+    digest = fingerprint(TRAINING_SOURCES[method])
+    if rules is not None:
+        import transaction_data_pipeline
+
+        digest += ':' + transaction_data_pipeline.rules_hash(rules, method)
+    return digest
+
+
+def save_model(method, clf, feature_columns, target_names, accuracy=None, graph_databases=None):
+    """Write the model artifact for a method and a small JSON file describing it.
+
+    graph_databases are the databases whose graph the fraud proximity features were measured on,
+    so scoring measures them on the same one.
+    """
+    if not os.path.exists(models_dir):
+        os.makedirs(models_dir)
+
+    rules = label_rules(method)
+    artifact = {
+        'model': clf,
+        'method': method,
+        'feature_columns': list(feature_columns),
+        'target_names': list(target_names),
+        'fingerprint': training_fingerprint(method, rules),
+        'label_rules': rules,
+        'trained_at': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        'sklearn_version': sklearn.__version__,
+        'accuracy': accuracy,
+        'graph_databases': list(graph_databases) if graph_databases else None,
+        'engine': forest_engine.compile_forest(clf),
+    }
+    path = model_path(method)
+    # Write to a temporary file first so a crash never leaves a half-written model behind
+    joblib.dump(artifact, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+    with open(os.path.splitext(path)[0] + '.json', 'w') as file:
+        json.dump({key: value for key, value in artifact.items() if key not in ('model', 'engine')}, file, indent=4)
+    save_engine(method, artifact)
+    return artifact
+
+
+def save_engine(method, artifact):
+    """Write the compiled forest of an artifact with its metadata but without the estimator."""
+    if 'engine' not in artifact:
+        artifact['engine'] = forest_engine.compile_forest(artifact['model'])
+    path = engine_path(method)
+    joblib.dump({key: value for key, value in artifact.items() if key != 'model'}, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return artifact['engine']
+
+
+def load_engine(method, mmap_mode='r'):
+    """Load the compiled-forest artifact of a method (no scikit-learn estimator). None if there is none."""
+    path = engine_path(method)
+    if not os.path.exists(path):
+        return None
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+def predict(artifact, X):
+    """Labels for the rows of X, a DataFrame or array with the artifact's feature_columns.
+
+    Small batches go through the compiled forest, which has no per-call overhead; above
+    engine_max_rows the estimator's compiled tree walk is faster, so it is used when the artifact
+    has one. Artifacts saved before the engine existed always use the estimator.
+    """
+    if 'engine' in artifact and (len(X) <= engine_max_rows or 'model' not in artifact):
+        return artifact['engine'].predict(X)
+    return artifact['model'].predict(np.asarray(X, dtype=np.float64))
+
+
+def load_model(method, mmap_mode='r'):
+    """Load the saved artifact of a method, memory-mapping its arrays. Returns None if there is none."""
+    path = model_path(method)
+    if not os.path.exists(path):
+        return None
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+def is_current(artifact, method):
+    """Return True if the artifact was trained on the current training data with this scikit-learn."""
+    return (artifact is not None
+            and artifact['fingerprint'] == training_fingerprint(method, label_rules(method, artifact.get('label_rules')))
+            and artifact['sklearn_version'] == sklearn.__version__)
@@ -0,0 +1,212 @@
+#polygonscan_client.py //Shared access point for the Polygonscan API: URL building, a pooled HTTP session,
+#retries with backoff, a global rate limit that adapts to throttling, and the on-disk response cache//
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlencode, urlparse, urlunparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import profiling
+import response_cache
+from rate_limiter import TokenBucket
+
+# Base URL of the API, can point at a local mock server for benchmarks
+api_url = os.getenv('POLYSCAN_API_URL', 'https://api.polygonscan.com/api')
+
+# Requests per second allowed by the API key (the free Polygonscan tier allows 5)
+rate_limit = float(os.getenv('POLYSCAN_RATE_LIMIT', 5))
+
+# One limiter for the whole process so concurrent fetchers share the key's quota
+limiter = TokenBucket(rate_limit)
+
+# Throttled responses halve the limiter's rate, successful ones win it back a step at a time
+# up to rate_limit; the rate never drops below min_rate
+min_rate = 0.5
+rate_increase = 0.01  # fraction of rate_limit regained per successful request
+
+# Attempts after the first one, for network errors, HTTP 429/5xx and throttled responses
+max_retries = int(os.getenv('POLYSCAN_MAX_RETRIES', 5))
+backoff_base = 0.5  # seconds, doubled on every attempt
+backoff_cap = 30.0
+
+# Seconds to wait for a connection and for a response
+timeout = (10, float(os.getenv('POLYSCAN_TIMEOUT', 30)))
+
+# Keep-alive connections shared by all fetcher threads
+pool_size = int(os.getenv('POLYSCAN_POOL_SIZE', 32))
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=pool_size))
+session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=pool_size))
+
+# SQLite file of cached responses; set POLYSCAN_CACHE to an empty string to turn the cache off
+cache_path = os.getenv('POLYSCAN_CACHE', 'Database/polygonscan_cache.db')
+
+# Offline replay: answer only from the cache, even with expired entries, and never touch the network
+offline = os.getenv('POLYSCAN_OFFLINE', '') not in ('', '0')
+
+_cache = None
+_cache_lock = threading.Lock()
+
+# Requests sent, retries and throttled responses in this process
+_request_count = 0
+_retry_count = 0
+_throttle_count = 0
+_request_count_lock = threading.Lock()
+_rate_lock = threading.Lock()
+
+
+def get_api_key():
+    """Return the API key from the environment."""
+    api_key = os.getenv('POLYSCAN_API_KEY')
+    if not api_key:
+        raise ValueError("API Key is not set in environment variables")
+    return api_key
+
+
+def build_url(query_params):
+    """Build the request URL for the given query parameters (the API key is added here)."""
+    params = dict(query_params)
+    params['apikey'] = get_api_key()
+    parsed = urlparse(api_url)
+    return urlunparse((parsed.scheme, parsed.netloc, parsed.path, '', urlencode(params), ''))
+
+
+class OfflineCacheMiss(requests.RequestException, response_cache.CacheMiss):
+    """A request in offline mode that the cache can't answer."""
+
+
+def get_cache():
+    """Return the response cache for cache_path, or None when caching is turned off."""
+    global _cache
+    if not cache_path:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != cache_path:
+            _cache = response_cache.ResponseCache(cache_path)
+        return _cache
+
+
+def get_json(query_params):
+    """Return the decoded JSON response, from the cache or by calling the API after the rate limiter.
+
+    Raises requests.RequestException or json.JSONDecodeError like the callers expect; in offline
+    mode a response that was never stored raises OfflineCacheMiss, a RequestException.
+    """
+    cache = get_cache()
+    if cache is not None:
+        payload = cache.get(api_url, query_params, allow_expired=offline)
+        if payload is not None:
+            profiling.count('polygonscan.cache_hits')
+            return payload
+    if offline:
+        raise OfflineCacheMiss(f"No cached response for {response_cache.normalize_params(query_params)}")
+
+    payload = request_with_retries(build_url(query_params))
+    if cache is not None:
+        cache.put(api_url, query_params, payload)
+    return payload
+
+
+def request_with_retries(url):
+    """GET the URL through the shared session, retrying transient failures with jittered backoff.
+
+    Throttled responses slow the shared limiter down before the retry. If the API is still
+    throttling after the last attempt its response is returned, so the caller sees it fail.
+    """
+    global _request_count, _retry_count, _throttle_count
+    attempt = 0
+    while True:
+        limiter.acquire()
+        with _request_count_lock:
+            _request_count += 1
+        profiling.count('polygonscan.requests')
+        try:
+            response = session.get(url, timeout=timeout)
+            profiling.count('polygonscan.bytes', len(response.content))
+            response.raise_for_status()
+            payload = response.json()
+            throttled = is_throttled(payload)
+        except (requests.ConnectionError, requests.Timeout, json.JSONDecodeError) as e:
+            error = e
+            throttled = False
+        except requests.HTTPError as e:
+            # Other client errors won't go away by asking again
+            if e.response is None or not (e.response.status_code == 429 or e.response.status_code >= 500):
+                raise
+            error = e
+            throttled = e.response.status_code == 429
+        else:
+            if not throttled:
+                on_success()
+                return payload
+            error = None
+
+        if throttled:
+            on_throttled()
+        if attempt >= max_retries:
+            if error is not None:
+                raise error
+            return payload
+        attempt += 1
+        with _request_count_lock:
+            _retry_count += 1
+        profiling.count('polygonscan.retries')
+        delay = random.uniform(0, min(backoff_cap, backoff_base * 2 ** attempt))
+        logging.debug(f"Retrying Polygonscan request in {delay:.2f}s (attempt {attempt}): {error or 'rate limited'}")
+        time.sleep(delay)
+
+
+def is_throttled(payload):
+    """True for Polygonscan's "Max rate limit reached" answers, which come back with HTTP 200."""
+    if not isinstance(payload, dict):
+        return False
+    result = payload.get('result')
+    message = result if isinstance(result, str) else str(payload.get('error', ''))
+    return 'rate limit' in message.lower()
+
+
+def on_throttled():
+    global _throttle_count
+    with _request_count_lock:
+        _throttle_count += 1
+    profiling.count('polygonscan.throttled')
+    with _rate_lock:
+        new_rate = max(min_rate, limiter.rate / 2)
+        limiter.set_rate(new_rate, capacity=1)
+    logging.warning(f"Polygonscan rate limit reached, slowing down to {new_rate:.2f} requests per second")
+
+
+def on_success():
+    with _rate_lock:
+        if limiter.rate < rate_limit:
+            limiter.set_rate(min(rate_limit, limiter.rate + rate_limit * rate_increase))
+
+
+def set_rate_limit(rate, capacity=None):
+    """Change the quota the limiter paces requests to and recovers up to after throttling."""
+    global rate_limit
+    with _rate_lock:
+        rate_limit = float(rate)
+        limiter.set_rate(rate, capacity)
+
+
+def request_count():
+    """Return the number of API requests sent so far by this process (cache hits not included)."""
+    return _request_count
+
+
+def stats():
+    """Counters for reports: requests sent, retries, throttled responses and the current rate."""
+    return {
+        'requests': _request_count,
+        'retries': _retry_count,
+        'throttled': _throttle_count,
+        'rate': limiter.rate,
+        'rate_limit': rate_limit,
+    }
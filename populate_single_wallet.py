@@ -2,17 +2,24 @@ import os
 import requests
 import json
 import time
-from urllib.parse import urlencode, urlunparse
-import sqlite3
 from decimal import Decimal
 import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import concurrent_fetcher
+import error_log
+import polygonscan_client
+import profiling
+import transaction_store
+import wallet_sync
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Ensure API key is set
+# Ensure API key is set (not needed when replaying cached responses offline)
 api_key = os.getenv('POLYSCAN_API_KEY')
-if not api_key:
+if not api_key and not polygonscan_client.offline:
     raise ValueError("API Key is not set in environment variables")
 
 # Ensure the Database directory exists
@@ -23,31 +30,12 @@ if not os.path.exists(database_dir):
 # SQLite database connection details
 database = os.path.join(database_dir, 'transactions2.db')
 
-# Directory for errors
-error_directory = 'errors'
-if not os.path.exists(error_directory):
-    os.makedirs(error_directory)
-
 # Set to track processed wallets
 processed_wallets = set()
 
-def log_error(wallet_address, error_message):
-    """Log the wallet address and error message to a JSON file."""
-    error_log = {
-        'wallet_address': wallet_address,
-        'error_message': error_message,
-        'timestamp': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())  # Add timestamp to log
-    }
-    error_filename = f'{error_directory}/errors.json'
-    if os.path.exists(error_filename):
-        with open(error_filename, 'r') as file:
-            errors = json.load(file)
-    else:
-        errors = []
-    errors.append(error_log)
-    with open(error_filename, 'w') as file:
-        json.dump(errors, file, indent=4)
-    logging.error(f"Error logged for address {wallet_address}")
+def log_error(wallet_address, error_message, start_block=None, end_block=None):
+    """Append the wallet address, error and failed block range to errors/errors.jsonl (see error_log.py)."""
+    error_log.log_error(wallet_address, error_message, start_block, end_block, database=database)
 
 def get_starting_block(wallet_address):
     """Fetch the starting block number for a specific address from Polygonscan."""
@@ -58,16 +46,11 @@ def get_starting_block(wallet_address):
         'startblock': 0,
         'endblock': 99999999,
         'sort': 'asc',
-        'apikey': api_key,
         'page': 1,
         'offset': 1  # Limit to first transaction to get starting block
     }
-    url_parts = ('https', 'api.polygonscan.com', '/api', '', urlencode(query_params), '')
-    url = urlunparse(url_parts)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        tx_data = response.json()
+        tx_data = polygonscan_client.get_json(query_params)
         if 'result' in tx_data and isinstance(tx_data['result'], list) and len(tx_data['result']) > 0:
             return int(tx_data['result'][0]['blockNumber'])  # Return block number of first transaction
         else:
@@ -88,16 +71,11 @@ def get_end_block(wallet_address):
         'startblock': 0,
         'endblock': 99999999,
         'sort': 'desc',
-        'apikey': api_key,
         'page': 1,
         'offset': 1  # Limit to first transaction to get starting block
     }
-    url_parts = ('https', 'api.polygonscan.com', '/api', '', urlencode(query_params), '')
-    url = urlunparse(url_parts)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        tx_data = response.json()
+        tx_data = polygonscan_client.get_json(query_params)
         if 'result' in tx_data and isinstance(tx_data['result'], list) and len(tx_data['result']) > 0:
             return int(tx_data['result'][0]['blockNumber'])  # Return block number of first transaction
         else:
@@ -113,15 +91,10 @@ def get_current_block():
     """Fetch the current block number from Polygonscan."""
     query_params = {
         'module': 'proxy',
-        'action': 'eth_blockNumber',
-        'apikey': api_key
+        'action': 'eth_blockNumber'
     }
-    url_parts = ('https', 'api.polygonscan.com', '/api', '', urlencode(query_params), '')
-    url = urlunparse(url_parts)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        block_data = response.json()
+        block_data = polygonscan_client.get_json(query_params)
         if 'result' in block_data:
             return int(block_data['result'], 16)  # Convert hex block number to integer
     except requests.RequestException as e:
@@ -132,88 +105,26 @@ def get_current_block():
 
 def ensure_transactions_table_exists():
     """Ensure the Transactions table exists in the SQLite database."""
-    conn = sqlite3.connect(database)
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Transactions (
-        hash TEXT PRIMARY KEY,
-        nonce INTEGER,
-        blockHash TEXT,
-        blockNumber INTEGER,
-        transactionIndex INTEGER,
-        fromAddress TEXT,
-        toAddress TEXT,
-        value TEXT,
-        gas TEXT,
-        gasPrice TEXT,
-        isError INTEGER,
-        txreceipt_status INTEGER,
-        input TEXT,
-        contractAddress TEXT,
-        cumulativeGasUsed TEXT,
-        gasUsed TEXT,
-        confirmations INTEGER,
-        timestamp INTEGER
-    )
-    """)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    transaction_store.get_store(database)
 
 def filter_unique_transactions(transactions):
     """Filter out transactions that already exist in the database."""
-    conn = sqlite3.connect(database)
-    cursor = conn.cursor()
-    
-    unique_transactions = []
-    for tx in transactions:
-        cursor.execute("SELECT COUNT(*) FROM Transactions WHERE hash = ?", (tx.get('hash'),))
-        if cursor.fetchone()[0] == 0:
-            unique_transactions.append(tx)
-    
-    cursor.close()
-    conn.close()
-    return unique_transactions
+    return transaction_store.get_store(database).filter_unique(transactions)
 
 def save_to_sql(transactions):
-    """Save the transactions data to an SQLite Database table."""
-    conn = sqlite3.connect(database)
-    cursor = conn.cursor()
-
-    for tx in transactions:
-        cursor.execute("""
-        INSERT INTO Transactions (
-            hash, nonce, blockHash, blockNumber, transactionIndex, fromAddress, toAddress, value, gas, gasPrice,
-            isError, txreceipt_status, input, contractAddress, cumulativeGasUsed, gasUsed, confirmations, timestamp
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            tx.get('hash'),
-            int(tx.get('nonce', 0)),
-            tx.get('blockHash'),
-            int(tx.get('blockNumber', 0)),
-            int(tx.get('transactionIndex', 0)),
-            tx.get('from'),
-            tx.get('to'),
-            str(tx.get('value', 0)),
-            str(tx.get('gas', 0)),
-            str(tx.get('gasPrice', 0)),
-            int(tx.get('isError', 0)),
-            int(tx.get('txreceipt_status', 0)),
-            tx.get('input'),
-            tx.get('contractAddress'),
-            str(tx.get('cumulativeGasUsed', 0)),
-            str(tx.get('gasUsed', 0)),
-            int(tx.get('confirmations', 0)),
-            int(tx.get('timeStamp', 0))
-        ))
-
-    conn.commit()
-    cursor.close()
-    conn.close()
+    """Save the new transactions of a page to the SQLite Database table and return them."""
+    with profiling.stage('save_to_sql') as stage:
+        saved = transaction_store.get_store(database).save(transactions)
+        stage.rows = len(saved)
+    return saved
 
 
+@profiling.timed()
 def fetch_transactions(wallet_address, start_block, end_block, chunk_size):
-    """Fetch transactions for a specific address from Polygonscan and save them in an SQL table."""
+    """Fetch transactions for a specific address from Polygonscan and save them in an SQL table.
+
+    Returns True when every block up to end_block was fetched.
+    """
     
     print("fetch_transactions running")
     # Ensure the Transactions table exists
@@ -223,13 +134,13 @@ def fetch_transactions(wallet_address, start_block, end_block, chunk_size):
     start_time = time.time()
     total_transactions = 0
     max_transactions_per_query = 10000  # Polygonscan limit
+    completed = True
 
-    last_block_number = start_block  # Initialize the last block number
-
-    while start_block < end_block:
+    while start_block <= end_block:
         page = 1  # Reset pagination for each block range
 
         transactions_fetched = 0
+        highest_block = None
         
         while True:
             query_params = {
@@ -239,17 +150,11 @@ def fetch_transactions(wallet_address, start_block, end_block, chunk_size):
                 'startblock': start_block,  # Keep start_block fixed during pagination
                 'endblock': end_block,
                 'sort': 'asc',
-                'apikey': api_key,
                 'page': page,
                 'offset': chunk_size,  # Fetch `chunk_size` transactions per page
             }
-            url_parts = ('https', 'api.polygonscan.com', '/api', '', urlencode(query_params), '')
-            url = urlunparse(url_parts)
-        
             try:
-                response = requests.get(url)
-                response.raise_for_status()
-                tx_data = response.json()
+                tx_data = polygonscan_client.get_json(query_params)
 
                 if 'result' in tx_data and isinstance(tx_data['result'], list):
                     transactions = tx_data['result']
@@ -258,10 +163,9 @@ def fetch_transactions(wallet_address, start_block, end_block, chunk_size):
                         logging.info("No more transactions found. Exiting pagination loop.")
                         break
                 
-                    # Filter out transactions that already exist in the database
-                    unique_transactions = filter_unique_transactions(transactions)
+                    # Save the transactions that are not in the database yet
+                    unique_transactions = save_to_sql(transactions)
                     total_transactions += len(unique_transactions)
-                    save_to_sql(unique_transactions)
                     logging.info(f"Data has been written to the SQL database. Total transactions pulled so far: {total_transactions}")
 
                     # Track the highest block number in this batch
@@ -269,6 +173,10 @@ def fetch_transactions(wallet_address, start_block, end_block, chunk_size):
                     highest_block = max([int(tx['blockNumber']) for tx in transactions])
                     logging.info(f"Highest block fetched in this batch: {highest_block}")
 
+                    # A short page is the last one of the range
+                    if len(transactions) < chunk_size:
+                        break
+
                     # Update pagination
                     page += 1  # Keep paginating until no more transactions
 
@@ -280,33 +188,113 @@ def fetch_transactions(wallet_address, start_block, end_block, chunk_size):
                 else:
                     #logging.warning("Failed to fetch transactions. Exiting.")
                     logging.warning(f"Invalid or empty response: {tx_data}")
+                    completed = False
                     break
 
             except requests.RequestException as e:
-                log_error(wallet_address, f"Request error: {e}")
+                log_error(wallet_address, f"Request error: {e}", start_block, end_block)
+                completed = False
                 break
             except json.JSONDecodeError:
-                log_error(wallet_address, "Failed to decode JSON from response.")
+                log_error(wallet_address, "Failed to decode JSON from response.", start_block, end_block)
+                completed = False
                 break
         
-            time.sleep(0.2)  # Consider adding exponential backoff for rate limits
 
-        # After all pages are fetched, update start_block for the next fetch
-        if highest_block > start_block:
-            start_block = highest_block + 1
-            logging.info(f"Updated start_block for the next fetch: {start_block}")
+        # The range is finished unless the 10,000 transaction limit cut it short
+        if not completed or transactions_fetched < max_transactions_per_query:
+            break
+
+        # The limit can cut the highest block in half, so the next range starts at that block;
+        # the rows fetched twice are dropped by save_to_sql
+        if highest_block <= start_block:
+            log_error(wallet_address, f"More than {max_transactions_per_query} transactions in block {start_block}",
+                      start_block, end_block)
+            completed = False
+            break
+        start_block = highest_block
+        logging.info(f"Updated start_block for the next fetch: {start_block}")
     
     end_time = time.time()
     total_time = end_time - start_time
     logging.info(f"Total time taken: {total_time:.2f} seconds")
     logging.info(f"Total transactions processed: {total_transactions}")
+    return completed
+
+
+@profiling.timed()
+def fetch_transactions_concurrent(wallet_address, start_block, end_block, chunk_size, max_workers=8):
+    """Concurrent fetch_transactions: the block range is split into partitions sized by transaction
+    density, so even exchange-sized histories are downloaded several ranges at a time.
+
+    Returns True when every range was fetched without errors.
+    """
+    ensure_transactions_table_exists()
+    processed_wallets.add(wallet_address)
+    start_time = time.time()
 
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        transactions, errors = concurrent_fetcher.fetch_wallet_partitioned(wallet_address, start_block, end_block,
+                                                                           chunk_size, executor)
+    for error in errors:
+        log_error(wallet_address, error)
 
+    unique_transactions = save_to_sql(transactions)
 
-def main():
+    logging.info(f"Total time taken: {time.time() - start_time:.2f} seconds")
+    logging.info(f"Total transactions processed: {len(unique_transactions)}")
+    return not errors
+
+
+def sync_wallet(wallet_address, chunk_size=1000, concurrent=False):
+    """Bring a wallet's transactions up to date, fetching only the blocks after its last sync.
+
+    The first sync of a wallet fetches its whole history; later ones cost one or two pages.
+    Returns True when the wallet is fully synced.
+    """
+    ensure_transactions_table_exists()
+    wallet_address = wallet_address.lower().strip()
+
+    last_synced_block = wallet_sync.get_last_synced_block(database, wallet_address)
+    if last_synced_block is None:
+        start_block = get_starting_block(wallet_address)
+        if start_block is None:
+            logging.error("Could not determine the starting block number.")
+            return False
+    else:
+        start_block = last_synced_block + 1
+    logging.info(f"Starting block is {start_block}")
+
+    end_block = get_current_block()
+    if end_block is None:
+        logging.error("Could not determine the current block number.")
+        return False
+    logging.info(f"Ending block is {end_block}")
+
+    if concurrent:
+        completed = fetch_transactions_concurrent(wallet_address, start_block, end_block, chunk_size)
+    else:
+        completed = fetch_transactions(wallet_address, start_block, end_block, chunk_size)
+
+    # Only move the high-water mark when nothing was missed, so a failed sync is retried, and keep
+    # it below the unfinalized blocks so the next sync fetches those again
+    if completed:
+        wallet_sync.set_last_synced_block(database, wallet_address, wallet_sync.synced_block(end_block))
+    wallet_sync.refresh_confirmations(database, wallet_address, end_block)
+    return completed
+
+
+def main(concurrent=False, incremental=False):
     # Prompt for user inputs
     wallet_address = input("Enter the wallet address: ")
 
+    # Only fetch the blocks added since this wallet was last synced
+    if incremental:
+        if not sync_wallet(wallet_address, concurrent=concurrent):
+            logging.error("Could not sync the wallet. Exiting.")
+            exit()
+        return wallet_address.lower().strip()
+
     # Automatically determine the starting block number
     start_block = get_starting_block(wallet_address)
     logging.info(f"Starting block is {start_block}")
@@ -326,9 +314,18 @@ def main():
     chunk_size = 1000  # 1000 transactions per request, adjust as needed
 
     # Fetch transactions for the wallet address
-    fetch_transactions(wallet_address, start_block, end_block, chunk_size)
+    if concurrent:
+        fetch_transactions_concurrent(wallet_address, start_block, end_block, chunk_size)
+    else:
+        fetch_transactions(wallet_address, start_block, end_block, chunk_size)
     
     return wallet_address
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Populate the database with the transactions of a single wallet.")
+    parser.add_argument('--concurrent', action='store_true', help="Fetch block ranges in parallel under the shared rate limit")
+    parser.add_argument('--incremental', action='store_true', help="Only fetch the blocks after the wallet's last sync")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    main(concurrent=args.concurrent, incremental=args.incremental)
+    profiling.finish(args.profile)
@@ -5,17 +5,23 @@ import os
 import requests
 import json
 import time
-from urllib.parse import urlencode, urlunparse
-import sqlite3
 from decimal import Decimal
 import logging
+import argparse
+
+import concurrent_fetcher
+import error_log
+import polygonscan_client
+import profiling
+import transaction_store
+import crawl_state
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Ensure API key is set
+# Ensure API key is set (not needed when replaying cached responses offline)
 api_key = os.getenv('POLYSCAN_API_KEY')
-if not api_key:
+if not api_key and not polygonscan_client.offline:
     raise ValueError("API Key is not set in environment variables")
 
 # Ensure the Database directory exists
@@ -26,31 +32,12 @@ if not os.path.exists(database_dir):
 # SQLite database connection details
 database = os.path.join(database_dir, 'transactions.db')
 
-# Directory for errors
-error_directory = 'errors'
-if not os.path.exists(error_directory):
-    os.makedirs(error_directory)
-
 # Set to track processed wallets
 processed_wallets = set()
 
-def log_error(wallet_address, error_message):
-    """Log the wallet address and error message to a JSON file."""
-    error_log = {
-        'wallet_address': wallet_address,
-        'error_message': error_message,
-        'timestamp': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())  # Add timestamp to log
-    }
-    error_filename = f'{error_directory}/errors.json'
-    if os.path.exists(error_filename):
-        with open(error_filename, 'r') as file:
-            errors = json.load(file)
-    else:
-        errors = []
-    errors.append(error_log)
-    with open(error_filename, 'w') as file:
-        json.dump(errors, file, indent=4)
-    logging.error(f"Error logged for address {wallet_address}")
+def log_error(wallet_address, error_message, start_block=None, end_block=None):
+    """Append the wallet address, error and failed block range to errors/errors.jsonl (see error_log.py)."""
+    error_log.log_error(wallet_address, error_message, start_block, end_block, database=database)
 
 def get_starting_block(wallet_address):
     """Fetch the starting block number for a specific address from Polygonscan."""
@@ -61,16 +48,11 @@ def get_starting_block(wallet_address):
         'startblock': 0,
         'endblock': 99999999,
         'sort': 'asc',
-        'apikey': api_key,
         'page': 1,
         'offset': 1  # Limit to first transaction to get starting block
     }
-    url_parts = ('https', 'api.polygonscan.com', '/api', '', urlencode(query_params), '')
-    url = urlunparse(url_parts)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        tx_data = response.json()
+        tx_data = polygonscan_client.get_json(query_params)
         if 'result' in tx_data and isinstance(tx_data['result'], list) and len(tx_data['result']) > 0:
             return int(tx_data['result'][0]['blockNumber'])  # Return block number of first transaction
         else:
@@ -86,15 +68,10 @@ def get_current_block():
     """Fetch the current block number from Polygonscan."""
     query_params = {
         'module': 'proxy',
-        'action': 'eth_blockNumber',
-        'apikey': api_key
+        'action': 'eth_blockNumber'
     }
-    url_parts = ('https', 'api.polygonscan.com', '/api', '', urlencode(query_params), '')
-    url = urlunparse(url_parts)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        block_data = response.json()
+        block_data = polygonscan_client.get_json(query_params)
         if 'result' in block_data:
             return int(block_data['result'], 16)  # Convert hex block number to integer
     except requests.RequestException as e:
@@ -105,100 +82,75 @@ def get_current_block():
 
 def ensure_transactions_table_exists():
     """Ensure the Transactions table exists in the SQLite database."""
-    conn = sqlite3.connect(database)
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Transactions (
-        hash TEXT PRIMARY KEY,
-        nonce INTEGER,
-        blockHash TEXT,
-        blockNumber INTEGER,
-        transactionIndex INTEGER,
-        fromAddress TEXT,
-        toAddress TEXT,
-        value TEXT,
-        gas TEXT,
-        gasPrice TEXT,
-        isError INTEGER,
-        txreceipt_status INTEGER,
-        input TEXT,
-        contractAddress TEXT,
-        cumulativeGasUsed TEXT,
-        gasUsed TEXT,
-        confirmations INTEGER,
-        timestamp INTEGER
-    )
-    """)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    transaction_store.get_store(database)
 
 def filter_unique_transactions(transactions):
     """Filter out transactions that already exist in the database."""
-    conn = sqlite3.connect(database)
-    cursor = conn.cursor()
-    
-    unique_transactions = []
-    for tx in transactions:
-        cursor.execute("SELECT COUNT(*) FROM Transactions WHERE hash = ?", (tx.get('hash'),))
-        if cursor.fetchone()[0] == 0:
-            unique_transactions.append(tx)
-    
-    cursor.close()
-    conn.close()
-    return unique_transactions
+    return transaction_store.get_store(database).filter_unique(transactions)
 
 def save_to_sql(transactions):
-    """Save the transactions data to an SQLite Database table."""
-    conn = sqlite3.connect(database)
-    cursor = conn.cursor()
-
-    for tx in transactions:
-        cursor.execute("""
-        INSERT INTO Transactions (
-            hash, nonce, blockHash, blockNumber, transactionIndex, fromAddress, toAddress, value, gas, gasPrice,
-            isError, txreceipt_status, input, contractAddress, cumulativeGasUsed, gasUsed, confirmations, timestamp
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            tx.get('hash'),
-            int(tx.get('nonce', 0)),
-            tx.get('blockHash'),
-            int(tx.get('blockNumber', 0)),
-            int(tx.get('transactionIndex', 0)),
-            tx.get('from'),
-            tx.get('to'),
-            str(tx.get('value', 0)),
-            str(tx.get('gas', 0)),
-            str(tx.get('gasPrice', 0)),
-            int(tx.get('isError', 0)),
-            int(tx.get('txreceipt_status', 0)),
-            tx.get('input'),
-            tx.get('contractAddress'),
-            str(tx.get('cumulativeGasUsed', 0)),
-            str(tx.get('gasUsed', 0)),
-            int(tx.get('confirmations', 0)),
-            int(tx.get('timeStamp', 0))
-        ))
-
-    conn.commit()
-    cursor.close()
-    conn.close()
-
-def fetch_tx_by_address(wallet_address, start_block, end_block, chunk_size, depth=0, max_depth=1):
-    """Fetch transactions for a specific address from Polygonscan and save them in SQL table."""
-    if wallet_address in processed_wallets or depth > max_depth:
-        return
-    
+    """Save the new transactions of a page to the SQLite Database table and return them."""
+    with profiling.stage('save_to_sql') as stage:
+        saved = transaction_store.get_store(database).save(transactions)
+        stage.rows = len(saved)
+    return saved
+
+
+@profiling.timed()
+def fetch_tx_by_address(wallet_address, start_block, end_block, chunk_size, max_depth=1, restart=False):
+    """Fetch transactions for a wallet and its neighbours up to max_depth and save them in SQL table.
+
+    Progress is checkpointed in the crawl state database after every page, so calling this again for the
+    same wallet resumes the crawl (with its original end block) instead of starting over.
+    Pass restart=True to throw the saved progress away.
+    """
     # Ensure the Transactions table exists
     ensure_transactions_table_exists()
-    
-    processed_wallets.add(wallet_address)
+
+    frontier = crawl_state.get_frontier(database)
+    crawl = frontier.get_crawl(wallet_address)
+    if crawl is None or restart:
+        frontier.start_crawl(wallet_address, start_block, end_block, max_depth)
+    else:
+        end_block, max_depth, _ = crawl
+        frontier.retry_failed(wallet_address)
+        logging.info(f"Resuming crawl from {wallet_address}: {frontier.summary(wallet_address)}")
+
     start_time = time.time()
+    while True:
+        entry = frontier.next_wallet(wallet_address)
+        if entry is None:
+            break
+        address, depth, wallet_start_block, last_block = entry
+
+        if wallet_start_block is None:
+            wallet_start_block = get_starting_block(address)
+            if wallet_start_block is None:
+                frontier.set_status(wallet_address, address, crawl_state.FAILED)
+                continue
+            frontier.set_start_block(wallet_address, address, wallet_start_block)
+
+        resume_block = wallet_start_block if last_block is None else last_block + 1
+        completed = fetch_wallet_history(wallet_address, address, depth, resume_block, end_block, chunk_size, max_depth)
+        frontier.set_status(wallet_address, address, crawl_state.DONE if completed else crawl_state.FAILED)
+        processed_wallets.add(address)
+
+    status = frontier.finish_crawl(wallet_address)
+    end_time = time.time()
+    total_time = end_time - start_time
+    logging.info(f"Total time taken: {total_time:.2f} seconds")
+    logging.info(f"Crawl {status}: {frontier.summary(wallet_address)}")
+
+def fetch_wallet_history(root, wallet_address, depth, start_block, end_block, chunk_size, max_depth):
+    """Fetch one wallet of a crawl, checkpointing the last complete block after every page.
+
+    Returns True when the wallet's range was fetched to the end.
+    """
+    frontier = crawl_state.get_frontier(database)
     page = 1
-    new_wallets = set()
     total_transactions = 0
-    
-    while True:
+
+    while start_block <= end_block:
         query_params = {
             'module': 'account',
             'action': 'txlist',
@@ -206,64 +158,86 @@ def fetch_tx_by_address(wallet_address, start_block, end_block, chunk_size, dept
             'startblock': start_block,
             'endblock': end_block,
             'sort': 'asc',
-            'apikey': api_key,
             'page': page,
             'offset': chunk_size,
         }
-        url_parts = ('https', 'api.polygonscan.com', '/api', '', urlencode(query_params), '')
-        url = urlunparse(url_parts)
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            tx_data = response.json()
-            if 'result' in tx_data and isinstance(tx_data['result'], list):
-                transactions = tx_data['result']
-
-                if not transactions:
-                    logging.info("No more transactions found. Exiting pagination loop.")
-                    break
-                
-                # Filter out transactions that already exist in the database
-                unique_transactions = filter_unique_transactions(transactions)
-                total_transactions += len(unique_transactions)
-                save_to_sql(unique_transactions)
-                logging.info(f"Data has been written to the SQL database. Total transactions pulled so far: {total_transactions}")
-                
-                for tx in transactions:
-                    if tx['to'] and tx['to'] not in processed_wallets:
-                        new_wallets.add(tx['to'])
-                    if tx['from'] and tx['from'] not in processed_wallets:
-                        new_wallets.add(tx['from'])
-                
-                page += 1
-                # Update start_block to prevent fetching duplicate transactions
-                start_block = int(transactions[-1]['blockNumber']) + 1
-            else:
-                logging.warning("Failed to fetch transactions. Exiting.")
-                break
+            tx_data = polygonscan_client.get_json(query_params)
         except requests.RequestException as e:
-            log_error(wallet_address, f"Request error: {e}")
-            break
+            log_error(wallet_address, f"Request error: {e}", start_block, end_block)
+            return False
         except json.JSONDecodeError:
-            log_error(wallet_address, "Failed to decode JSON from response.")
+            log_error(wallet_address, "Failed to decode JSON from response.", start_block, end_block)
+            return False
+
+        if not ('result' in tx_data and isinstance(tx_data['result'], list)):
+            logging.warning("Failed to fetch transactions. Exiting.")
+            return False
+
+        transactions = tx_data['result']
+        if not transactions:
+            logging.info("No more transactions found. Exiting pagination loop.")
             break
-        
-        time.sleep(0.2)
-    
-    end_time = time.time()
-    total_time = end_time - start_time
-    logging.info(f"Total time taken: {total_time:.2f} seconds")
 
-    if depth < max_depth:
-        for new_wallet in new_wallets:
-            new_start_block = get_starting_block(new_wallet)
-            if new_start_block is not None:
-                fetch_tx_by_address(new_wallet, new_start_block, end_block, chunk_size, depth + 1, max_depth)
+        # Save the transactions that are not in the database yet
+        unique_transactions = save_to_sql(transactions)
+        total_transactions += len(unique_transactions)
+        logging.info(f"Data has been written to the SQL database. Total transactions pulled so far: {total_transactions}")
+
+        new_wallets = set()
+        if depth < max_depth:
+            for tx in transactions:
+                if tx['to'] and tx['to'] != wallet_address:
+                    new_wallets.add(tx['to'])
+                if tx['from'] and tx['from'] != wallet_address:
+                    new_wallets.add(tx['from'])
+
+        if len(transactions) < chunk_size:
+            # Last page: the whole range is done
+            frontier.record_page(root, wallet_address, end_block, new_wallets, depth + 1)
+            break
+
+        # The last block of the page may continue on the next page, so restart the range from
+        # it and only checkpoint the blocks before it. A single block larger than a page is
+        # paged through instead.
+        highest_block = int(transactions[-1]['blockNumber'])
+        if highest_block > start_block:
+            start_block = highest_block
+            page = 1
+        else:
+            page += 1
+        frontier.record_page(root, wallet_address, start_block - 1, new_wallets, depth + 1)
+
+    return True
+
+@profiling.timed()
+def fetch_tx_by_address_concurrent(wallet_address, start_block, end_block, chunk_size, max_depth=1, max_workers=8):
+    """Concurrent fetch_tx_by_address: the wallets of each depth are fetched in parallel under the shared rate limit."""
+    ensure_transactions_table_exists()
+
+    def save(transactions):
+        return len(save_to_sql(transactions))
+
+    return concurrent_fetcher.crawl(wallet_address, start_block, end_block, chunk_size, save, log_error,
+                                    max_depth=max_depth, max_workers=max_workers, processed_wallets=processed_wallets)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Populate the training database from a wallet and its neighbours.")
+    parser.add_argument('--concurrent', action='store_true', help="Fetch wallets in parallel under the shared rate limit")
+    parser.add_argument('--workers', type=int, default=8, help="Number of fetch threads in concurrent mode")
+    parser.add_argument('--restart', action='store_true', help="Ignore the saved progress of an earlier crawl from this wallet")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+
     # Prompt for user inputs
     wallet_address = input("Enter the wallet address: ")
 
+    # An interrupted crawl resumes with its saved blocks, without asking the API again
+    if not args.concurrent and not args.restart and crawl_state.get_frontier(database).get_crawl(wallet_address):
+        fetch_tx_by_address(wallet_address, None, None, 1000)
+        profiling.finish(args.profile)
+        exit()
+
     # Automatically determine the starting block number
     start_block = get_starting_block(wallet_address)
     if start_block is None:
@@ -281,4 +255,8 @@ if __name__ == "__main__":
     chunk_size = 1000  # 1000 transactions per request, adjust as needed
 
     # Fetch transactions for the wallet address
-    fetch_tx_by_address(wallet_address, start_block, end_block, chunk_size)
+    if args.concurrent:
+        fetch_tx_by_address_concurrent(wallet_address, start_block, end_block, chunk_size, max_workers=args.workers)
+    else:
+        fetch_tx_by_address(wallet_address, start_block, end_block, chunk_size, restart=args.restart)
+    profiling.finish(args.profile)
@@ -0,0 +1,157 @@
+#profiling.py //Stage timings and counters for one run of the pipeline.
+#Stages are timed with `with profiling.stage('fit'):` or the @profiling.timed decorator; calls,
+#seconds and rows add up per stage name across calls and threads. Counters (API requests,
+#bytes fetched, rows written...) are bumped with profiling.count. Everything is kept in memory
+#and costs a perf_counter call per stage, so it is always on; write_report saves the run as JSON
+#so runs can be compared. Stages asked to track memory also record their peak RSS.
+#Usage: python profiling.py Reports/profile_*.json  (prints saved reports)//
+
+import argparse
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import memory_usage
+
+reports_dir = 'Reports'
+
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_started_at = time.time()
+
+
+class StageRecord:
+    """What one pass through a stage measured; set .rows to say how many rows it handled."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.seconds = 0.0
+        self.peak_rss = None
+
+
+def _record(record):
+    with _lock:
+        totals = _stages.setdefault(record.name, {'calls': 0, 'seconds': 0.0, 'rows': 0})
+        totals['calls'] += 1
+        totals['seconds'] += record.seconds
+        if record.rows is not None:
+            totals['rows'] += int(record.rows)
+        if record.peak_rss is not None:
+            totals['peak_rss_bytes'] = max(totals.get('peak_rss_bytes', 0), record.peak_rss)
+
+
+@contextmanager
+def stage(name, memory=False):
+    """Time the body under `name`. memory=True also samples its peak RSS (a thread, so not for hot loops)."""
+    record = StageRecord(name)
+    monitor = memory_usage.PeakRSSMonitor() if memory else None
+    if monitor is not None:
+        monitor.__enter__()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - start
+        if monitor is not None:
+            monitor.__exit__(None, None, None)
+            record.peak_rss = monitor.peak
+        _record(record)
+
+
+def timed(name=None, memory=False):
+    """Decorator form of stage(); the stage name defaults to the function's name."""
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name, memory):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def reset():
+    """Forget everything recorded so far, e.g. between benchmark runs in one process."""
+    global _started_at
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _started_at = time.time()
+
+
+def report():
+    """The run so far as a JSON-serializable dict."""
+    with _lock:
+        stages = {name: dict(totals, seconds=round(totals['seconds'], 6)) for name, totals in _stages.items()}
+        counters = dict(_counters)
+    return {
+        'command': ' '.join(sys.argv),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(_started_at)),
+        'seconds': round(time.time() - _started_at, 3),
+        'peak_rss_bytes': memory_usage.peak_rss(),
+        'stages': stages,
+        'counters': counters,
+    }
+
+
+def write_report(path=None):
+    """Save report() as JSON, by default to Reports/profile_<script>_<time>.json; returns the path."""
+    if not path:
+        script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'python'
+        path = os.path.join(reports_dir, f"profile_{script}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as file:
+        json.dump(report(), file, indent=4)
+    return path
+
+
+def print_report(run=None):
+    run = run or report()
+    print(f"{run['command']}: {run['seconds']:.1f}s, peak RSS {memory_usage.format_bytes(run['peak_rss_bytes'])}")
+    print(f"  {'stage':<32} {'calls':>7} {'seconds':>9} {'rows':>10} {'rows/s':>10}")
+    for name, totals in sorted(run['stages'].items(), key=lambda item: -item[1]['seconds']):
+        rate = f"{totals['rows'] / totals['seconds']:.0f}" if totals['rows'] and totals['seconds'] else ''
+        peak = totals.get('peak_rss_bytes')
+        peak = f"  peak RSS {memory_usage.format_bytes(peak)}" if peak is not None else ''
+        print(f"  {name:<32} {totals['calls']:>7} {totals['seconds']:>9.3f} {totals['rows'] or '':>10} {rate:>10}{peak}")
+    for name, value in sorted(run['counters'].items()):
+        print(f"  {name:<32} {value:>7}")
+
+
+def add_argument(parser):
+    """Add the --profile option the pipeline scripts share."""
+    parser.add_argument('--profile', nargs='?', const='', metavar='PATH',
+                        help=f"Write stage timings and counters as JSON (default: {reports_dir}/profile_<script>_<time>.json)")
+
+
+def finish(path):
+    """Write and print the report when --profile was given (path is None otherwise)."""
+    if path is None:
+        return None
+    path = write_report(path)
+    print_report()
+    print(f"Profile saved to {path}")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print saved profile reports.")
+    parser.add_argument('reports', nargs='+', help="JSON files written by --profile")
+    args = parser.parse_args()
+    for report_path in args.reports:
+        with open(report_path) as file:
+            print_report(json.load(file))
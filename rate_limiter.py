@@ -0,0 +1,43 @@
+#rate_limiter.py //Token-bucket rate limiter shared by every thread that calls the Polygonscan API//
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket: at most `rate` acquisitions per second, with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("Rate must be a positive number of requests per second")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` tokens are available, then take them."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            # Sleep outside the lock so other threads can refill and check the bucket
+            time.sleep(wait)
+
+    def set_rate(self, rate, capacity=None):
+        """Change the refill rate (and optionally the burst size) without losing accumulated tokens."""
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+            if capacity is not None:
+                self.capacity = float(capacity)
+            self.tokens = min(self.tokens, self.capacity)
@@ -0,0 +1,171 @@
+#response_cache.py //On-disk cache of Polygonscan responses, used by polygonscan_client.get_json.
+#Responses are stored under a hash of the API URL and the normalized query parameters (without
+#the API key). Answers about finalized blocks can't change and are kept for good; anything that
+#reaches near the chain head expires after a short TTL. In offline mode every stored response is
+#served regardless of age, so a pipeline that ran once can be replayed without network access//
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# Blocks this far below the chain head are treated as final
+finality_depth = int(os.getenv('POLYSCAN_CACHE_FINALITY', 256))
+
+# Seconds a response about unfinalized blocks (or the head itself) stays valid
+head_ttl = float(os.getenv('POLYSCAN_CACHE_TTL', 15))
+
+CACHE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS Responses (
+        key TEXT PRIMARY KEY,
+        params TEXT,
+        body BLOB,
+        fetched_at REAL,
+        expires_at REAL
+    )
+'''
+
+
+class CacheMiss(Exception):
+    """Raised by the client in offline mode when a request has no stored response."""
+
+
+def normalize_params(query_params):
+    """Query parameters as sorted strings, without the API key; addresses are lower-cased."""
+    params = {}
+    for name, value in query_params.items():
+        if name.lower() == 'apikey':
+            continue
+        value = str(value)
+        params[name] = value.lower() if name in ('address', 'contractaddress') else value
+    return dict(sorted(params.items()))
+
+
+def cache_key(url, query_params):
+    payload = json.dumps([url.rstrip('/'), normalize_params(query_params)], separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """SQLite store of decoded API responses, safe to share between fetcher threads."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(CACHE_SCHEMA)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS CacheMeta (name TEXT PRIMARY KEY, value INTEGER)")
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        row = self.conn.execute("SELECT value FROM CacheMeta WHERE name = 'head_block'").fetchone()
+        self.head_block = row[0] if row else None
+
+    def get(self, url, query_params, allow_expired=False):
+        """Return the stored response, or None if there is none or it has expired."""
+        with self.lock:
+            row = self.conn.execute("SELECT body, expires_at FROM Responses WHERE key = ?",
+                                    (cache_key(url, query_params),)).fetchone()
+            if row is None or (not allow_expired and row[1] is not None and row[1] < time.time()):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, url, query_params, payload):
+        """Store a response if it is a real answer; errors and rate-limit replies are never kept."""
+        if not self.cacheable(query_params, payload):
+            return False
+        self.observe_head(query_params, payload)
+        ttl = None if self.is_final(query_params, payload) else head_ttl
+        now = time.time()
+        body = zlib.compress(json.dumps(payload, separators=(',', ':')).encode())
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO Responses (key, params, body, fetched_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (cache_key(url, query_params), json.dumps(normalize_params(query_params)), body, now,
+                 None if ttl is None else now + ttl))
+            self.conn.commit()
+        return True
+
+    @staticmethod
+    def cacheable(query_params, payload):
+        if not isinstance(payload, dict):
+            return False
+        result = payload.get('result')
+        if query_params.get('module') == 'proxy':
+            return isinstance(result, str) and result.startswith('0x')
+        return isinstance(result, list)
+
+    def observe_head(self, query_params, payload):
+        """Track the highest chain head seen, from eth_blockNumber or from transaction confirmations."""
+        result = payload['result']
+        if query_params.get('action') == 'eth_blockNumber':
+            head = int(result, 16)
+        elif result and 'confirmations' in result[0]:
+            head = max(int(tx['blockNumber']) + int(tx['confirmations']) for tx in result)
+        else:
+            return
+        with self.lock:
+            if self.head_block is None or head > self.head_block:
+                self.head_block = head
+                self.conn.execute("INSERT OR REPLACE INTO CacheMeta (name, value) VALUES ('head_block', ?)", (head,))
+
+    def is_final(self, query_params, payload):
+        """True when the response can't change any more.
+
+        That is the case when the queried range ends at a finalized block, and also for a full
+        page in ascending order whose last block is finalized: later transactions sort after it.
+        """
+        if query_params.get('module') == 'proxy' or self.head_block is None:
+            return False
+        finalized_block = self.head_block - finality_depth
+        if int(query_params.get('endblock', finalized_block + 1)) <= finalized_block:
+            return True
+        result = payload['result']
+        if query_params.get('sort', 'asc') == 'asc' and 'offset' in query_params and result:
+            page_full = len(result) >= int(query_params['offset'])
+            return page_full and max(int(tx['blockNumber']) for tx in result) <= finalized_block
+        return False
+
+    def purge_expired(self):
+        with self.lock:
+            deleted = self.conn.execute("DELETE FROM Responses WHERE expires_at IS NOT NULL AND expires_at < ?",
+                                        (time.time(),)).rowcount
+            self.conn.commit()
+        return deleted
+
+    def summary(self):
+        with self.lock:
+            entries, permanent, size = self.conn.execute(
+                "SELECT COUNT(*), COUNT(*) - COUNT(expires_at), COALESCE(SUM(LENGTH(body)), 0) FROM Responses").fetchone()
+        return {'entries': entries, 'permanent': permanent, 'bytes': size, 'head_block': self.head_block,
+                'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or trim the Polygonscan response cache.")
+    parser.add_argument('path', nargs='?', default=os.getenv('POLYSCAN_CACHE', 'Database/polygonscan_cache.db'))
+    parser.add_argument('--purge', action='store_true', help="Delete expired entries")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.path)
+    if args.purge:
+        print(f"Deleted {cache.purge_expired()} expired responses")
+    summary = cache.summary()
+    print(f"{summary['entries']} responses ({summary['permanent']} permanent), {summary['bytes'] / 1024 / 1024:.1f} MB "
+          f"compressed, chain head {summary['head_block']}")
+    cache.close()
@@ -1,11 +1,78 @@
 #Transaction_data_pipeline.py //This script is used to create a dataset from the transactions.db database 
 #labels the transactions based on a rule based system//
 
+import hashlib
+import json
+import os
 import sqlite3
+import numpy as np
 import pandas as pd
 from sklearn.utils import Bunch
 
+import fraud_wallet_list
+import label_stats
+import model_store
+import profiling
+import transaction_store
+import wallet_features
+
+# Rule-based labelling parameters, in the order calculate_fraud_score applies them:
+# (column, mean, standard deviation, weight added to the fraud score). These means and standard
+# deviations were computed offline; fraud_score_rules swaps in the current ones of a database.
+FRAUD_SCORE_RULES = [
+    ('gasUsed', 487483.700398221, 1229467.56529239, 0.4),
+    ('value', 1.25353784685658e+21, 6.61993367968414e+22, 0.4),
+    ('confirmations', 40566927.1218456, 8770610.74755724, 0.2),
+    ('nonce', 5386.11399239341, 62980.3777420489, 0.1),
+    ('gasPrice', 45862339962.2391, 338528269404.209, 0.3),
+    ('cumulativeGasUsed', 8703764.19729006, 6944482.88998016, 0.2),
+]
+
+# Database whose LabelStats the CSV training sets (method c) are labelled with
+stats_database = 'Database/transactions.db'
+
+
+def fraud_score_rules(database_path=None):
+    """FRAUD_SCORE_RULES with the mean and standard deviation kept in a database's LabelStats table.
+
+    The offline values are returned when there is no database or it holds too few rows.
+    """
+    stats = label_stats.current(database_path)[0] if database_path and os.path.exists(database_path) else None
+    if stats is None:
+        return FRAUD_SCORE_RULES
+    return [(column, *stats[column], weight) for column, _, _, weight in FRAUD_SCORE_RULES]
+
+
+# How far the LabelStats may drift from the rules stored flags were labelled with before they are
+# labelled again: a mean by this share of the standard deviation, a standard deviation by this share of itself
+rules_tolerance = 0.01
+
+
+def settled_rules(labelled_with, rules):
+    """The rules stored flags were labelled with, as long as the current rules are within rules_tolerance of them.
+
+    Every saved page moves the LabelStats a little, so comparing exact rules would label every
+    stored row again on each append. Returns rules when there are no earlier ones or they drifted.
+    """
+    if not labelled_with or len(labelled_with) != len(rules):
+        return rules
+    for (column, mean, stdev, weight), (new_column, new_mean, new_stdev, new_weight) in zip(labelled_with, rules):
+        if (column != new_column or weight != new_weight or abs(new_mean - mean) > rules_tolerance * new_stdev
+                or abs(new_stdev - stdev) > rules_tolerance * new_stdev):
+            return rules
+    return [tuple(rule) for rule in labelled_with]
+
+
+def rules_hash(rules, method, fraud_wallets_version=None):
+    """Short hash of everything a row's flag depends on besides the row itself.
+
+    Flags stored with it are stale once the rules, the method or the fraud list (method a) change.
+    """
+    key = json.dumps([method.lower(), [list(rule) for rule in rules], fraud_wallets_version])
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
 #1
+@profiling.timed(memory=True)
 def create_dataset_from_df(database_path, feature_columns,target_column, method):
 
     # Build the query string
@@ -50,28 +117,31 @@ def create_dataset_from_df(database_path, feature_columns,target_column, method)
     return dataset
 
 #2
+@profiling.timed()
 def fetch_data_from_sql(database_path, query, method):
     # Connect to SQLite database
     conn = sqlite3.connect(database_path)
     
     # Execute query to fetch all data from the 'Transactions' table
-    transactions_df = pd.read_sql_query(query, conn)
+    with profiling.stage('read_sql') as stage:
+        transactions_df = pd.read_sql_query(query, conn)
+        stage.rows = len(transactions_df)
 
     
     if method == 'a':
-        # Load fraud wallets from the database and normalize them
-        fraud_wallets = set(normalize_address(addr) for addr in get_fraud_wallets('Database/fraud_wallets.db'))
-        #print(f"Fraud wallets (normalized): {fraud_wallets}")
-
-        # Normalize the addresses in the DataFrame and apply the cross-check
-        transactions_df['is_from_fraud_wallet'] = transactions_df['fromAddress'].apply(
-            lambda x: 1 if normalize_address(x) in fraud_wallets else 0)
-        transactions_df['is_to_fraud_wallet'] = transactions_df['toAddress'].apply(
-            lambda x: 1 if normalize_address(x) in fraud_wallets else 0)
+        # Load fraud wallets (cached and normalized once per process)
+        fraud_wallets = fraud_wallet_list.get_fraud_wallet_list('Database/fraud_wallets.db')
+
+        # Cross-check the whole address columns against the fraud wallets
+        with profiling.stage('fraud_cross_check') as stage:
+            fraud_wallet_list.flag_fraud_columns(transactions_df, fraud_wallets)
+            stage.rows = len(transactions_df)
     
 
-    # Flag the transactions with rule-based labelling
-    transactions_df['flag'] = transactions_df.apply(lambda row: label_transaction(row, method), axis=1)
+    # Flag the transactions with rule-based labelling, using the stats of the same database
+    with profiling.stage('labeling') as stage:
+        transactions_df['flag'] = label_transactions(transactions_df, method, fraud_score_rules(database_path))
+        stage.rows = len(transactions_df)
 
     # Count the number of each flag
     flag_counts = transactions_df['flag'].value_counts()
@@ -86,11 +156,54 @@ def fetch_data_from_sql(database_path, query, method):
 
     return transactions_df
 
-def flag_transactions_csv(transactions_df, method):
-    # Flagging the transactions with rule-based labelling
+def flag_transactions_csv(transactions_df, method, rules=None):
+    # Flagging the transactions with rule-based labelling (the stats of stats_database by default)
+    method = method.lower()
+    rules = rules or fraud_score_rules(stats_database)
+    with profiling.stage('labeling') as stage:
+        transactions_df['flag'] = label_transactions(transactions_df, method, rules)
+        stage.rows = len(transactions_df)
+
+    print_flag_counts(transactions_df)
+    return transactions_df
+
+def flags_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.flags.npz'
+
+def flags_key(csv_path, rules, method):
+    return f"{model_store.fingerprint([csv_path])}:{rules_hash(rules, method)}"
+
+def flag_training_csv(transactions_df, csv_path, method, rules=None):
+    """flag_transactions_csv for the rows of csv_path, with the scores and flags cached next to the CSV.
+
+    The cache is keyed by the CSV's fingerprint and the rules hash, so a rerun on the same CSV with
+    the same rules labels nothing, and an edited CSV or LabelStats that drifted past settled_rules
+    label every row again.
+    """
     method = method.lower()
-    transactions_df['flag'] = transactions_df.apply(lambda row: label_transaction(row, method), axis=1)
+    rules = rules or fraud_score_rules(stats_database)
+    path = flags_path(csv_path)
+    with profiling.stage('labeling') as stage:
+        cached = None
+        if os.path.exists(path):
+            with np.load(path) as file:
+                if 'rules' in file:
+                    rules = settled_rules(json.loads(str(file['rules'])), rules)
+                if str(file['key']) == flags_key(csv_path, rules, method) and len(file['flag']) == len(transactions_df):
+                    cached = file['flag']
+        if cached is None:
+            score = calculate_fraud_scores(transactions_df, method, rules)
+            cached = flags_from_scores(score)
+            with open(path + '.tmp', 'wb') as file:
+                np.savez(file, key=flags_key(csv_path, rules, method), rules=json.dumps([list(rule) for rule in rules]), score=score, flag=cached)
+            os.replace(path + '.tmp', path)
+            stage.rows = len(transactions_df)
+        transactions_df['flag'] = cached
+
+    print_flag_counts(transactions_df)
+    return transactions_df
 
+def print_flag_counts(transactions_df):
     # Count the number of each flag
     flag_counts = transactions_df['flag'].value_counts()
 
@@ -99,12 +212,10 @@ def flag_transactions_csv(transactions_df, method):
     print(f"Number of 'green' flags: {flag_counts.get('green', 0)}")
     print(f"Number of 'orange' flags: {flag_counts.get('orange', 0)}")
 
-    return transactions_df
-
 #3
-def label_transaction(row, method):
+def label_transaction(row, method, rules=FRAUD_SCORE_RULES):
     # Calculate fraud score here based on the method
-    fraud_score = calculate_fraud_score(row, method)
+    fraud_score = calculate_fraud_score(row, method, rules)
            
     # Rule-based labelling
     if fraud_score < 0.5:
@@ -115,7 +226,7 @@ def label_transaction(row, method):
         return 'red'
 
 #4
-def calculate_fraud_score(row, method):
+def calculate_fraud_score(row, method, rules=FRAUD_SCORE_RULES):
     score = 0
 
     '''
@@ -140,32 +251,10 @@ def calculate_fraud_score(row, method):
         score += 0.2
     '''
 
-    mean_gasUsed = 487483.700398221
-    mean_value = 1.25353784685658e+21
-    mean_confirmations = 40566927.1218456
-    mean_nonce = 5386.11399239341
-    mean_gasPrice = 45862339962.2391
-    mean_cumulativeGasUsed = 8703764.19729006
-    
-    stdev_gasUsed = 1229467.56529239
-    stdev_value = 6.61993367968414e+22
-    stdev_confirmations = 8770610.74755724
-    stdev_nonce = 62980.3777420489
-    stdev_gasPrice = 338528269404.209 
-    stdev_cumulativeGasUsed = 6944482.88998016
-
-    if mean_gasUsed + (stdev_gasUsed) <= int(row['gasUsed']):
-        score += 0.4
-    if mean_value + (stdev_value )  <= int(row['value']):
-        score += 0.4
-    if mean_confirmations + (stdev_confirmations)  <= int(row['confirmations']):
-        score += 0.2
-    if mean_nonce + (stdev_nonce ) <= int(row['nonce']):
-        score += 0.1
-    if mean_gasPrice + (stdev_gasPrice ) <= int(row['gasPrice']):
-        score += 0.3
-    if mean_cumulativeGasUsed + (stdev_cumulativeGasUsed ) <= int(row['cumulativeGasUsed']):
-        score += 0.2
+    # A column adds its weight when it is at least one standard deviation above its mean
+    for column, mean, stdev, weight in rules:
+        if mean + (stdev) <= int(row[column]):
+            score += weight
 
     
     # Check fraud wallets only for method 'a'
@@ -180,16 +269,56 @@ def calculate_fraud_score(row, method):
 
     return min(score, 1)  # Cap the score at 1
 
+#5
+def calculate_fraud_scores(transactions_df, method, rules=FRAUD_SCORE_RULES):
+    """Vectorized calculate_fraud_score: score every row of the DataFrame in one pass."""
+    method = method.lower()
+    score = np.zeros(len(transactions_df))
+
+    # Weights are added in the same order as calculate_fraud_score so the float sums match exactly
+    for column, mean, stdev, weight in rules:
+        score += np.where(at_or_above(transactions_df[column], mean + (stdev)), weight, 0.0)
+
+    if method == 'a':
+        is_fraud = (transactions_df['is_from_fraud_wallet'].to_numpy() == 1) | (transactions_df['is_to_fraud_wallet'].to_numpy() == 1)
+        score += np.where(is_fraud, 1, 0)
+
+    return np.minimum(score, 1)  # Cap the score at 1
+
+def label_transactions(transactions_df, method, rules=FRAUD_SCORE_RULES):
+    """Vectorized label_transaction: return the green/orange/red flag for every row.
+
+    rules are FRAUD_SCORE_RULES or the current ones of a database from fraud_score_rules.
+    """
+    fraud_score = calculate_fraud_scores(transactions_df, method, rules)
+    return flags_from_scores(fraud_score)
+
+def flags_from_scores(fraud_score):
+    """Map an array of fraud scores to flags using the thresholds of label_transaction."""
+    return np.select([fraud_score < 0.5, fraud_score < 0.7], ['green', 'orange'], default='red')
+
+def at_or_above(column, threshold):
+    """Return a boolean array equal to `int(x) >= threshold` for every x in the column.
+
+    Values are compared as float64 and only the rows that land exactly on the threshold
+    after rounding are re-checked with Python ints, so wei-sized text values stay exact.
+    """
+    values = np.trunc(pd.to_numeric(column).to_numpy(dtype='float64'))
+    if np.isnan(values).any():
+        raise ValueError(f"Column '{column.name}' contains missing values and cannot be scored")
+
+    result = values >= threshold
+    ties = np.flatnonzero(values == threshold)
+    if len(ties):
+        raw = column.to_numpy()
+        result[ties] = [int(raw[i]) >= threshold for i in ties]
+    return result
+
     # Connect to SQLite database and retrieve fraudulent wallets
 def get_fraud_wallets(database_path):
-    conn = sqlite3.connect(database_path)
-    query = "SELECT address FROM fraud_wallets"  # Assuming the fraud wallets are stored in a column named 'wallet_address'
-    fraud_wallets_df = pd.read_sql_query(query, conn)
-    conn.close()
-
-    # Convert the fraud_wallets_df to a set for faster lookup
-    fraud_wallets = set(fraud_wallets_df['address'])
-    return fraud_wallets
+    # Served from the cached fraud_wallet_list, so the table is only re-read when it changes.
+    # The addresses come back normalized.
+    return fraud_wallet_list.get_fraud_wallet_list(database_path).as_set()
 
     # Normalize function to ensure consistent address formatting
 def normalize_address(address):
@@ -202,37 +331,25 @@ def normalize_address(address):
 def empty_and_recreate_transactions_db(db_name='Database/transactions2.db'):
     """
     Empties the transactions.db by dropping the transactions table and recreating it.
+    The per-wallet sync marks, the address graph and the wallet features are dropped too, so the next sync fetches full histories.
     """
     conn = sqlite3.connect(db_name)
     cursor = conn.cursor()
     
     # Drop the table if it exists
     cursor.execute("DROP TABLE IF EXISTS transactions")
+    cursor.execute("DROP TABLE IF EXISTS WalletSync")
+    cursor.execute("DROP TABLE IF EXISTS Edges")
+    cursor.execute("DROP TABLE IF EXISTS WalletFeatures")
+    cursor.execute("DROP TABLE IF EXISTS WalletValueHistogram")
     print("Transactions table dropped successfully.")
     
-    # Recreate the table with the appropriate structure
-    cursor.execute("""
-        CREATE TABLE transactions (
-            hash TEXT PRIMARY KEY,
-            nonce INTEGER,
-            blockHash TEXT,
-            blockNumber INTEGER,
-            transactionIndex INTEGER,
-            fromAddress TEXT,
-            toAddress TEXT,
-            value REAL,
-            gas INTEGER,
-            gasPrice INTEGER,
-            isError INTEGER,
-            txreceipt_status INTEGER,
-            input TEXT,
-            contractAddress TEXT,
-            cumulativeGasUsed INTEGER,
-            gasUsed INTEGER,
-            confirmations INTEGER,
-            timestamp TEXT
-        )
-    """)
+    # Recreate the table with the typed structure used by transaction_store
+    cursor.execute(transaction_store.TRANSACTIONS_SCHEMA)
+    cursor.execute(transaction_store.EDGES_SCHEMA)
+    cursor.execute(wallet_features.WALLET_FEATURES_SCHEMA)
+    cursor.execute(wallet_features.VALUE_HISTOGRAM_SCHEMA)
+    cursor.execute(f"PRAGMA user_version = {transaction_store.SCHEMA_VERSION}")
     print("Transactions table recreated successfully.")
     conn.commit()
 
@@ -0,0 +1,229 @@
+#transaction_store.py //Persistence layer for the Transactions table.
+#Keeps one long-lived SQLite connection and writes each page of API results with a set-based
+#duplicate check and a single executemany inside one transaction//
+
+import os
+import sqlite3
+
+import label_stats
+import migrate_schema
+import profiling
+import wallet_features
+
+# Journal mode and synchronous level for the connection, see https://www.sqlite.org/pragma.html
+journal_mode = os.getenv('TRANSACTIONS_DB_JOURNAL_MODE', 'WAL')
+synchronous = os.getenv('TRANSACTIONS_DB_SYNCHRONOUS', 'NORMAL')
+
+# SQLite allows 999 host parameters per statement in older builds
+max_query_parameters = 900
+
+# Version of the Transactions layout, stored in PRAGMA user_version; see migrate_schema.py
+SCHEMA_VERSION = 7
+
+# Numeric columns are stored as numbers so they load straight into NumPy arrays. `value` is a
+# float64 for features; the exact wei amount, which can exceed 64 bits, is kept in value_wei
+# as a 32-byte big-endian unsigned integer.
+TRANSACTIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS Transactions (
+    hash TEXT PRIMARY KEY,
+    nonce INTEGER,
+    blockHash TEXT,
+    blockNumber INTEGER,
+    transactionIndex INTEGER,
+    fromAddress TEXT,
+    toAddress TEXT,
+    value REAL,
+    value_wei BLOB,
+    gas INTEGER,
+    gasPrice INTEGER,
+    isError INTEGER,
+    txreceipt_status INTEGER,
+    input TEXT,
+    contractAddress TEXT,
+    cumulativeGasUsed INTEGER,
+    gasUsed INTEGER,
+    confirmations INTEGER,
+    timestamp INTEGER
+)
+"""
+
+# Per-wallet lookups (incremental syncs, scoring one wallet) filter on the address columns
+TRANSACTIONS_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_transactions_from ON Transactions (fromAddress);
+CREATE INDEX IF NOT EXISTS idx_transactions_to ON Transactions (toAddress);
+"""
+
+# Column of each field of a transaction_row tuple
+ROW_COLUMNS = ['hash', 'nonce', 'blockHash', 'blockNumber', 'transactionIndex', 'fromAddress', 'toAddress', 'value',
+               'value_wei', 'gas', 'gasPrice', 'isError', 'txreceipt_status', 'input', 'contractAddress',
+               'cumulativeGasUsed', 'gasUsed', 'confirmations', 'timestamp']
+
+INSERT_TRANSACTION = """
+INSERT OR IGNORE INTO Transactions (
+    hash, nonce, blockHash, blockNumber, transactionIndex, fromAddress, toAddress, value, value_wei, gas, gasPrice,
+    isError, txreceipt_status, input, contractAddress, cumulativeGasUsed, gasUsed, confirmations, timestamp
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Address-to-address edges aggregated from Transactions, kept up to date by TransactionStore.save.
+# Graph queries (neighbours, distance to fraud wallets) read this instead of scanning every
+# transaction; see graph_index.py. Addresses are lower-cased, value_sum is in wei.
+EDGES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS Edges (
+    fromAddress TEXT NOT NULL,
+    toAddress TEXT NOT NULL,
+    tx_count INTEGER NOT NULL,
+    value_sum REAL NOT NULL,
+    first_block INTEGER,
+    last_block INTEGER,
+    PRIMARY KEY (fromAddress, toAddress)
+) WITHOUT ROWID
+"""
+
+# The primary key serves outgoing edges, this index the incoming ones
+EDGES_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_edges_to ON Edges (toAddress, fromAddress);
+"""
+
+UPSERT_EDGE = """
+INSERT INTO Edges (fromAddress, toAddress, tx_count, value_sum, first_block, last_block) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (fromAddress, toAddress) DO UPDATE SET
+    tx_count = tx_count + excluded.tx_count,
+    value_sum = value_sum + excluded.value_sum,
+    first_block = MIN(first_block, excluded.first_block),
+    last_block = MAX(last_block, excluded.last_block)
+"""
+
+max_int64 = 2**63 - 1
+
+
+def wei_to_blob(wei):
+    """Encode a wei amount as the fixed-width value_wei blob."""
+    return int(wei).to_bytes(32, 'big')
+
+
+def blob_to_wei(blob):
+    """Decode a value_wei blob back to the exact wei amount."""
+    return int.from_bytes(blob, 'big')
+
+
+def to_integer(value):
+    """Parse an API number for an INTEGER column; values beyond 64 bits fall back to a float."""
+    number = int(value)
+    return number if number <= max_int64 else float(number)
+
+
+def transaction_row(tx):
+    """Convert one Polygonscan txlist entry to the parameter tuple of INSERT_TRANSACTION."""
+    wei = int(tx.get('value', 0))
+    return (
+        tx.get('hash'),
+        int(tx.get('nonce', 0)),
+        tx.get('blockHash'),
+        int(tx.get('blockNumber', 0)),
+        int(tx.get('transactionIndex', 0)),
+        tx.get('from'),
+        tx.get('to'),
+        float(wei),
+        wei_to_blob(wei),
+        to_integer(tx.get('gas', 0)),
+        to_integer(tx.get('gasPrice', 0)),
+        int(tx.get('isError', 0)),
+        int(tx.get('txreceipt_status', 0)),
+        tx.get('input'),
+        tx.get('contractAddress'),
+        to_integer(tx.get('cumulativeGasUsed', 0)),
+        to_integer(tx.get('gasUsed', 0)),
+        int(tx.get('confirmations', 0)),
+        int(tx.get('timeStamp', 0))
+    )
+
+
+def edge_rows(transactions):
+    """Aggregate a page of txlist entries into UPSERT_EDGE parameters, one per address pair."""
+    edges = {}
+    for tx in transactions:
+        from_address = (tx.get('from') or '').lower()
+        to_address = (tx.get('to') or '').lower()
+        if not from_address or not to_address:
+            continue  # contract creations have no counterparty
+        block = int(tx.get('blockNumber', 0))
+        value = float(int(tx.get('value', 0)))
+        edge = edges.get((from_address, to_address))
+        if edge is None:
+            edges[(from_address, to_address)] = [1, value, block, block]
+        else:
+            edge[0] += 1
+            edge[1] += value
+            edge[2] = min(edge[2], block)
+            edge[3] = max(edge[3], block)
+    return [(from_address, to_address, *edge) for (from_address, to_address), edge in edges.items()]
+
+
+class TransactionStore:
+    """One open connection to a transactions database."""
+
+    def __init__(self, database, journal_mode=journal_mode, synchronous=synchronous):
+        self.database = database
+        self.conn = sqlite3.connect(database)
+        self.conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self.conn.execute(f"PRAGMA synchronous={synchronous}")
+
+        # Databases written before the typed layout are converted in place on first use
+        if migrate_schema.schema_version(self.conn) < SCHEMA_VERSION:
+            migrate_schema.migrate_connection(self.conn)
+        self.conn.executescript(TRANSACTIONS_INDEXES)
+        self.conn.executescript(EDGES_INDEXES)
+        self.conn.commit()
+
+    def existing_hashes(self, hashes):
+        """Return the subset of `hashes` already stored, using one IN query per 900 hashes."""
+        hashes = list(hashes)
+        existing = set()
+        for i in range(0, len(hashes), max_query_parameters):
+            chunk = hashes[i:i + max_query_parameters]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = self.conn.execute(f"SELECT hash FROM Transactions WHERE hash IN ({placeholders})", chunk)
+            existing.update(row[0] for row in rows)
+        return existing
+
+    def filter_unique(self, transactions):
+        """Drop transactions that are already stored or repeated within the page."""
+        existing = self.existing_hashes({tx.get('hash') for tx in transactions})
+        unique_transactions = []
+        for tx in transactions:
+            tx_hash = tx.get('hash')
+            if tx_hash not in existing:
+                existing.add(tx_hash)
+                unique_transactions.append(tx)
+        return unique_transactions
+
+    def save(self, transactions):
+        """Insert a page of transactions in one transaction and return the ones that were new.
+
+        The Edges, WalletFeatures and LabelStats tables are updated in the same transaction, so
+        they always match Transactions.
+        """
+        with self.conn:
+            unique_transactions = self.filter_unique(transactions)
+            rows = [transaction_row(tx) for tx in unique_transactions]
+            self.conn.executemany(INSERT_TRANSACTION, rows)
+            label_stats.update(self.conn, rows)
+            # Wallet degrees count the edges that are new, so they go before the edge upsert
+            wallet_features.update(self.conn, unique_transactions)
+            self.conn.executemany(UPSERT_EDGE, edge_rows(unique_transactions))
+        profiling.count('transaction_store.rows_written', len(unique_transactions))
+        return unique_transactions
+
+    def close(self):
+        self.conn.close()
+
+
+_stores = {}
+
+
+def get_store(database):
+    """Return the shared TransactionStore for a database path, opening it on first use."""
+    if database not in _stores:
+        _stores[database] = TransactionStore(database)
+    return _stores[database]
@@ -0,0 +1,307 @@
+#wallet_features.py //Per-wallet aggregate features kept in the WalletFeatures table.
+#Each address has running counts, value sums, block/time span, counterparty fan-out and a
+#log-scale value histogram for approximate quantiles, one WalletValueHistogram row per bucket in use.
+#TransactionStore.save folds every new page into the rows of the addresses it touches with one
+#grouped upsert per table, so the table never needs a GROUP BY over Transactions, and joining
+#wallet features onto a batch only reads the rows of the addresses in that batch//
+
+import math
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import fraud_wallet_list
+import transaction_store
+
+WALLET_FEATURES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS WalletFeatures (
+    address TEXT PRIMARY KEY,
+    sent_count INTEGER NOT NULL,
+    received_count INTEGER NOT NULL,
+    value_sent REAL NOT NULL,
+    value_received REAL NOT NULL,
+    value_sq_sum REAL NOT NULL,
+    out_degree INTEGER NOT NULL,
+    in_degree INTEGER NOT NULL,
+    first_block INTEGER,
+    last_block INTEGER,
+    first_timestamp INTEGER,
+    last_timestamp INTEGER
+) WITHOUT ROWID
+"""
+
+# Transactions per value bucket of an address; tables from before schema version 7 kept these
+# as a zlib-compressed value_histogram column in WalletFeatures
+VALUE_HISTOGRAM_SCHEMA = """
+CREATE TABLE IF NOT EXISTS WalletValueHistogram (
+    address TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (address, bucket)
+) WITHOUT ROWID
+"""
+
+COLUMNS = ['address', 'sent_count', 'received_count', 'value_sent', 'value_received', 'value_sq_sum', 'out_degree',
+           'in_degree', 'first_block', 'last_block', 'first_timestamp', 'last_timestamp']
+
+# Pairs of the page being saved, checked against Edges in one query
+PAGE_PAIRS_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS WalletPagePairs (
+    fromAddress TEXT NOT NULL,
+    toAddress TEXT NOT NULL,
+    PRIMARY KEY (fromAddress, toAddress)
+) WITHOUT ROWID
+"""
+
+SELECT_NEW_PAIRS = """
+SELECT fromAddress, toAddress FROM temp.WalletPagePairs p
+WHERE NOT EXISTS (SELECT 1 FROM Edges e WHERE e.fromAddress = p.fromAddress AND e.toAddress = p.toAddress)
+"""
+
+# Adds a page's totals per address to the stored ones. SQLite's two-argument MIN/MAX return NULL
+# when either side is NULL (rows built before any block was seen), hence the COALESCE
+UPSERT_FEATURES = f"""
+INSERT INTO WalletFeatures ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})
+ON CONFLICT (address) DO UPDATE SET
+    sent_count = sent_count + excluded.sent_count,
+    received_count = received_count + excluded.received_count,
+    value_sent = value_sent + excluded.value_sent,
+    value_received = value_received + excluded.value_received,
+    value_sq_sum = value_sq_sum + excluded.value_sq_sum,
+    out_degree = out_degree + excluded.out_degree,
+    in_degree = in_degree + excluded.in_degree,
+    first_block = COALESCE(MIN(first_block, excluded.first_block), excluded.first_block),
+    last_block = COALESCE(MAX(last_block, excluded.last_block), excluded.last_block),
+    first_timestamp = COALESCE(MIN(first_timestamp, excluded.first_timestamp), excluded.first_timestamp),
+    last_timestamp = COALESCE(MAX(last_timestamp, excluded.last_timestamp), excluded.last_timestamp)
+"""
+
+UPSERT_HISTOGRAM = """
+INSERT INTO WalletValueHistogram (address, bucket, count) VALUES (?, ?, ?)
+ON CONFLICT (address, bucket) DO UPDATE SET count = count + excluded.count
+"""
+
+# Value histogram: bucket 0 holds zero-value transactions, bucket i >= 1 values in
+# [2^((i-1)/2), 2^(i/2)) wei, so quantiles are accurate to within a factor of sqrt(2)
+buckets_per_doubling = 2
+histogram_buckets = 1 + 128 * buckets_per_doubling
+
+# Features derived from a WalletFeatures row, see derive_features
+FEATURES = ['tx_count', 'value_mean', 'value_std', 'value_median', 'value_p90', 'out_degree', 'in_degree',
+            'active_days', 'tx_per_day']
+
+# Columns added to a transactions DataFrame by add_features, usable as classifier features
+TRANSACTION_FEATURES = [f'{side}_wallet_{name}' for side in ('from', 'to') for name in FEATURES]
+
+# Same limit as transaction_store.max_query_parameters (the modules import each other)
+max_query_parameters = 900
+
+
+def value_bucket(value):
+    if value < 1:
+        return 0
+    return min(histogram_buckets - 1, 1 + int(math.log2(value) * buckets_per_doubling))
+
+
+def decode_histogram(blob):
+    """A value_histogram blob of a table from before schema version 7."""
+    if blob is None:
+        return np.zeros(histogram_buckets, dtype=np.uint32)
+    return np.frombuffer(zlib.decompress(blob), dtype=np.uint32).copy()
+
+
+def histogram_quantile(histogram, q):
+    """Approximate quantile of the values counted in a histogram (the geometric middle of its bucket)."""
+    total = histogram.sum()
+    if total == 0:
+        return 0.0
+    bucket = int(np.searchsorted(np.cumsum(histogram), q * total))
+    if bucket == 0:
+        return 0.0
+    return 2 ** ((bucket - 0.5) / buckets_per_doubling)
+
+
+def _chunks(items):
+    items = list(items)
+    for i in range(0, len(items), max_query_parameters):
+        yield items[i:i + max_query_parameters]
+
+
+def ensure_tables(conn):
+    conn.execute(WALLET_FEATURES_SCHEMA)
+    conn.execute(VALUE_HISTOGRAM_SCHEMA)
+
+
+def _load_rows(conn, addresses):
+    rows = {}
+    for chunk in _chunks(addresses):
+        placeholders = ', '.join('?' * len(chunk))
+        for row in conn.execute(f"SELECT {', '.join(COLUMNS)} FROM WalletFeatures WHERE address IN ({placeholders})", chunk):
+            rows[row[0]] = list(row)
+    return rows
+
+
+def _load_histograms(conn, addresses):
+    histograms = {}
+    for chunk in _chunks(addresses):
+        placeholders = ', '.join('?' * len(chunk))
+        for address, bucket, count in conn.execute(
+                f"SELECT address, bucket, count FROM WalletValueHistogram WHERE address IN ({placeholders})", chunk):
+            histograms.setdefault(address, np.zeros(histogram_buckets, dtype=np.uint32))[bucket] = count
+    return histograms
+
+
+def _new_pairs(conn, pairs):
+    """The (fromAddress, toAddress) pairs not in Edges yet."""
+    conn.execute(PAGE_PAIRS_SCHEMA)
+    conn.execute("DELETE FROM temp.WalletPagePairs")
+    conn.executemany("INSERT INTO temp.WalletPagePairs (fromAddress, toAddress) VALUES (?, ?)", pairs)
+    return conn.execute(SELECT_NEW_PAIRS).fetchall()
+
+
+def update(conn, transactions, count_degrees=True):
+    """Fold txlist entries that were just inserted into the WalletFeatures rows of their addresses.
+
+    The page is totalled per address and per value bucket, then added to the stored rows with one
+    upsert statement per table, without reading them. Must run before the page's Edges are upserted:
+    a counterparty counts towards the degrees only when its edge is not in Edges yet. Runs inside
+    the caller's transaction. A self-transfer counts once as sent and once as received.
+    """
+    rows = {}
+    histograms = {}  # (address, bucket): transactions
+    pairs = set()
+    for tx in transactions:
+        from_address = (tx.get('from') or '').lower()
+        to_address = (tx.get('to') or '').lower()
+        value = float(int(tx.get('value', 0)))
+        block = int(tx.get('blockNumber', 0))
+        timestamp = int(tx.get('timeStamp', 0))
+        bucket = value_bucket(value)
+        for address, is_sender in ((from_address, True), (to_address, False)):
+            if not address:
+                continue
+            row = rows.get(address)
+            if row is None:
+                row = rows[address] = [address, 0, 0, 0.0, 0.0, 0.0, 0, 0, block, block, timestamp, timestamp]
+            if is_sender:
+                row[1] += 1
+                row[3] += value
+            else:
+                row[2] += 1
+                row[4] += value
+            row[5] += value * value
+            row[8] = min(row[8], block)
+            row[9] = max(row[9], block)
+            row[10] = min(row[10], timestamp)
+            row[11] = max(row[11], timestamp)
+            histograms[address, bucket] = histograms.get((address, bucket), 0) + 1
+        if from_address and to_address:
+            pairs.add((from_address, to_address))
+    if not rows:
+        return
+
+    if count_degrees and pairs:
+        for from_address, to_address in _new_pairs(conn, pairs):
+            rows[from_address][6] += 1
+            rows[to_address][7] += 1
+    # In key order, so the upserts walk each B-tree once
+    conn.executemany(UPSERT_FEATURES, sorted(rows.values()))
+    conn.executemany(UPSERT_HISTOGRAM, [(address, bucket, count) for (address, bucket), count in sorted(histograms.items())])
+
+
+def convert_histograms(conn, chunk_size=50000):
+    """Move the value_histogram blobs of a table from before schema version 7 into WalletValueHistogram."""
+    ensure_tables(conn)
+    if 'value_histogram' not in [row[1] for row in conn.execute("PRAGMA table_info(WalletFeatures)")]:
+        return
+    cursor = conn.execute("SELECT address, value_histogram FROM WalletFeatures WHERE value_histogram IS NOT NULL")
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        buckets = []
+        for address, blob in rows:
+            histogram = decode_histogram(blob)
+            buckets.extend((address, int(bucket), int(histogram[bucket])) for bucket in np.flatnonzero(histogram))
+        conn.executemany("INSERT OR REPLACE INTO WalletValueHistogram (address, bucket, count) VALUES (?, ?, ?)", buckets)
+    conn.execute("UPDATE WalletFeatures SET value_histogram = NULL")
+
+
+def build(conn, chunk_size=50000):
+    """(Re)build WalletFeatures from every stored transaction; degrees are then counted from Edges."""
+    ensure_tables(conn)
+    conn.execute("DELETE FROM WalletFeatures")
+    conn.execute("DELETE FROM WalletValueHistogram")
+    cursor = conn.execute("SELECT fromAddress, toAddress, value_wei, blockNumber, timestamp FROM Transactions")
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        update(conn, [{'from': from_address, 'to': to_address,
+                       'value': transaction_store.blob_to_wei(value_wei) if value_wei is not None else 0,
+                       'blockNumber': block or 0, 'timeStamp': timestamp or 0}
+                      for from_address, to_address, value_wei, block, timestamp in rows], count_degrees=False)
+    # A migration builds Edges without its indexes; the in_degree lookups need the one on toAddress
+    conn.execute(transaction_store.EDGES_INDEXES.strip())
+    conn.execute("""
+        UPDATE WalletFeatures SET
+            out_degree = (SELECT COUNT(*) FROM Edges WHERE fromAddress = WalletFeatures.address),
+            in_degree = (SELECT COUNT(*) FROM Edges WHERE toAddress = WalletFeatures.address)
+    """)
+
+
+def derive_features(rows, histograms):
+    """Turn WalletFeatures rows (a DataFrame with COLUMNS) into FEATURES, indexed by address.
+
+    histograms maps addresses to their value histograms, see _load_histograms.
+    """
+    tx_count = (rows['sent_count'] + rows['received_count']).to_numpy(dtype=np.float64)
+    empty = np.zeros(histogram_buckets, dtype=np.uint32)
+    histograms = [histograms.get(address, empty) for address in rows['address']]
+    divisor = np.maximum(tx_count, 1.0)
+    mean = (rows['value_sent'] + rows['value_received']).to_numpy() / divisor
+    variance = rows['value_sq_sum'].to_numpy() / divisor - mean ** 2
+    active_days = (rows['last_timestamp'] - rows['first_timestamp']).fillna(0).to_numpy(dtype=np.float64) / 86400
+    return pd.DataFrame({
+        'tx_count': tx_count,
+        'value_mean': mean,
+        'value_std': np.sqrt(np.maximum(variance, 0.0)),
+        'value_median': [histogram_quantile(histogram, 0.5) for histogram in histograms],
+        'value_p90': [histogram_quantile(histogram, 0.9) for histogram in histograms],
+        'out_degree': rows['out_degree'].to_numpy(dtype=np.float64),
+        'in_degree': rows['in_degree'].to_numpy(dtype=np.float64),
+        'active_days': active_days,
+        'tx_per_day': tx_count / np.maximum(active_days, 1.0),
+    }, index=pd.Index(rows['address'], dtype=object, name='address'))
+
+
+def load_features(database, addresses):
+    """FEATURES of the given addresses; addresses without a row are left out."""
+    conn = transaction_store.get_store(database).conn
+    addresses = {address for address in addresses if isinstance(address, str)}
+    rows = _load_rows(conn, addresses)
+    return derive_features(pd.DataFrame(list(rows.values()), columns=COLUMNS), _load_histograms(conn, rows))
+
+
+def add_features(transactions_df, database):
+    """Add TRANSACTION_FEATURES for the sender and receiver of every row (0 for unknown addresses).
+
+    Only the rows of the batch's own addresses are read, whatever the size of the history.
+    """
+    senders = fraud_wallet_list.normalize_addresses(transactions_df['fromAddress'])
+    receivers = fraud_wallet_list.normalize_addresses(transactions_df['toAddress'])
+    features = load_features(database, set(senders.dropna()) | set(receivers.dropna()))
+    for side, addresses in [('from', senders), ('to', receivers)]:
+        positions = features.index.get_indexer(addresses)
+        found = positions >= 0
+        for name in FEATURES:
+            column = np.zeros(len(transactions_df))
+            column[found] = features[name].to_numpy()[positions[found]]
+            transactions_df[f'{side}_wallet_{name}'] = column
+    return transactions_df
+
+
+def uses_wallet_features(feature_columns):
+    """True when a model was trained with the TRANSACTION_FEATURES columns."""
+    return set(TRANSACTION_FEATURES) <= set(feature_columns)
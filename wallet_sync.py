@@ -0,0 +1,66 @@
+#wallet_sync.py //Per-wallet high-water marks for incremental syncs.
+#The WalletSync table lives in the same database as the transactions it describes, so dropping
+#or replacing that database also resets the marks. A mark stays response_cache.finality_depth
+#blocks behind the head a sync reached, so transactions indexed late or reorged near the head are
+#fetched again by the next sync; saving skips the ones already stored//
+
+import time
+
+import numpy as np
+
+import label_stats
+import response_cache
+import transaction_store
+
+WALLET_SYNC_SCHEMA = """
+CREATE TABLE IF NOT EXISTS WalletSync (
+    address TEXT PRIMARY KEY,
+    last_synced_block INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+)
+"""
+
+
+def _connection(database):
+    conn = transaction_store.get_store(database).conn
+    conn.execute(WALLET_SYNC_SCHEMA)
+    return conn
+
+
+def synced_block(head_block):
+    """The mark to store after a complete sync up to head_block: the last block treated as final."""
+    return max(0, head_block - response_cache.finality_depth)
+
+
+def get_last_synced_block(database, wallet_address):
+    """Return the last block up to which the wallet's transactions are stored, or None."""
+    row = _connection(database).execute("SELECT last_synced_block FROM WalletSync WHERE address = ?",
+                                        (wallet_address.lower(),)).fetchone()
+    return row[0] if row else None
+
+
+def set_last_synced_block(database, wallet_address, block_number):
+    conn = _connection(database)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO WalletSync (address, last_synced_block, updated_at) VALUES (?, ?, ?)",
+                     (wallet_address.lower(), block_number, int(time.time())))
+
+
+def refresh_confirmations(database, wallet_address, head_block):
+    """Recompute `confirmations` of the wallet's stored rows against the block the wallet was synced to.
+
+    Rows saved by earlier syncs would otherwise keep the confirmation count of the day they were fetched.
+    The labelling stats swap the rows' old confirmations for the new ones in the same transaction.
+    """
+    conn = _connection(database)
+    wallet_address = wallet_address.lower()
+    with conn:
+        rows = np.array(conn.execute("""
+            SELECT confirmations, blockNumber FROM Transactions
+            WHERE (fromAddress = ? OR toAddress = ?) AND blockNumber <= ?
+        """, (wallet_address, wallet_address, head_block)).fetchall(), dtype=np.float64).reshape(-1, 2)
+        label_stats.replace(conn, 'confirmations', rows[:, 0], head_block - rows[:, 1])
+        conn.execute("""
+            UPDATE Transactions SET confirmations = ? - blockNumber
+            WHERE (fromAddress = ? OR toAddress = ?) AND blockNumber <= ?
+        """, (head_block, wallet_address, wallet_address, head_block))